@@ -1,5 +1,7 @@
 from flask import Flask
 import config
+from balances import init_balance_commands
+from rollups import init_rollup_commands
 from database import init_db, close_db, insert_sample_data
 from routes import init_routes
 
@@ -17,6 +19,10 @@ app.teardown_appcontext(close_db)
 # Инициализация маршрутов
 init_routes(app)
 
+# Команды обслуживания таблицы остатков и дневных агрегатов выдач
+init_balance_commands(app)
+init_rollup_commands(app)
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
 
@@ -1,6 +1,8 @@
 from flask import Flask
 import config
-from database_updated import init_db, close_db, insert_sample_data, create_indexes_for_performance
+from balances import init_balance_commands
+from rollups import init_rollup_commands
+from database_updated import init_db, close_db, insert_sample_data, create_indexes_for_performance, get_storage_report
 from routes_updated import init_routes
 
 app = Flask(__name__)
@@ -11,14 +13,22 @@ app.config.from_object(config)
 # или до использования url_for в шаблонах.
 init_routes(app)
 
+# Возврат соединения с БД в пул после каждого запроса
+app.teardown_appcontext(close_db)
+
 # Инициализация базы данных при запуске
 with app.app_context():
     init_db()
     insert_sample_data()
     create_indexes_for_performance()  # Создание дополнительных индексов для производительности
+    
+    # Отчёт о действующих настройках хранения SQLite
+    storage_settings = ", ".join(f"{name}={value}" for name, value in get_storage_report().items())
+    app.logger.info("Профиль хранения SQLite: %s", storage_settings)
 
-# Закрытие соединения с БД после каждого запроса
-app.teardown_appcontext(close_db)
+# Команды обслуживания таблицы остатков и дневных агрегатов выдач
+init_balance_commands(app)
+init_rollup_commands(app)
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,206 @@
+"""
+Модуль индекса автозаполнения для поиска пациентов и препаратов.
+"""
+
+import bisect
+import re
+import threading
+import time
+from flask import current_app
+from database import fetch_all
+from database_updated import normalize_search_key
+
+def tokenize(value):
+    """Разбиение строки на нормализованные слова."""
+    return re.findall(r'\w+', normalize_search_key(value) or '')
+
+class AutocompleteIndex:
+    """
+    Префиксный индекс слов в памяти процесса.
+
+    Индекс хранит отсортированный список пар (слово, id) и находит записи,
+    у которых каждое слово запроса является началом какого-либо слова в
+    индексируемых полях. Поиск останавливается, как только найдено limit записей.
+
+    Модели сообщают индексу о своих изменениях (note_insert, note_update,
+    note_delete), и он догружает только изменённые записи. Изменения, сделанные
+    другими процессами, подхватываются полной перестройкой раз в
+    AUTOCOMPLETE_REFRESH_INTERVAL секунд.
+    """
+
+    def __init__(self, table, primary_key, search_fields, payload_fields):
+        """
+        Args:
+            table (str): Таблица с данными
+            primary_key (str): Первичный ключ таблицы
+            search_fields (tuple): Поля, по словам которых идёт поиск
+            payload_fields (tuple): Поля, возвращаемые в результатах
+        """
+        self.table = table
+        self.primary_key = primary_key
+        self.search_fields = tuple(search_fields)
+        self.payload_fields = tuple(payload_fields)
+
+        self._lock = threading.RLock()
+        self._entries = {}
+        self._tokens = []
+        self._max_id = 0
+        self._loaded_at = None
+        self._pending_ids = set()
+        self._check_new = False
+
+    def _select(self, where='', params=None):
+        """Загрузка строк таблицы, необходимых индексу."""
+        fields = ', '.join(dict.fromkeys((self.primary_key,) + self.search_fields + self.payload_fields))
+        query = f"SELECT {fields} FROM {self.table} {where}"
+        return fetch_all(query, params)
+
+    def _entry(self, row):
+        """Формирование записи индекса: (id, данные для ответа, слова)."""
+        tokens = set()
+        for field in self.search_fields:
+            tokens.update(tokenize(row[field]))
+        payload = {field: row[field] for field in self.payload_fields}
+        return row[self.primary_key], payload, tokens
+
+    def _add(self, row):
+        """Добавление записи в индекс."""
+        record_id, payload, tokens = self._entry(row)
+        self._entries[record_id] = (payload, tokens)
+        for token in tokens:
+            bisect.insort(self._tokens, (token, record_id))
+        self._max_id = max(self._max_id, record_id)
+
+    def _remove(self, record_id):
+        """Удаление записи из индекса."""
+        entry = self._entries.pop(record_id, None)
+        if entry is None:
+            return
+        for token in entry[1]:
+            position = bisect.bisect_left(self._tokens, (token, record_id))
+            if position < len(self._tokens) and self._tokens[position] == (token, record_id):
+                del self._tokens[position]
+
+    def rebuild(self):
+        """Полная перестройка индекса из базы данных."""
+        with self._lock:
+            # Изменения, отмеченные после этой точки, будут применены следующим _sync
+            self._pending_ids.clear()
+            self._check_new = False
+
+        entries = {}
+        token_pairs = []
+        for row in self._select():
+            record_id, payload, tokens = self._entry(row)
+            entries[record_id] = (payload, tokens)
+            token_pairs.extend((token, record_id) for token in tokens)
+        token_pairs.sort()
+
+        with self._lock:
+            self._entries = entries
+            self._tokens = token_pairs
+            self._max_id = max(entries, default=0)
+            self._loaded_at = time.monotonic()
+
+    def _sync(self):
+        """Применение накопленных изменений перед поиском."""
+        refresh_interval = current_app.config.get('AUTOCOMPLETE_REFRESH_INTERVAL', 300)
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > refresh_interval:
+            self.rebuild()
+            return
+
+        with self._lock:
+            pending_ids = list(self._pending_ids)
+            check_new = self._check_new
+            max_id = self._max_id
+            self._pending_ids.clear()
+            self._check_new = False
+
+        if pending_ids:
+            placeholders = ', '.join('?' for _ in pending_ids)
+            rows = self._select(f"WHERE {self.primary_key} IN ({placeholders})", pending_ids)
+            with self._lock:
+                for record_id in pending_ids:
+                    self._remove(record_id)
+                for row in rows:
+                    self._add(row)
+
+        if check_new:
+            rows = self._select(f"WHERE {self.primary_key} > ?", (max_id,))
+            with self._lock:
+                for row in rows:
+                    self._remove(row[self.primary_key])
+                    self._add(row)
+
+    def note_insert(self):
+        """Отметка о добавлении новых записей."""
+        with self._lock:
+            self._check_new = True
+
+    def note_update(self, record_id):
+        """Отметка об изменении записи."""
+        with self._lock:
+            self._pending_ids.add(record_id)
+
+    def note_delete(self, record_id):
+        """Удаление записи из индекса."""
+        with self._lock:
+            self._pending_ids.discard(record_id)
+            self._remove(record_id)
+
+    def search(self, query, limit=10):
+        """
+        Поиск записей по началу слов.
+
+        Args:
+            query (str): Поисковый запрос
+            limit (int): Максимальное количество результатов
+
+        Returns:
+            list: Список словарей с полями payload_fields
+        """
+        words = tokenize(query)
+        if not words:
+            return []
+
+        self._sync()
+
+        # Поиск ведётся по самому длинному слову запроса как по наиболее избирательному
+        lead = max(words, key=len)
+        others = [word for word in words if word != lead]
+
+        results = []
+        seen = set()
+        with self._lock:
+            position = bisect.bisect_left(self._tokens, (lead,))
+            while position < len(self._tokens) and len(results) < limit:
+                token, record_id = self._tokens[position]
+                position += 1
+                if not token.startswith(lead):
+                    break
+                if record_id in seen:
+                    continue
+                seen.add(record_id)
+
+                payload, tokens = self._entries[record_id]
+                if all(any(t.startswith(word) for t in tokens) for word in others):
+                    results.append(dict(payload))
+        return results
+
+    def stats(self):
+        """Размер индекса."""
+        with self._lock:
+            return {'records': len(self._entries), 'tokens': len(self._tokens)}
+
+# Индексы автозаполнения процесса
+patient_index = AutocompleteIndex(
+    'patients', 'patient_id',
+    search_fields=('fio', 'diagnosis'),
+    payload_fields=('patient_id', 'fio', 'diagnosis')
+)
+
+medicine_index = AutocompleteIndex(
+    'medicines', 'medicine_id',
+    search_fields=('trade_name_vk', 'standardized_mnn'),
+    payload_fields=('medicine_id', 'trade_name_vk', 'standardized_mnn', 'price', 'standardized_dosage', 'packaging')
+)
@@ -0,0 +1,183 @@
+"""
+Модуль материализованных остатков по парам (пациент, препарат).
+"""
+
+import sqlite3
+import click
+from flask import current_app
+
+# Источники остатков: таблица -> (колонка суммы в medicine_balances, колонка даты источника, колонка последней даты)
+BALANCE_SOURCES = {
+    'prescriptions': ('prescribed_total', 'prescription_date', 'last_prescription_date'),
+    'dispensings': ('dispensed_total', 'dispensing_date', 'last_dispensing_date'),
+}
+
+def create_balance_table(db):
+    """
+    Создание таблицы остатков и триггеров её синхронизации.
+
+    Вставка назначения или выдачи увеличивает остаток пары. Удаление и
+    изменение пересчитывают затронутые пары по исходным строкам, чтобы в
+    суммах не накапливалась погрешность. Пара без назначений и выдач удаляется.
+    Вновь созданная таблица заполняется из существующих данных.
+
+    Args:
+        db: Соединение с базой данных
+    """
+    exists = db.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'medicine_balances'"
+    ).fetchone() is not None
+
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS medicine_balances (
+            patient_id INTEGER NOT NULL,
+            medicine_id INTEGER NOT NULL,
+            prescribed_total REAL NOT NULL DEFAULT 0,
+            dispensed_total REAL NOT NULL DEFAULT 0,
+            last_prescription_date DATE,
+            last_dispensing_date DATE,
+            PRIMARY KEY (patient_id, medicine_id)
+        ) WITHOUT ROWID
+    ''')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_medicine_balances_medicine ON medicine_balances (medicine_id)')
+
+    for table, (total, date, last_date) in BALANCE_SOURCES.items():
+        db.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_balance_ai AFTER INSERT ON {table} BEGIN
+                INSERT INTO medicine_balances (patient_id, medicine_id, {total}, {last_date})
+                VALUES (new.patient_id, new.medicine_id, new.quantity_packs, new.{date})
+                ON CONFLICT (patient_id, medicine_id) DO UPDATE SET
+                    {total} = {total} + excluded.{total},
+                    {last_date} = MAX(COALESCE({last_date}, excluded.{last_date}), excluded.{last_date});
+            END
+        """)
+        db.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_balance_ad AFTER DELETE ON {table} BEGIN
+                {_refresh_pair_sql(table, 'old')}
+            END
+        """)
+        db.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_balance_au
+            AFTER UPDATE OF patient_id, medicine_id, quantity_packs, {date} ON {table} BEGIN
+                {_refresh_pair_sql(table, 'old')}
+                {_refresh_pair_sql(table, 'new')}
+            END
+        """)
+
+    if not exists:
+        rebuild_balances(db)
+
+def _refresh_pair_sql(table, row):
+    """Операторы пересчёта остатка пары строки row ('old' или 'new') по таблице table."""
+    total, date, last_date = BALANCE_SOURCES[table]
+    return f"""
+        INSERT INTO medicine_balances (patient_id, medicine_id, {total}, {last_date})
+        SELECT {row}.patient_id, {row}.medicine_id, COALESCE(SUM(quantity_packs), 0), MAX({date})
+        FROM {table} WHERE patient_id = {row}.patient_id AND medicine_id = {row}.medicine_id
+        ON CONFLICT (patient_id, medicine_id) DO UPDATE SET
+            {total} = excluded.{total},
+            {last_date} = excluded.{last_date};
+        DELETE FROM medicine_balances
+        WHERE patient_id = {row}.patient_id AND medicine_id = {row}.medicine_id
+          AND last_prescription_date IS NULL AND last_dispensing_date IS NULL;
+    """
+
+# Остатки, рассчитанные заново по назначениям и выдачам
+_BALANCES_FROM_SOURCES = """
+    SELECT
+        patient_id,
+        medicine_id,
+        SUM(prescribed) as prescribed_total,
+        SUM(dispensed) as dispensed_total,
+        MAX(prescription_date) as last_prescription_date,
+        MAX(dispensing_date) as last_dispensing_date
+    FROM (
+        SELECT patient_id, medicine_id, quantity_packs as prescribed, 0 as dispensed,
+               prescription_date, NULL as dispensing_date
+        FROM prescriptions
+        UNION ALL
+        SELECT patient_id, medicine_id, 0 as prescribed, quantity_packs as dispensed,
+               NULL as prescription_date, dispensing_date
+        FROM dispensings
+    )
+    GROUP BY patient_id, medicine_id
+"""
+
+def rebuild_balances(db):
+    """
+    Полная перестройка таблицы остатков по назначениям и выдачам.
+
+    Args:
+        db: Соединение с базой данных
+
+    Returns:
+        int: Количество пар в таблице после перестройки
+    """
+    db.execute("DELETE FROM medicine_balances")
+    db.execute(f"""
+        INSERT INTO medicine_balances (patient_id, medicine_id, prescribed_total, dispensed_total,
+                                       last_prescription_date, last_dispensing_date)
+        {_BALANCES_FROM_SOURCES}
+    """)
+    return db.execute("SELECT COUNT(*) FROM medicine_balances").fetchone()[0]
+
+def verify_balances(db, tolerance=1e-6):
+    """
+    Сверка таблицы остатков с назначениями и выдачами.
+
+    Args:
+        db: Соединение с базой данных
+        tolerance (float): Допустимое расхождение сумм
+
+    Returns:
+        list: Пары с расхождениями в виде словарей с ожидаемыми и сохранёнными значениями
+    """
+    pair_key = lambda row: (row['patient_id'], row['medicine_id'])
+    expected = {pair_key(row): row for row in db.execute(_BALANCES_FROM_SOURCES)}
+    stored = {pair_key(row): row for row in db.execute("SELECT * FROM medicine_balances")}
+
+    mismatches = []
+    for pair in sorted(expected.keys() | stored.keys()):
+        exp, got = expected.get(pair), stored.get(pair)
+        if exp is not None and got is not None and all(
+            abs(exp[column] - got[column]) <= tolerance for column in ('prescribed_total', 'dispensed_total')
+        ) and all(
+            exp[column] == got[column] for column in ('last_prescription_date', 'last_dispensing_date')
+        ):
+            continue
+        mismatches.append({
+            'patient_id': pair[0],
+            'medicine_id': pair[1],
+            'expected': dict(exp) if exp is not None else None,
+            'stored': dict(got) if got is not None else None,
+        })
+    return mismatches
+
+def init_balance_commands(app):
+    """
+    Регистрация команды обслуживания остатков:
+
+        flask --app app_updated balances verify
+        flask --app app_updated balances rebuild
+    """
+    @app.cli.command("balances")
+    @click.argument("action", type=click.Choice(["verify", "rebuild"]))
+    def balances_command(action):
+        """Сверка (verify) или перестройка (rebuild) таблицы остатков."""
+        db = sqlite3.connect(current_app.config['DATABASE_PATH'])
+        db.row_factory = sqlite3.Row
+        try:
+            if action == "rebuild":
+                with db:
+                    count = rebuild_balances(db)
+                click.echo(f"Таблица остатков перестроена: {count} пар")
+                return
+
+            mismatches = verify_balances(db)
+            for mismatch in mismatches[:20]:
+                click.echo(f"Расхождение: {mismatch}")
+            if mismatches:
+                raise click.ClickException(f"Найдено расхождений: {len(mismatches)}")
+            click.echo("Расхождений не найдено")
+        finally:
+            db.close()
@@ -1,12 +1,79 @@
-from database import fetch_all, fetch_one
-from models import Patient, Medicine, Prescription, Dispensing
-import csv
-import io
+from database import fetch_all, fetch_one, fetch_iter
+from database_updated import transaction, run_sections
+from models_updated import Patient, Medicine, Prescription, Dispensing
+from cache import patient_summary_cache, cached_report
+from flask import current_app
+from csv_export import iter_csv
 from datetime import datetime
+import math
 
 class BusinessLogic:
     """Класс для реализации бизнес-логики и расчётной логики системы."""
     
+    # Максимальное количество пар (пациент, препарат) в одном запросе
+    REMAINING_NEED_BATCH_SIZE = 500
+    
+    @staticmethod
+    def calculate_remaining_needs(pairs=None, patient_id=None, medicine_id=None):
+        """
+        Пакетный расчёт остаточной потребности по парам (пациент, препарат).
+        
+        Суммы назначенного и выданного читаются из таблицы остатков
+        medicine_balances, которую триггеры поддерживают при каждой записи.
+        
+        Args:
+            pairs (iterable): Пары (patient_id, medicine_id); None - все пары
+            patient_id (int): Ограничение по пациенту
+            medicine_id (int): Ограничение по препарату
+            
+        Returns:
+            dict: {(patient_id, medicine_id): {'prescribed', 'dispensed', 'remaining_need'}}.
+                  Пары без назначений и выдач в результат не попадают.
+        """
+        conditions = []
+        params = []
+        if patient_id is not None:
+            conditions.append("patient_id = ?")
+            params.append(patient_id)
+        if medicine_id is not None:
+            conditions.append("medicine_id = ?")
+            params.append(medicine_id)
+        
+        if pairs is None:
+            batches = [None]
+        else:
+            pairs = list(dict.fromkeys((int(p), int(m)) for p, m in pairs))
+            if not pairs:
+                return {}
+            size = BusinessLogic.REMAINING_NEED_BATCH_SIZE
+            batches = [pairs[i:i + size] for i in range(0, len(pairs), size)]
+        
+        needs = {}
+        for batch in batches:
+            batch_conditions = list(conditions)
+            batch_params = list(params)
+            if batch is not None:
+                batch_conditions.append(
+                    "(patient_id, medicine_id) IN (VALUES " + ", ".join("(?, ?)" for _ in batch) + ")"
+                )
+                for pair in batch:
+                    batch_params.extend(pair)
+            where = " WHERE " + " AND ".join(batch_conditions) if batch_conditions else ""
+            
+            query = f"""
+                SELECT patient_id, medicine_id, prescribed_total, dispensed_total
+                FROM medicine_balances{where}
+            """
+            for row in fetch_all(query, batch_params):
+                needs[(row['patient_id'], row['medicine_id'])] = {
+                    'prescribed': row['prescribed_total'],
+                    'dispensed': row['dispensed_total'],
+                    # Остаточная потребность не может быть отрицательной
+                    'remaining_need': max(0, row['prescribed_total'] - row['dispensed_total'])
+                }
+        
+        return needs
+    
     @staticmethod
     def calculate_remaining_need(patient_id, medicine_id):
         """
@@ -19,100 +86,157 @@ class BusinessLogic:
         Returns:
             float: Остаточная потребность в упаковках
         """
-        # Получение общего количества назначенных упаковок
-        prescribed_query = """
-            SELECT COALESCE(SUM(quantity_packs), 0) as total_prescribed
-            FROM prescriptions 
-            WHERE patient_id = ? AND medicine_id = ?
-        """
-        prescribed_result = fetch_one(prescribed_query, (patient_id, medicine_id))
-        total_prescribed = prescribed_result['total_prescribed'] if prescribed_result else 0
-        
-        # Получение общего количества выданных упаковок
-        dispensed_query = """
-            SELECT COALESCE(SUM(quantity_packs), 0) as total_dispensed
-            FROM dispensings 
+        query = """
+            SELECT MAX(prescribed_total - dispensed_total, 0) as remaining_need
+            FROM medicine_balances
             WHERE patient_id = ? AND medicine_id = ?
         """
-        dispensed_result = fetch_one(dispensed_query, (patient_id, medicine_id))
-        total_dispensed = dispensed_result['total_dispensed'] if dispensed_result else 0
-        
-        # Расчёт остаточной потребности
-        remaining_need = total_prescribed - total_dispensed
-        return max(0, remaining_need)  # Не может быть отрицательной
+        result = fetch_one(query, (patient_id, medicine_id))
+        return result['remaining_need'] if result else 0
     
     @staticmethod
-    def get_patient_medicine_summary(patient_id):
+    def get_patient_medicine_summary(patient_id, use_cache=True):
         """
         Получение сводной информации по всем препаратам для конкретного пациента.
         
+        Сводка строится одним запросом: оконные функции по назначениям и выдачам
+        пациента дают суммы и последнюю запись по каждому препарату. Результат
+        кэшируется на PATIENT_SUMMARY_CACHE_TTL секунд; запись назначений и
+        выдач через модели сбрасывает кэш пациента.
+        
         Args:
             patient_id (int): ID пациента
+            use_cache (bool): Использовать кэш сводок
             
         Returns:
             list: Список словарей с информацией по каждому препарату
         """
+        ttl = current_app.config.get('PATIENT_SUMMARY_CACHE_TTL', 60)
+        use_cache = use_cache and ttl > 0
+        if use_cache:
+            summary = patient_summary_cache.get(patient_id, ttl)
+            if summary is not None:
+                return [dict(item) for item in summary]
+        
         query = """
-            SELECT DISTINCT 
+            WITH patient_prescriptions AS (
+                SELECT 
+                    medicine_id,
+                    prescription_date,
+                    quantity_packs,
+                    SUM(quantity_packs) OVER (PARTITION BY medicine_id) as total_prescribed,
+                    ROW_NUMBER() OVER (
+                        PARTITION BY medicine_id ORDER BY prescription_date DESC, prescription_id DESC
+                    ) as position
+                FROM prescriptions
+                WHERE patient_id = ?
+            ),
+            patient_dispensings AS (
+                SELECT 
+                    medicine_id,
+                    dispensing_date,
+                    quantity_packs,
+                    SUM(quantity_packs) OVER (PARTITION BY medicine_id) as total_dispensed,
+                    ROW_NUMBER() OVER (
+                        PARTITION BY medicine_id ORDER BY dispensing_date DESC, dispensing_id DESC
+                    ) as position
+                FROM dispensings
+                WHERE patient_id = ?
+            )
+            SELECT 
                 m.medicine_id,
                 m.standardized_mnn,
                 m.trade_name_vk,
                 m.standardized_dosage_form,
                 m.standardized_dosage,
-                m.price
-            FROM prescriptions p
+                m.price,
+                MAX(p.total_prescribed - COALESCE(d.total_dispensed, 0), 0) as remaining_need,
+                p.prescription_date as last_prescription_date,
+                p.quantity_packs as last_prescription_quantity,
+                d.dispensing_date as last_dispensing_date,
+                COALESCE(d.quantity_packs, 0) as last_dispensing_quantity
+            FROM patient_prescriptions p
             JOIN medicines m ON p.medicine_id = m.medicine_id
-            WHERE p.patient_id = ?
+            LEFT JOIN patient_dispensings d ON d.medicine_id = p.medicine_id AND d.position = 1
+            WHERE p.position = 1
             ORDER BY m.standardized_mnn
         """
         
-        medicines = fetch_all(query, (patient_id,))
-        summary = []
-        
-        for medicine in medicines:
-            medicine_id = medicine['medicine_id']
-            
-            # Расчёт остаточной потребности
-            remaining_need = BusinessLogic.calculate_remaining_need(patient_id, medicine_id)
-            
-            # Получение последнего назначения
-            last_prescription_query = """
-                SELECT prescription_date, quantity_packs
-                FROM prescriptions
-                WHERE patient_id = ? AND medicine_id = ?
-                ORDER BY prescription_date DESC
-                LIMIT 1
-            """
-            last_prescription = fetch_one(last_prescription_query, (patient_id, medicine_id))
-            
-            # Получение последней выдачи
-            last_dispensing_query = """
-                SELECT dispensing_date, quantity_packs
-                FROM dispensings
-                WHERE patient_id = ? AND medicine_id = ?
-                ORDER BY dispensing_date DESC
-                LIMIT 1
-            """
-            last_dispensing = fetch_one(last_dispensing_query, (patient_id, medicine_id))
-            
-            summary.append({
-                'medicine_id': medicine_id,
-                'medicine_name': medicine['standardized_mnn'],
-                'trade_name': medicine['trade_name_vk'],
-                'dosage_form': medicine['standardized_dosage_form'],
-                'dosage': medicine['standardized_dosage'],
-                'price': medicine['price'],
-                'remaining_need': remaining_need,
-                'remaining_cost': remaining_need * medicine['price'],
-                'last_prescription_date': last_prescription['prescription_date'] if last_prescription else None,
-                'last_prescription_quantity': last_prescription['quantity_packs'] if last_prescription else 0,
-                'last_dispensing_date': last_dispensing['dispensing_date'] if last_dispensing else None,
-                'last_dispensing_quantity': last_dispensing['quantity_packs'] if last_dispensing else 0
-            })
-        
+        summary = [{
+            'medicine_id': row['medicine_id'],
+            'medicine_name': row['standardized_mnn'],
+            'trade_name': row['trade_name_vk'],
+            'dosage_form': row['standardized_dosage_form'],
+            'dosage': row['standardized_dosage'],
+            'price': row['price'],
+            'remaining_need': row['remaining_need'],
+            'remaining_cost': row['remaining_need'] * row['price'],
+            'last_prescription_date': row['last_prescription_date'],
+            'last_prescription_quantity': row['last_prescription_quantity'],
+            'last_dispensing_date': row['last_dispensing_date'],
+            'last_dispensing_quantity': row['last_dispensing_quantity']
+        } for row in fetch_all(query, (patient_id, patient_id))]
+        
+        if use_cache:
+            patient_summary_cache.set(patient_id, [dict(item) for item in summary])
         return summary
     
+    # Препараты с остаточной потребностью по данным таблицы остатков,
+    # по убыванию стоимости потребности
+    MEDICINE_REPORT_QUERY = """
+        SELECT 
+            m.medicine_id,
+            m.smmn_node_code,
+            m.section,
+            m.standardized_mnn,
+            m.trade_name_vk,
+            m.standardized_dosage_form,
+            m.standardized_dosage,
+            m.characteristic,
+            m.packaging,
+            m.price,
+            n.patients_count,
+            n.total_need,
+            n.total_need * m.price as total_cost
+        FROM (
+            SELECT 
+                medicine_id,
+                COUNT(*) as patients_count,
+                SUM(prescribed_total - dispensed_total) as total_need
+            FROM medicine_balances
+            WHERE prescribed_total > dispensed_total
+            GROUP BY medicine_id
+        ) n
+        JOIN medicines m ON m.medicine_id = n.medicine_id
+        ORDER BY total_cost DESC, m.medicine_id
+    """
+    
+    # Заголовки CSV отчёта по препаратам
+    MEDICINE_REPORT_HEADERS = [
+        'ID препарата',
+        'Код СМНН',
+        'Раздел',
+        'Стандартизированное МНН',
+        'Торговое наименование ВК',
+        'Стандартизированная лекарственная форма',
+        'Стандартизированная лекарственная доза',
+        'Характеристика',
+        'Фасовка',
+        'Цена',
+        'Количество пациентов',
+        'Общая потребность',
+        'Общая стоимость'
+    ]
+    
     @staticmethod
+    def _medicine_report_item(row):
+        """Строка отчёта по препаратам."""
+        item = dict(row)
+        item['characteristic'] = row['characteristic'] or ''
+        return item
+    
+    @staticmethod
+    @cached_report('medicine')
     def generate_medicine_report():
         """
         Генерация сводного отчёта по всем препаратам с расчётом потребности.
@@ -120,67 +244,71 @@ class BusinessLogic:
         Returns:
             dict: Словарь с данными отчёта и итоговой статистикой
         """
-        # Получение всех препаратов
-        medicines = Medicine.get_all()
-        report_data = []
-        total_patients = 0
-        total_cost = 0.0
-        
-        for medicine in medicines:
-            # Получение всех пациентов, которым назначен данный препарат
-            patients_query = """
-                SELECT DISTINCT patient_id
-                FROM prescriptions
-                WHERE medicine_id = ?
-            """
-            patients_with_medicine = fetch_all(patients_query, (medicine.medicine_id,))
-            
-            patients_count = 0
-            total_need = 0.0
-            
-            for patient_row in patients_with_medicine:
-                patient_id = patient_row['patient_id']
-                remaining_need = BusinessLogic.calculate_remaining_need(patient_id, medicine.medicine_id)
-                
-                if remaining_need > 0:
-                    patients_count += 1
-                    total_need += remaining_need
-            
-            # Добавление в отчёт только если есть потребность
-            if patients_count > 0:
-                medicine_cost = total_need * medicine.price
-                total_patients += patients_count
-                total_cost += medicine_cost
-                
-                report_data.append({
-                    'medicine_id': medicine.medicine_id,
-                    'smmn_node_code': medicine.smmn_node_code,
-                    'section': medicine.section,
-                    'standardized_mnn': medicine.standardized_mnn,
-                    'trade_name_vk': medicine.trade_name_vk,
-                    'standardized_dosage_form': medicine.standardized_dosage_form,
-                    'standardized_dosage': medicine.standardized_dosage,
-                    'characteristic': medicine.characteristic or '',
-                    'packaging': medicine.packaging,
-                    'price': medicine.price,
-                    'patients_count': patients_count,
-                    'total_need': total_need,
-                    'total_cost': medicine_cost
-                })
-        
-        # Сортировка по убыванию стоимости
-        report_data.sort(key=lambda x: x['total_cost'], reverse=True)
+        report_data = [
+            BusinessLogic._medicine_report_item(row)
+            for row in fetch_all(BusinessLogic.MEDICINE_REPORT_QUERY)
+        ]
         
         return {
             'data': report_data,
             'summary': {
                 'total_medicines': len(report_data),
-                'total_patients': total_patients,
-                'total_cost': total_cost,
+                'total_patients': sum(item['patients_count'] for item in report_data),
+                'total_cost': sum(item['total_cost'] for item in report_data),
                 'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             }
         }
     
+    @staticmethod
+    def stream_medicine_report_csv(chunk_size=1000):
+        """
+        Потоковая выгрузка отчёта по препаратам в CSV.
+        
+        Строки читаются из курсора частями и сразу сериализуются, итоговая
+        строка накапливается по ходу выгрузки.
+        
+        Args:
+            chunk_size (int): Количество строк, читаемых из курсора за раз
+            
+        Yields:
+            str: Очередной блок CSV
+        """
+        generated_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        totals = {'patients': 0, 'cost': 0.0}
+        
+        def rows():
+            yield BusinessLogic.MEDICINE_REPORT_HEADERS
+            
+            for row in fetch_iter(BusinessLogic.MEDICINE_REPORT_QUERY, arraysize=chunk_size):
+                item = BusinessLogic._medicine_report_item(row)
+                totals['patients'] += item['patients_count']
+                totals['cost'] += item['total_cost']
+                yield [
+                    item['medicine_id'],
+                    item['smmn_node_code'],
+                    item['section'],
+                    item['standardized_mnn'],
+                    item['trade_name_vk'],
+                    item['standardized_dosage_form'],
+                    item['standardized_dosage'],
+                    item['characteristic'],
+                    item['packaging'],
+                    f"{item['price']:.2f}",
+                    item['patients_count'],
+                    f"{item['total_need']:.1f}",
+                    f"{item['total_cost']:.2f}"
+                ]
+            
+            # Итоговая строка
+            yield []
+            yield ['ИТОГО:'] + [''] * 9 + [totals['patients'], '', f"{totals['cost']:.2f}"]
+            
+            # Информация о генерации
+            yield []
+            yield ['Отчёт сгенерирован:', generated_at]
+        
+        yield from iter_csv(rows(), delimiter=';')
+    
     @staticmethod
     def export_medicine_report_to_csv():
         """
@@ -189,74 +317,7 @@ class BusinessLogic:
         Returns:
             str: CSV-данные в виде строки
         """
-        report = BusinessLogic.generate_medicine_report()
-        
-        output = io.StringIO()
-        writer = csv.writer(output, delimiter=';')
-        
-        # Заголовки
-        headers = [
-            'ID препарата',
-            'Код СМНН',
-            'Раздел',
-            'Стандартизированное МНН',
-            'Торговое наименование ВК',
-            'Стандартизированная лекарственная форма',
-            'Стандартизированная лекарственная доза',
-            'Характеристика',
-            'Фасовка',
-            'Цена',
-            'Количество пациентов',
-            'Общая потребность',
-            'Общая стоимость'
-        ]
-        writer.writerow(headers)
-        
-        # Данные
-        for item in report['data']:
-            row = [
-                item['medicine_id'],
-                item['smmn_node_code'],
-                item['section'],
-                item['standardized_mnn'],
-                item['trade_name_vk'],
-                item['standardized_dosage_form'],
-                item['standardized_dosage'],
-                item['characteristic'],
-                item['packaging'],
-                f"{item['price']:.2f}",
-                item['patients_count'],
-                f"{item['total_need']:.1f}",
-                f"{item['total_cost']:.2f}"
-            ]
-            writer.writerow(row)
-        
-        # Итоговая строка
-        writer.writerow([])
-        writer.writerow([
-            'ИТОГО:',
-            '',
-            '',
-            '',
-            '',
-            '',
-            '',
-            '',
-            '',
-            '',
-            report['summary']['total_patients'],
-            '',
-            f"{report['summary']['total_cost']:.2f}"
-        ])
-        
-        # Информация о генерации
-        writer.writerow([])
-        writer.writerow(['Отчёт сгенерирован:', report['summary']['generated_at']])
-        
-        csv_content = output.getvalue()
-        output.close()
-        
-        return csv_content
+        return ''.join(BusinessLogic.stream_medicine_report_csv())
     
     @staticmethod
     def validate_prescription(patient_id, medicine_id, quantity_packs):
@@ -282,6 +343,14 @@ class BusinessLogic:
             return False, "Препарат не найден"
         
         # Проверка количества
+        return BusinessLogic._validate_quantity(quantity_packs)
+    
+    @staticmethod
+    def _validate_quantity(quantity_packs):
+        """Проверка количества упаковок назначения или выдачи: (is_valid, error_message)."""
+        if not math.isfinite(quantity_packs):
+            return False, "Некорректное количество упаковок"
+        
         if quantity_packs <= 0:
             return False, "Количество упаковок должно быть больше нуля"
         
@@ -320,6 +389,138 @@ class BusinessLogic:
         return True, ""
     
     @staticmethod
+    def _parse_batch_record(record, date_field, optional_fields=None):
+        """
+        Разбор записи пакета назначений или выдач.
+        
+        Args:
+            record (dict): Запись пакета
+            date_field (str): Поле даты записи
+            optional_fields (dict): Необязательные поля -> тип значения
+            
+        Returns:
+            tuple: (кортеж значений для вставки или None, сообщение об ошибке)
+        """
+        if not isinstance(record, dict):
+            return None, "Запись должна быть объектом"
+        try:
+            patient_id = int(record["patient_id"])
+            medicine_id = int(record["medicine_id"])
+            quantity_packs = float(record["quantity_packs"])
+            record_date = datetime.strptime(str(record[date_field]), '%Y-%m-%d').strftime('%Y-%m-%d')
+            optional = tuple(
+                cast(record[field]) if record.get(field) not in (None, "") else None
+                for field, cast in (optional_fields or {}).items()
+            )
+        except KeyError as e:
+            return None, f"Не заполнено поле {e.args[0]}"
+        except (TypeError, ValueError, OverflowError):
+            return None, "Некорректные данные записи"
+        
+        # NaN и бесконечность разбираются float() без ошибки
+        if not all(math.isfinite(value) for value in (quantity_packs,) + optional if isinstance(value, float)):
+            return None, "Некорректные данные записи"
+        
+        is_valid, error_message = BusinessLogic._validate_quantity(quantity_packs)
+        if not is_valid:
+            return None, error_message
+        return (patient_id, medicine_id, record_date, quantity_packs) + optional, ""
+    
+    @staticmethod
+    def _ingest_batch(records, date_field, model, optional_fields=None, check_need=False, atomic=False):
+        """
+        Проверка и вставка пакета назначений или выдач в одной транзакции.
+        
+        Существование пациентов и препаратов проверяется пакетной загрузкой
+        get_many, остаточная потребность - одним расчётом по всем парам пакета.
+        Транзакция открывается до проверок (transaction(immediate=True)), поэтому
+        параллельные записи не могут изменить остатки между проверкой и вставкой.
+        
+        Returns:
+            dict: Количество вставленных и отклонённых записей и результаты по строкам
+        """
+        parsed = [BusinessLogic._parse_batch_record(record, date_field, optional_fields) for record in records]
+        
+        with transaction(immediate=True):
+            values = [row for row, _ in parsed if row is not None]
+            patients = Patient.get_many(row[0] for row in values)
+            medicines = Medicine.get_many(row[1] for row in values)
+            needs = {}
+            if check_need:
+                needs = {
+                    pair: need['remaining_need']
+                    for pair, need in BusinessLogic.calculate_remaining_needs((row[0], row[1]) for row in values).items()
+                }
+            
+            results = []
+            accepted = []
+            for index, (row, error_message) in enumerate(parsed):
+                if row is not None:
+                    patient_id, medicine_id, _, quantity_packs = row[:4]
+                    if patient_id not in patients:
+                        error_message = "Пациент не найден"
+                    elif medicine_id not in medicines:
+                        error_message = "Препарат не найден"
+                    elif check_need:
+                        # Записи пакета расходуют остаток в порядке следования
+                        remaining_need = needs.get((patient_id, medicine_id), 0)
+                        if remaining_need <= 0:
+                            error_message = "У пациента нет назначений данного препарата или они уже полностью выданы"
+                        elif quantity_packs > remaining_need:
+                            error_message = (f"Количество к выдаче ({quantity_packs}) превышает "
+                                             f"остаточную потребность ({remaining_need:.1f})")
+                        else:
+                            needs[(patient_id, medicine_id)] = remaining_need - quantity_packs
+                if error_message:
+                    results.append({'row': index, 'valid': False, 'error': error_message})
+                else:
+                    results.append({'row': index, 'valid': True, 'error': None})
+                    accepted.append(row)
+            
+            rejected = len(results) - len(accepted)
+            if atomic and rejected:
+                accepted = []
+            if accepted:
+                model.bulk_create(accepted)
+        
+        return {'inserted': len(accepted), 'rejected': rejected, 'results': results}
+    
+    @staticmethod
+    def ingest_dispensings(records, atomic=False):
+        """
+        Пакетная загрузка выдач с проверкой по остаточной потребности.
+        
+        Выдачи одной пары (пациент, препарат) в пакете проверяются по
+        очереди: каждая уменьшает остаток, доступный следующим.
+        
+        Args:
+            records (list): Словари с полями patient_id, medicine_id, dispensing_date, quantity_packs
+            atomic (bool): Не вставлять ничего, если хотя бы одна запись не прошла проверку
+            
+        Returns:
+            dict: {'inserted', 'rejected', 'results': [{'row', 'valid', 'error'}]}
+        """
+        return BusinessLogic._ingest_batch(records, 'dispensing_date', Dispensing, check_need=True, atomic=atomic)
+    
+    @staticmethod
+    def ingest_prescriptions(records, atomic=False):
+        """
+        Пакетная загрузка назначений.
+        
+        Args:
+            records (list): Словари с полями patient_id, medicine_id, prescription_date, quantity_packs
+                и необязательными daily_dose, treatment_days
+            atomic (bool): Не вставлять ничего, если хотя бы одна запись не прошла проверку
+            
+        Returns:
+            dict: {'inserted', 'rejected', 'results': [{'row', 'valid', 'error'}]}
+        """
+        return BusinessLogic._ingest_batch(records, 'prescription_date', Prescription,
+                                           optional_fields={'daily_dose': float, 'treatment_days': int},
+                                           atomic=atomic)
+    
+    @staticmethod
+    @cached_report('medicine_usage')
     def get_medicine_usage_statistics():
         """
         Получение статистики использования препаратов.
@@ -340,7 +541,6 @@ class BusinessLogic:
             ORDER BY patients_count DESC, total_prescribed DESC
             LIMIT 10
         """
-        top_prescribed = fetch_all(top_prescribed_query)
         
         # Топ-10 наиболее выдаваемых препаратов
         top_dispensed_query = """
@@ -355,7 +555,6 @@ class BusinessLogic:
             ORDER BY patients_count DESC, total_dispensed DESC
             LIMIT 10
         """
-        top_dispensed = fetch_all(top_dispensed_query)
         
         # Общая статистика
         general_stats_query = """
@@ -367,11 +566,18 @@ class BusinessLogic:
                 (SELECT COALESCE(SUM(quantity_packs), 0) FROM prescriptions) as total_prescribed_packs,
                 (SELECT COALESCE(SUM(quantity_packs), 0) FROM dispensings) as total_dispensed_packs
         """
-        general_stats = fetch_one(general_stats_query)
+        
+        # Запросы независимы и выполняются параллельно на отдельных соединениях
+        sections = run_sections({
+            'top_prescribed': lambda: fetch_all(top_prescribed_query),
+            'top_dispensed': lambda: fetch_all(top_dispensed_query),
+            'general_stats': lambda: fetch_one(general_stats_query),
+        })
+        general_stats = sections['general_stats']
         
         return {
-            'top_prescribed': [dict(row) for row in top_prescribed],
-            'top_dispensed': [dict(row) for row in top_dispensed],
+            'top_prescribed': [dict(row) for row in sections['top_prescribed']],
+            'top_dispensed': [dict(row) for row in sections['top_dispensed']],
             'general_stats': dict(general_stats) if general_stats else {}
         }
     
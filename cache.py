@@ -0,0 +1,131 @@
+"""
+Модуль кэширования результатов расчётов в памяти процесса.
+"""
+
+import functools
+import inspect
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, has_app_context
+from database_updated import get_data_version
+
+
+class ResultCache:
+    """
+    Потокобезопасный LRU-кэш результатов с ограничением времени жизни.
+
+    Кэш хранится отдельно в каждом процессе. Код, изменяющий данные, сбрасывает
+    зависящие от них записи (invalidate, clear); изменения, сделанные другими
+    процессами, перестают быть видны не позднее чем через ttl секунд.
+    """
+
+    def __init__(self, max_size=1024):
+        """
+        Args:
+            max_size (int): Максимальное количество записей
+        """
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    def get(self, key, ttl):
+        """
+        Получение значения из кэша.
+
+        Args:
+            key: Ключ записи
+            ttl (float): Максимальный возраст записи в секундах
+
+        Returns:
+            Значение или None, если записи нет или она устарела
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[1] < ttl:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return entry[0]
+            self._stats['misses'] += 1
+            return None
+
+    def set(self, key, value):
+        """Сохранение значения в кэше с вытеснением самых давно использованных записей."""
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def invalidate(self, key):
+        """Сброс записи по ключу."""
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._stats['invalidations'] += 1
+
+    def clear(self):
+        """Сброс всех записей."""
+        with self._lock:
+            self._stats['invalidations'] += len(self._entries)
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Статистика работы кэша.
+
+        Returns:
+            dict: Счётчики попаданий, промахов, вытеснений и текущий размер
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+        stats['max_size'] = self.max_size
+        return stats
+
+# Сводки пациентов по препаратам: patient_id -> список строк сводки
+patient_summary_cache = ResultCache()
+
+# Отчёты: (имя отчёта, параметры, версия данных) -> результат
+report_cache = ResultCache(max_size=128)
+
+def _copy_result(value):
+    """Копия структуры отчёта (словари и списки); строки выборки неизменяемы и не копируются."""
+    if isinstance(value, dict):
+        return {key: _copy_result(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy_result(item) for item in value]
+    return value
+
+def cached_report(name):
+    """
+    Декоратор кэширования результата построения отчёта в report_cache.
+
+    Ключ кэша - имя отчёта, значения всех параметров и версия данных базы
+    (get_data_version): результат переиспользуется, пока в базу никто не
+    записывал, но не дольше REPORT_CACHE_TTL секунд. Вызовы с lazy=True
+    (строки отчёта - итератор по курсору) и с use_cache=False не кэшируются.
+
+    Args:
+        name (str): Имя отчёта в ключе кэша
+    """
+    def decorator(build):
+        signature = inspect.signature(build)
+
+        @functools.wraps(build)
+        def wrapper(*args, use_cache=True, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            ttl = current_app.config.get('REPORT_CACHE_TTL', 300) if has_app_context() else 0
+            if not use_cache or not ttl or bound.arguments.get('lazy'):
+                return build(*args, **kwargs)
+
+            key = (name, tuple(bound.arguments.items()), get_data_version())
+            result = report_cache.get(key, ttl)
+            if result is None:
+                result = build(*args, **kwargs)
+                report_cache.set(key, result)
+            return _copy_result(result)
+        return wrapper
+    return decorator
@@ -6,6 +6,53 @@ SECRET_KEY = 'your-secret-key-here-change-in-production'
 # Путь к базе данных SQLite
 DATABASE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'medical_app.db')
 
+# Настройки пула соединений с БД (на каждый процесс-воркер)
+DB_POOL_SIZE = 5  # Максимальное количество соединений
+DB_POOL_MAX_AGE = 3600  # Время жизни соединения в секундах
+DB_POOL_TIMEOUT = 30  # Время ожидания свободного соединения в секундах
+DB_POOL_HEALTH_CHECK = True  # Проверка соединения перед выдачей из пула
+DB_FETCH_ARRAYSIZE = 500  # Строк, читаемых из курсора за раз при потоковом чтении (fetch_iter)
+
+# Очередь записи: изменения вне явных транзакций выполняет один поток-писатель процесса
+DB_WRITE_QUEUE_ENABLED = True
+DB_WRITE_QUEUE_SIZE = 1000  # Максимальное количество ожидающих записей (при заполнении запросы ждут)
+DB_WRITE_QUEUE_TIMEOUT = 30  # Ожидание места в заполненной очереди в секундах
+DB_WRITE_BATCH_SIZE = 100  # Максимальное количество записей в одной транзакции писателя
+DB_WRITE_BATCH_DELAY = 0.002  # Ожидание следующих записей для общей фиксации (group commit) в секундах
+
+# Профиль хранения SQLite (PRAGMA применяются к каждому новому соединению)
+SQLITE_JOURNAL_MODE = 'WAL'  # Читатели не блокируются пишущим соединением
+SQLITE_SYNCHRONOUS = 'NORMAL'  # В режиме WAL безопасно и без fsync на каждый коммит
+SQLITE_CACHE_SIZE = -64000  # Отрицательное значение - размер кэша страниц в КиБ (~64 МБ)
+SQLITE_MMAP_SIZE = 256 * 1024 * 1024  # Размер отображения файла БД в память в байтах
+SQLITE_TEMP_STORE = 'MEMORY'  # Временные таблицы и индексы сортировки в памяти
+SQLITE_BUSY_TIMEOUT = 5000  # Ожидание снятия блокировки в миллисекундах
+
+# Стратегии подсчёта общего количества записей для списков:
+# 'exact' - COUNT(*) на каждую страницу, 'cached' - COUNT(*) с кэшем до записи в таблицу,
+# 'estimate' - оценка по статистике таблицы, 'none' - без подсчёта (только "далее"/"назад")
+PAGINATION_COUNT_STRATEGIES = {
+    'patients': 'cached',
+    'medicines': 'cached',
+    'prescriptions': 'estimate',
+    'dispensings': 'none',
+}
+PAGINATION_COUNT_CACHE_TTL = 60  # Время жизни закэшированного количества в секундах
+PAGINATION_COUNT_CACHE_SIZE = 1024  # Максимальное количество закэшированных запросов
+
+# Настройки автозаполнения
+AUTOCOMPLETE_LIMIT = 10  # Максимальное количество подсказок
+AUTOCOMPLETE_REFRESH_INTERVAL = 300  # Полная перестройка индекса (изменения других процессов), в секундах
+
+# Кэш сводки пациента по препаратам
+PATIENT_SUMMARY_CACHE_TTL = 60  # Время жизни сводки в секундах (0 - без кэширования)
+
+# Кэш отчётов: результат действует, пока данные в базе не изменились
+REPORT_CACHE_TTL = 300  # Максимальное время жизни отчёта в секундах (0 - без кэширования)
+
+# Пакетная загрузка назначений и выдач через API
+INGEST_MAX_BATCH_SIZE = 10000  # Максимальное количество записей в одном пакете
+
 # Настройки Flask
 DEBUG = True
 TESTING = False
@@ -20,4 +67,12 @@ MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB максимальный разм
 # Настройки для отчётов
 REPORTS_EXPORT_FORMAT = 'csv'
 REPORTS_DATE_FORMAT = '%Y-%m-%d'
+REPORTS_EXPORT_CHUNK_SIZE = 1000  # Строк, читаемых из курсора за раз при потоковой выгрузке
+REPORTS_PAGE_SIZE = 100  # Строк отчёта по выдачам на странице
+REPORT_PARALLEL_WORKERS = 4  # Потоков для параллельных разделов отчётов (0 - последовательно)
+
+# Фоновое построение отчётов (report_jobs.py)
+REPORT_JOBS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'report_results')  # Каталог результатов
+REPORT_JOBS_WORKERS = 2  # Процессов в пуле построения отчётов
+REPORT_JOBS_RETENTION = 24 * 60 * 60  # Время хранения результатов в секундах
 
@@ -0,0 +1,207 @@
+"""
+Модуль пула соединений с базой данных SQLite.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+
+class ConnectionPool:
+    """
+    Потокобезопасный пул переиспользуемых соединений SQLite.
+
+    Пул создаётся отдельно в каждом процессе (воркере): после fork соединения
+    родительского процесса не используются, а пул заполняется заново.
+    """
+
+    def __init__(self, factory, size=5, max_age=3600, timeout=30.0, health_check=True):
+        """
+        Args:
+            factory (callable): Функция без аргументов, создающая новое соединение
+            size (int): Максимальное количество соединений в процессе
+            max_age (float): Время жизни соединения в секундах (None - без ограничения)
+            timeout (float): Время ожидания свободного соединения в секундах
+            health_check (bool): Проверять соединение перед выдачей из пула
+        """
+        self._factory = factory
+        self.size = size
+        self.max_age = max_age
+        self.timeout = timeout
+        self.health_check = health_check
+
+        self._condition = threading.Condition()
+        self._reset_state()
+
+    def _reset_state(self):
+        """Сброс внутреннего состояния пула (при создании и после fork)."""
+        self._pid = os.getpid()
+        self._idle = []
+        self._born = {}
+        self._pending = 0
+        self._stats = {
+            'created': 0,
+            'reused': 0,
+            'recycled': 0,
+            'discarded': 0,
+            'waits': 0,
+            'timeouts': 0,
+        }
+
+    def _check_pid(self):
+        """Сброс пула, если он был унаследован дочерним процессом."""
+        if self._pid != os.getpid():
+            self._reset_state()
+
+    def _expired(self, conn):
+        """Проверка превышения времени жизни соединения."""
+        if not self.max_age:
+            return False
+        return time.monotonic() - self._born[id(conn)] > self.max_age
+
+    def _is_healthy(self, conn):
+        """Проверка работоспособности соединения."""
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _create(self):
+        """Создание нового соединения (место под него уже зарезервировано)."""
+        try:
+            conn = self._factory()
+        except Exception:
+            with self._condition:
+                self._pending -= 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self._pending -= 1
+            self._born[id(conn)] = time.monotonic()
+            self._stats['created'] += 1
+        return conn
+
+    def _drop(self, conn, reason):
+        """Закрытие соединения и освобождение места в пуле."""
+        with self._condition:
+            self._born.pop(id(conn), None)
+            self._stats[reason] += 1
+            self._condition.notify()
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def _open_count(self):
+        """Количество открытых и создаваемых соединений."""
+        return len(self._born) + self._pending
+
+    def acquire(self):
+        """
+        Получение соединения из пула.
+
+        Returns:
+            sqlite3.Connection: Соединение с базой данных
+
+        Raises:
+            RuntimeError: Если свободное соединение не появилось за timeout секунд
+        """
+        deadline = time.monotonic() + self.timeout
+
+        while True:
+            with self._condition:
+                self._check_pid()
+                while not self._idle and self._open_count() >= self.size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise RuntimeError('Превышено время ожидания свободного соединения с базой данных')
+                    self._stats['waits'] += 1
+                    self._condition.wait(remaining)
+                    self._check_pid()
+
+                if self._idle:
+                    conn = self._idle.pop()
+                else:
+                    self._pending += 1
+                    conn = None
+
+            if conn is None:
+                return self._create()
+
+            if self._expired(conn):
+                self._drop(conn, 'recycled')
+                continue
+
+            if self.health_check and not self._is_healthy(conn):
+                self._drop(conn, 'discarded')
+                continue
+
+            with self._condition:
+                self._stats['reused'] += 1
+            return conn
+
+    def release(self, conn):
+        """
+        Возврат соединения в пул.
+
+        Незавершённая транзакция откатывается. Соединения, не принадлежащие
+        пулу, просто закрываются.
+
+        Args:
+            conn (sqlite3.Connection): Соединение, полученное через acquire()
+        """
+        with self._condition:
+            self._check_pid()
+            owned = id(conn) in self._born
+
+        if not owned:
+            conn.close()
+            return
+
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._drop(conn, 'discarded')
+            return
+
+        if self._expired(conn):
+            self._drop(conn, 'recycled')
+            return
+
+        with self._condition:
+            self._idle.append(conn)
+            self._condition.notify()
+
+    def close_all(self):
+        """Закрытие всех свободных соединений пула."""
+        with self._condition:
+            idle, self._idle = self._idle, []
+            for conn in idle:
+                self._born.pop(id(conn), None)
+            self._condition.notify_all()
+        for conn in idle:
+            conn.close()
+
+    def stats(self):
+        """
+        Статистика работы пула.
+
+        Returns:
+            dict: Счётчики создания, переиспользования и ожидания соединений
+        """
+        with self._condition:
+            self._check_pid()
+            idle = len(self._idle)
+            open_count = self._open_count()
+            stats = dict(self._stats)
+        stats.update({
+            'size': self.size,
+            'open': open_count,
+            'idle': idle,
+            'in_use': open_count - idle,
+        })
+        return stats
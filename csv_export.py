@@ -0,0 +1,55 @@
+"""
+Модуль потоковой выгрузки данных в CSV.
+"""
+
+import csv
+import io
+from flask import Response, stream_with_context
+
+def iter_csv(rows, delimiter=',', buffer_size=16384):
+    """
+    Построчная сериализация строк в CSV с выдачей текста блоками.
+
+    Первая строка (заголовок) отдаётся сразу, остальные накапливаются в буфере
+    размером около buffer_size символов, поэтому память не зависит от объёма
+    выгрузки.
+
+    Args:
+        rows (iterable): Строки CSV (последовательности значений)
+        delimiter (str): Разделитель полей
+        buffer_size (int): Размер блока текста в символах
+
+    Yields:
+        str: Очередной блок CSV
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=delimiter)
+    first = True
+    for row in rows:
+        writer.writerow(row)
+        if first or buffer.tell() >= buffer_size:
+            first = False
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def csv_response(chunks, filename):
+    """
+    Потоковый HTTP-ответ с CSV-файлом.
+
+    Контекст запроса (и соединение с базой данных) сохраняется до окончания
+    передачи, поэтому chunks может лениво читать строки из курсора.
+
+    Args:
+        chunks (iterable): Блоки CSV, например из iter_csv
+        filename (str): Имя файла для Content-Disposition
+
+    Returns:
+        Response: Ответ Flask с потоковым телом
+    """
+    response = Response(stream_with_context(chunks), mimetype="text/csv")
+    response.headers["Content-Type"] = "text/csv; charset=utf-8"
+    response.headers["Content-Disposition"] = f"attachment; filename={filename}"
+    return response
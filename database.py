@@ -1,6 +1,9 @@
 import sqlite3
 import os
 from flask import g, current_app
+from balances import create_balance_table
+from rollups import create_rollup_tables
+from identity_map import forget_identities
 
 def get_db():
     """Получение соединения с базой данных."""
@@ -13,7 +16,13 @@ def close_db(e=None):
     """Закрытие соединения с базой данных."""
     db = g.pop('db', None)
     if db is not None:
-        db.close()
+        # Соединение запроса могла взять из пула бизнес-логика (database_updated):
+        # пул возвращает свои соединения в очередь и закрывает чужие
+        pool = current_app.extensions.get('db_pool')
+        if pool is not None:
+            pool.release(db)
+        else:
+            db.close()
 
 def init_db():
     """Инициализация базы данных и создание таблиц."""
@@ -88,6 +97,12 @@ def init_db():
     db.execute('CREATE INDEX IF NOT EXISTS idx_prescriptions_date ON prescriptions (prescription_date)')
     db.execute('CREATE INDEX IF NOT EXISTS idx_dispensings_date ON dispensings (dispensing_date)')
     
+    # Таблица остатков по парам (пациент, препарат)
+    create_balance_table(db)
+    
+    # Дневные агрегаты выдач для финансовых отчётов и отчётов по выдачам
+    create_rollup_tables(db)
+    
     db.commit()
 
 def insert_sample_data():
@@ -172,6 +187,7 @@ def execute_update(query, params=None):
     else:
         cursor = db.execute(query)
     db.commit()
+    forget_identities()
     return cursor.rowcount
 
 def fetch_one(query, params=None):
@@ -184,3 +200,49 @@ def fetch_all(query, params=None):
     cursor = execute_query(query, params)
     return cursor.fetchall()
 
+def fetch_chunks(query, params=None, chunk_size=None, as_tuples=False):
+    """
+    Чтение результата запроса частями без загрузки всех строк в память.
+    
+    Args:
+        query: SQL-запрос
+        params: Параметры запроса
+        chunk_size: Количество строк в одной части (по умолчанию DB_FETCH_ARRAYSIZE)
+        as_tuples: Возвращать строки кортежами вместо sqlite3.Row
+    
+    Yields:
+        list: Очередные chunk_size строк результата
+    """
+    cursor = get_db().cursor()
+    if as_tuples:
+        cursor.row_factory = None
+    cursor.arraysize = chunk_size or current_app.config.get('DB_FETCH_ARRAYSIZE', 500)
+    try:
+        cursor.execute(query, params or ())
+        while True:
+            rows = cursor.fetchmany()
+            if not rows:
+                break
+            yield rows
+    finally:
+        cursor.close()
+
+def fetch_iter(query, params=None, arraysize=None, as_tuples=False):
+    """
+    Ленивый перебор строк результата запроса.
+    
+    Строки читаются из курсора пакетами по arraysize, в памяти одновременно
+    находится не более одного пакета.
+    
+    Args:
+        query: SQL-запрос
+        params: Параметры запроса
+        arraysize: Размер пакета чтения (по умолчанию DB_FETCH_ARRAYSIZE)
+        as_tuples: Возвращать строки кортежами вместо sqlite3.Row
+    
+    Yields:
+        Очередная строка результата
+    """
+    for rows in fetch_chunks(query, params, arraysize, as_tuples):
+        yield from rows
+
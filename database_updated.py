@@ -1,19 +1,252 @@
 import sqlite3
 import os
+import re
+import json
+import base64
+import threading
+import time
+from contextlib import contextmanager
 from flask import g, current_app
+from balances import create_balance_table
+from rollups import create_rollup_tables
+from identity_map import forget_identities
+from connection_pool import ConnectionPool
+from write_queue import WriteQueue
+from parallel_sections import SectionExecutor
+
+_pool_lock = threading.Lock()
+
+# PRAGMA профиля хранения: имя PRAGMA -> (ключ конфигурации, допустимые значения или тип)
+STORAGE_PRAGMAS = {
+    'busy_timeout': ('SQLITE_BUSY_TIMEOUT', int),
+    'journal_mode': ('SQLITE_JOURNAL_MODE', ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF')),
+    'synchronous': ('SQLITE_SYNCHRONOUS', ('OFF', 'NORMAL', 'FULL', 'EXTRA')),
+    'cache_size': ('SQLITE_CACHE_SIZE', int),
+    'mmap_size': ('SQLITE_MMAP_SIZE', int),
+    'temp_store': ('SQLITE_TEMP_STORE', ('DEFAULT', 'FILE', 'MEMORY')),
+}
+
+# Расшифровка числовых значений, возвращаемых SQLite
+PRAGMA_VALUE_NAMES = {
+    'synchronous': {0: 'OFF', 1: 'NORMAL', 2: 'FULL', 3: 'EXTRA'},
+    'temp_store': {0: 'DEFAULT', 1: 'FILE', 2: 'MEMORY'},
+}
+
+def get_storage_profile(config):
+    """
+    Формирование профиля хранения из конфигурации приложения.
+    
+    Args:
+        config: Конфигурация Flask приложения
+    
+    Returns:
+        dict: Словарь {имя PRAGMA: значение}; ненастроенные PRAGMA пропускаются
+    
+    Raises:
+        ValueError: Если значение настройки недопустимо
+    """
+    profile = {}
+    for pragma, (config_key, allowed) in STORAGE_PRAGMAS.items():
+        value = config.get(config_key)
+        if value is None:
+            continue
+        if allowed is int:
+            value = int(value)
+        else:
+            value = str(value).upper()
+            if value not in allowed:
+                raise ValueError(f"Недопустимое значение {config_key}: {value}")
+        profile[pragma] = value
+    return profile
+
+def apply_storage_profile(db, profile):
+    """Применение PRAGMA профиля хранения к соединению."""
+    for pragma, value in profile.items():
+        db.execute(f"PRAGMA {pragma} = {value}").fetchall()
+
+def create_connection(database_path, profile=None):
+    """Создание нового соединения с базой данных."""
+    db = sqlite3.connect(database_path, check_same_thread=False)
+    db.row_factory = sqlite3.Row
+    if profile:
+        apply_storage_profile(db, profile)
+    return db
+
+def get_pool():
+    """Получение пула соединений текущего приложения (создаётся при первом обращении)."""
+    pool = current_app.extensions.get('db_pool')
+    if pool is None:
+        with _pool_lock:
+            pool = current_app.extensions.get('db_pool')
+            if pool is None:
+                config = current_app.config
+                database_path = config['DATABASE_PATH']
+                profile = get_storage_profile(config)
+                pool = ConnectionPool(
+                    lambda: create_connection(database_path, profile),
+                    size=config.get('DB_POOL_SIZE', 5),
+                    max_age=config.get('DB_POOL_MAX_AGE', 3600),
+                    timeout=config.get('DB_POOL_TIMEOUT', 30),
+                    health_check=config.get('DB_POOL_HEALTH_CHECK', True)
+                )
+                current_app.extensions['db_pool'] = pool
+    return pool
+
+def get_write_queue():
+    """
+    Очередь записи текущего приложения (создаётся при первом обращении).
+    
+    Returns:
+        WriteQueue: Очередь или None, если запись идёт через соединение запроса
+            (DB_WRITE_QUEUE_ENABLED = False)
+    """
+    config = current_app.config
+    if not config.get('DB_WRITE_QUEUE_ENABLED', False):
+        return None
+    writer = current_app.extensions.get('db_write_queue')
+    if writer is None:
+        with _pool_lock:
+            writer = current_app.extensions.get('db_write_queue')
+            if writer is None:
+                database_path = config['DATABASE_PATH']
+                profile = get_storage_profile(config)
+                writer = WriteQueue(
+                    lambda: create_connection(database_path, profile),
+                    max_size=config.get('DB_WRITE_QUEUE_SIZE', 1000),
+                    batch_size=config.get('DB_WRITE_BATCH_SIZE', 100),
+                    batch_delay=config.get('DB_WRITE_BATCH_DELAY', 0.002),
+                    timeout=config.get('DB_WRITE_QUEUE_TIMEOUT', 30)
+                )
+                current_app.extensions['db_write_queue'] = writer
+    return writer
+
+def _request_writer():
+    """
+    Очередь, через которую пишет текущий запрос.
+    
+    Внутри явной транзакции и при незафиксированных изменениях на соединении
+    запроса запись остаётся на нём: иначе писатель ждал бы блокировку,
+    которую держит сам запрос.
+    """
+    if in_transaction():
+        return None
+    db = g.get('db')
+    if db is not None and db.in_transaction:
+        return None
+    return get_write_queue()
+
+def get_data_version():
+    """
+    Версия данных базы: меняется после каждой фиксации изменений любым
+    соединением, в том числе из других процессов.
+    
+    Значение PRAGMA data_version сравнимо только в пределах одного соединения,
+    поэтому его читает отдельное соединение процесса, которое само не пишет.
+    
+    Returns:
+        tuple: Непрозрачный токен версии для ключей кэша
+    """
+    probe = current_app.extensions.get('db_version_probe')
+    if probe is None or probe[0] != os.getpid():
+        with _pool_lock:
+            probe = current_app.extensions.get('db_version_probe')
+            if probe is None or probe[0] != os.getpid():
+                conn = sqlite3.connect(current_app.config['DATABASE_PATH'], check_same_thread=False)
+                probe = (os.getpid(), conn, threading.Lock(), id(conn))
+                current_app.extensions['db_version_probe'] = probe
+    pid, conn, lock, conn_id = probe
+    with lock:
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+    return (pid, conn_id, version)
+
+def get_section_executor():
+    """
+    Пул потоков разделов отчётов текущего приложения (создаётся при первом обращении).
+    
+    Returns:
+        SectionExecutor: Пул или None, если разделы выполняются последовательно
+            (REPORT_PARALLEL_WORKERS = 0)
+    """
+    config = current_app.config
+    workers = config.get('REPORT_PARALLEL_WORKERS', 0)
+    if not workers:
+        return None
+    executor = current_app.extensions.get('report_sections')
+    if executor is None:
+        with _pool_lock:
+            executor = current_app.extensions.get('report_sections')
+            if executor is None:
+                database_path = config['DATABASE_PATH']
+                profile = get_storage_profile(config)
+                executor = SectionExecutor(lambda: create_connection(database_path, profile), workers=workers)
+                current_app.extensions['report_sections'] = executor
+    return executor
+
+def run_sections(sections):
+    """
+    Выполнение независимых разделов отчёта, по возможности параллельно.
+    
+    Каждый раздел выполняется в своём контексте приложения, где g.db - соединение
+    потока пула только для чтения, поэтому разделы читают обычными fetch_all/
+    fetch_one. Последовательно на соединении запроса разделы выполняются, если
+    пул отключён, раздел один, разделы вложены или в запросе есть
+    незафиксированные изменения, которых не видят другие соединения.
+    
+    Args:
+        sections (dict): Имя раздела -> функция без аргументов
+    
+    Returns:
+        dict: Имя раздела -> результат функции
+    """
+    executor = get_section_executor()
+    db = g.get('db')
+    if (executor is None or len(sections) < 2 or executor.in_worker() or in_transaction()
+            or (db is not None and db.in_transaction)):
+        return {name: section() for name, section in sections.items()}
+    
+    app = current_app._get_current_object()
+    
+    @contextmanager
+    def bind(conn):
+        with app.app_context():
+            g.db = conn
+            try:
+                yield
+            finally:
+                # Соединение принадлежит потоку пула и не возвращается в пул запросов
+                g.pop('db', None)
+    
+    return executor.run(sections, bind)
+
+def get_pool_stats():
+    """Получение статистики пула соединений."""
+    return get_pool().stats()
+
+def get_storage_report():
+    """
+    Получение фактических значений PRAGMA профиля хранения.
+    
+    Returns:
+        dict: Словарь {имя PRAGMA: действующее значение}
+    """
+    db = get_db()
+    report = {}
+    for pragma in STORAGE_PRAGMAS:
+        value = db.execute(f"PRAGMA {pragma}").fetchone()[0]
+        report[pragma] = PRAGMA_VALUE_NAMES.get(pragma, {}).get(value, value)
+    return report
 
 def get_db():
-    """Получение соединения с базой данных."""
+    """Получение соединения с базой данных из пула."""
     if 'db' not in g:
-        g.db = sqlite3.connect(current_app.config['DATABASE_PATH'])
-        g.db.row_factory = sqlite3.Row
+        g.db = get_pool().acquire()
     return g.db
 
 def close_db(e=None):
-    """Закрытие соединения с базой данных."""
+    """Возврат соединения с базой данных в пул."""
     db = g.pop('db', None)
     if db is not None:
-        db.close()
+        get_pool().release(db)
 
 def init_db():
     """Инициализация базы данных и создание таблиц."""
@@ -27,6 +260,9 @@ def init_db():
             birth_year INTEGER NOT NULL,
             diagnosis TEXT NOT NULL,
             attending_doctor TEXT NOT NULL,
+            fio_key TEXT,
+            diagnosis_key TEXT,
+            attending_doctor_key TEXT,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
@@ -45,6 +281,9 @@ def init_db():
             characteristic TEXT,
             packaging TEXT NOT NULL,
             price REAL,
+            trade_name_vk_key TEXT,
+            standardized_mnn_key TEXT,
+            section_key TEXT,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
@@ -83,19 +322,257 @@ def init_db():
     ''')
     
     # Создание индексов для улучшения производительности при работе с большими объемами данных
-    db.execute('CREATE INDEX IF NOT EXISTS idx_patients_fio ON patients (fio)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_patients_fio_diagnosis ON patients (fio, diagnosis)')
     db.execute('CREATE INDEX IF NOT EXISTS idx_patients_diagnosis ON patients (diagnosis)')
     db.execute('CREATE INDEX IF NOT EXISTS idx_patients_doctor ON patients (attending_doctor)')
     db.execute('CREATE INDEX IF NOT EXISTS idx_medicines_mnn ON medicines (standardized_mnn)')
-    db.execute('CREATE INDEX IF NOT EXISTS idx_medicines_trade_name ON medicines (trade_name_vk)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_medicines_choice ON medicines (trade_name_vk, standardized_mnn, price, standardized_dosage, packaging)')
     db.execute('CREATE INDEX IF NOT EXISTS idx_medicines_section ON medicines (section)')
     db.execute('CREATE INDEX IF NOT EXISTS idx_prescriptions_patient_medicine ON prescriptions (patient_id, medicine_id)')
     db.execute('CREATE INDEX IF NOT EXISTS idx_dispensings_patient_medicine ON dispensings (patient_id, medicine_id)')
     db.execute('CREATE INDEX IF NOT EXISTS idx_prescriptions_date ON prescriptions (prescription_date)')
     db.execute('CREATE INDEX IF NOT EXISTS idx_dispensings_date ON dispensings (dispensing_date)')
     
+    # Индексы по fio и trade_name_vk расширены до покрывающих выпадающие списки
+    # (Patient.CHOICE_FIELDS, Medicine.CHOICE_FIELDS), прежние стали лишними
+    db.execute('DROP INDEX IF EXISTS idx_patients_fio')
+    db.execute('DROP INDEX IF EXISTS idx_medicines_trade_name')
+    db.execute('DROP INDEX IF EXISTS idx_medicines_trade_name_choice')
+    
+    # Таблица остатков по парам (пациент, препарат)
+    create_balance_table(db)
+    
+    # Дневные агрегаты выдач для финансовых отчётов и отчётов по выдачам
+    create_rollup_tables(db)
+    
+    # Нормализованные ключи поиска и их индексы
+    create_search_keys(db)
+    
+    # Полнотекстовые индексы для поиска
+    create_search_indexes(db)
+    
     db.commit()
 
+# Нормализованные ключи поиска: таблица -> поля, для которых хранится колонка <поле>_key.
+# SQLite сравнивает без учёта регистра только ASCII, поэтому поиск по кириллице
+# идёт по заранее нормализованным значениям (см. normalize_search_key).
+SEARCH_KEY_FIELDS = {
+    'patients': ('fio', 'diagnosis', 'attending_doctor'),
+    'medicines': ('trade_name_vk', 'standardized_mnn', 'section'),
+}
+
+def normalize_search_key(value):
+    """
+    Нормализация строки для поиска без учёта регистра.
+    
+    Регистр приводится через casefold, ё заменяется на е, последовательности
+    пробельных символов схлопываются в один пробел.
+    
+    Args:
+        value: Исходное значение
+    
+    Returns:
+        str: Нормализованная строка или None для пустого значения
+    """
+    if value is None:
+        return None
+    return ' '.join(str(value).casefold().replace('ё', 'е').split())
+
+def search_key_column(field):
+    """Имя колонки с нормализованным ключом поля."""
+    return f"{field}_key"
+
+def create_search_keys(db):
+    """
+    Добавление колонок нормализованных ключей в существующие таблицы и их индексов.
+    
+    Args:
+        db: Соединение с базой данных
+    """
+    for table, fields in SEARCH_KEY_FIELDS.items():
+        existing = {row['name'] for row in db.execute(f"PRAGMA table_info({table})")}
+        for field in fields:
+            key = search_key_column(field)
+            if key not in existing:
+                db.execute(f"ALTER TABLE {table} ADD COLUMN {key} TEXT")
+            db.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{key} ON {table} ({key})")
+    refresh_search_keys(db)
+
+def refresh_search_keys(db=None, full=False, batch_size=1000):
+    """
+    Заполнение нормализованных ключей поиска.
+    
+    Модели вычисляют ключи при каждой записи. По умолчанию заполняются только
+    строки без ключей (добавленные в обход моделей или до появления колонок);
+    full=True пересчитывает ключи всех строк, например после изменения данных
+    внешними средствами.
+    
+    Args:
+        db: Соединение с базой данных (по умолчанию соединение запроса)
+        full: Пересчитать ключи всех строк
+        batch_size: Размер пакета обновления
+    
+    Returns:
+        int: Количество обновлённых строк
+    """
+    db = db or get_db()
+    updated = 0
+    for table, fields in SEARCH_KEY_FIELDS.items():
+        pk = SEARCH_INDEXES[table]['primary_key']
+        keys = [search_key_column(field) for field in fields]
+        query = f"SELECT {pk}, {', '.join(fields)} FROM {table}"
+        if not full:
+            query += " WHERE " + " OR ".join(f"{key} IS NULL" for key in keys)
+        rows = db.execute(query).fetchall()
+        if not rows:
+            continue
+        
+        update = f"UPDATE {table} SET {', '.join(f'{key} = ?' for key in keys)} WHERE {pk} = ?"
+        for i in range(0, len(rows), batch_size):
+            db.executemany(update, [
+                tuple(normalize_search_key(row[field]) for field in fields) + (row[pk],)
+                for row in rows[i:i + batch_size]
+            ])
+        updated += len(rows)
+        invalidate_count_cache(table)
+    return updated
+
+# Поисковые индексы FTS5: таблица -> параметры индекса.
+# Индексы внешнего содержимого (content=таблица) синхронизируются триггерами
+# и строятся по нормализованным ключам поиска.
+# match: 'prefix' - слова запроса ищутся как префиксы слов с ранжированием,
+#        'substring' - запрос ищется как подстрока (триграммный индекс).
+SEARCH_INDEXES = {
+    'patients': {
+        'fts_table': 'patients_fts',
+        'primary_key': 'patient_id',
+        'columns': ('fio_key', 'diagnosis_key', 'attending_doctor_key'),
+        'tokenizer': 'unicode61 remove_diacritics 2',
+        'match': 'prefix',
+    },
+    'medicines': {
+        'fts_table': 'medicines_trgm',
+        'primary_key': 'medicine_id',
+        'columns': ('trade_name_vk_key', 'standardized_mnn_key', 'section_key'),
+        'tokenizer': 'trigram',
+        'match': 'substring',
+    },
+}
+
+# Минимальная длина запроса для поиска по триграммному индексу
+TRIGRAM_MIN_LENGTH = 3
+
+_search_index_ready = {}
+
+def create_search_indexes(db):
+    """
+    Создание полнотекстовых индексов и триггеров их синхронизации.
+    
+    Вновь созданный индекс заполняется из существующих данных. Если SQLite
+    собран без FTS5, поиск продолжает работать через LIKE.
+    
+    Args:
+        db: Соединение с базой данных
+    """
+    for table, index in SEARCH_INDEXES.items():
+        fts = index['fts_table']
+        pk = index['primary_key']
+        columns = ', '.join(index['columns'])
+        new_values = ', '.join(f"new.{column}" for column in index['columns'])
+        old_values = ', '.join(f"old.{column}" for column in index['columns'])
+        
+        exists = db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (fts,)
+        ).fetchone() is not None
+        
+        # Индекс с другим набором колонок пересоздаётся вместе с триггерами
+        if exists:
+            indexed = tuple(row['name'] for row in db.execute(f"PRAGMA table_info({fts})"))
+            if indexed != tuple(index['columns']):
+                for suffix in ('ai', 'ad', 'au'):
+                    db.execute(f"DROP TRIGGER IF EXISTS {fts}_{suffix}")
+                db.execute(f"DROP TABLE {fts}")
+                exists = False
+        
+        try:
+            db.execute(f"""
+                CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                    {columns}, content='{table}', content_rowid='{pk}', tokenize='{index['tokenizer']}'
+                )
+            """)
+        except sqlite3.OperationalError:
+            _search_index_ready[table] = False  # SQLite без поддержки FTS5 или токенизатора
+            continue
+        
+        db.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN
+                INSERT INTO {fts} (rowid, {columns}) VALUES (new.{pk}, {new_values});
+            END
+        """)
+        db.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {columns}) VALUES ('delete', old.{pk}, {old_values});
+            END
+        """)
+        db.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {columns} ON {table} BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {columns}) VALUES ('delete', old.{pk}, {old_values});
+                INSERT INTO {fts} (rowid, {columns}) VALUES (new.{pk}, {new_values});
+            END
+        """)
+        
+        if not exists:
+            db.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+        _search_index_ready[table] = True
+
+def rebuild_search_index(table):
+    """Полная перестройка полнотекстового индекса таблицы из её данных."""
+    fts = SEARCH_INDEXES[table]['fts_table']
+    execute_update(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+
+def search_index_available(table):
+    """Проверка наличия полнотекстового индекса для таблицы."""
+    if table not in SEARCH_INDEXES:
+        return False
+    if table not in _search_index_ready:
+        row = fetch_one(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+            (SEARCH_INDEXES[table]['fts_table'],)
+        )
+        _search_index_ready[table] = row is not None
+    return _search_index_ready[table]
+
+def build_fulltext_query(search_term, columns=None, mode='prefix'):
+    """
+    Преобразование поискового запроса в выражение FTS5 MATCH.
+    
+    В режиме 'prefix' каждое слово запроса ищется как префикс слова в индексе,
+    все слова должны присутствовать в записи. В режиме 'substring' весь запрос
+    ищется как подстрока по триграммному индексу.
+    
+    Args:
+        search_term: Поисковый запрос
+        columns: Поля, которыми ограничивается поиск (None - все поля индекса)
+        mode: Режим сопоставления ('prefix' или 'substring')
+    
+    Returns:
+        str: Выражение MATCH или None, если запрос нельзя выполнить по индексу
+    """
+    if mode == 'substring':
+        term = search_term.strip()
+        if len(term) < TRIGRAM_MIN_LENGTH:
+            return None
+        match = '"' + term.replace('"', '""') + '"'
+    else:
+        tokens = re.findall(r'\w+', search_term)
+        if not tokens:
+            return None
+        match = ' '.join(f'"{token}"*' for token in tokens)
+    
+    if columns:
+        match = '{' + ' '.join(columns) + '} : (' + match + ')'
+    return match
+
 def insert_sample_data():
     """Вставка примерных данных для демонстрации с новым форматом."""
     db = get_db()
@@ -159,6 +636,7 @@ def insert_sample_data():
             VALUES (?, ?, ?, ?)
         ''', dispensing)
     
+    refresh_search_keys(db)
     db.commit()
 
 def execute_query(query, params=None):
@@ -170,16 +648,110 @@ def execute_query(query, params=None):
         cursor = db.execute(query)
     return cursor
 
-def execute_update(query, params=None):
-    """Выполнение SQL-запроса на изменение данных."""
+@contextmanager
+def transaction(immediate=False):
+    """
+    Явная транзакция на соединении текущего запроса.
+    
+    Вложенный вызов открывает точку сохранения (SAVEPOINT): ошибка внутри неё
+    откатывает только её изменения. execute_update, bulk_insert и методы
+    save()/delete() моделей внутри транзакции не фиксируют изменения
+    сами - фиксация выполняется одна, при выходе из внешнего блока.
+    
+    Args:
+        immediate (bool): Захватить блокировку записи сразу (BEGIN IMMEDIATE),
+            чтобы данные, прочитанные для проверки, не изменились до записи
+    
+    Yields:
+        sqlite3.Connection: Соединение транзакции
+    """
     db = get_db()
+    depth = g.get('transaction_depth', 0)
+    if depth == 0:
+        if db.in_transaction:
+            db.commit()
+        db.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        g.transaction_callbacks = []
+    else:
+        db.execute(f"SAVEPOINT transaction_{depth}")
+    g.transaction_depth = depth + 1
+    
+    try:
+        yield db
+    except BaseException:
+        g.transaction_depth = depth
+        if depth == 0:
+            g.pop('transaction_callbacks', None)
+            db.rollback()
+        else:
+            db.execute(f"ROLLBACK TO transaction_{depth}")
+            db.execute(f"RELEASE transaction_{depth}")
+        # Объекты карты могли получить откатываемые изменения
+        forget_identities()
+        raise
+    
+    g.transaction_depth = depth
+    if depth > 0:
+        db.execute(f"RELEASE transaction_{depth}")
+        return
+    
+    callbacks = g.pop('transaction_callbacks', [])
+    try:
+        db.commit()
+    except sqlite3.Error:
+        db.rollback()
+        forget_identities()
+        raise
+    for callback, args in callbacks:
+        callback(*args)
+
+def in_transaction():
+    """Открыта ли явная транзакция (transaction()) в текущем запросе."""
+    return g.get('transaction_depth', 0) > 0
+
+def after_commit(callback, *args):
+    """
+    Вызов callback(*args) после фиксации изменений.
+    
+    Внутри transaction() вызов откладывается до фиксации внешней транзакции
+    и отменяется при её откате, иначе выполняется сразу. Используется для
+    сброса кэшей, чтобы другие запросы не закэшировали данные, которые
+    ещё не зафиксированы.
+    """
+    if in_transaction():
+        g.transaction_callbacks.append((callback, args))
+    else:
+        callback(*args)
+
+def _execute_statement(db, query, params=None):
+    """Выполнение изменяющего запроса на соединении db без фиксации; возвращает количество строк."""
     if params:
         cursor = db.execute(query, params)
     else:
         cursor = db.execute(query)
-    db.commit()
     return cursor.rowcount
 
+def execute_update(query, params=None):
+    """
+    Выполнение SQL-запроса на изменение данных.
+    
+    Вне явной транзакции запрос выполняет поток-писатель (get_write_queue),
+    возврат происходит после фиксации; внутри transaction() запрос выполняется
+    на соединении запроса и фиксируется вместе с транзакцией.
+    """
+    writer = _request_writer()
+    if writer is not None:
+        rowcount = writer.execute(_execute_statement, query, params)
+    else:
+        db = get_db()
+        rowcount = _execute_statement(db, query, params)
+        if not in_transaction():
+            db.commit()
+    table = _written_table(query)
+    forget_identities(table)
+    after_commit(invalidate_count_cache, table)
+    return rowcount
+
 def fetch_one(query, params=None):
     """Получение одной записи из базы данных."""
     cursor = execute_query(query, params)
@@ -190,44 +762,256 @@ def fetch_all(query, params=None):
     cursor = execute_query(query, params)
     return cursor.fetchall()
 
-def fetch_paginated(query, params=None, page=1, per_page=10):
+def fetch_chunks(query, params=None, chunk_size=None, as_tuples=False):
     """
-    Получение записей с поддержкой пагинации для работы с большими объемами данных.
+    Чтение результата запроса частями без загрузки всех строк в память.
+    
+    Args:
+        query: SQL-запрос
+        params: Параметры запроса
+        chunk_size: Количество строк в одной части (по умолчанию DB_FETCH_ARRAYSIZE)
+        as_tuples: Возвращать строки кортежами вместо sqlite3.Row
+    
+    Yields:
+        list: Очередные chunk_size строк результата
+    """
+    cursor = get_db().cursor()
+    if as_tuples:
+        cursor.row_factory = None
+    cursor.arraysize = chunk_size or current_app.config.get('DB_FETCH_ARRAYSIZE', 500)
+    try:
+        cursor.execute(query, params or ())
+        while True:
+            rows = cursor.fetchmany()
+            if not rows:
+                break
+            yield rows
+    finally:
+        cursor.close()
+
+def fetch_iter(query, params=None, arraysize=None, as_tuples=False):
+    """
+    Ленивый перебор строк результата запроса.
+    
+    Строки читаются из курсора пакетами по arraysize, в памяти одновременно
+    находится не более одного пакета.
     
     Args:
         query: SQL-запрос
+        params: Параметры запроса
+        arraysize: Размер пакета чтения (по умолчанию DB_FETCH_ARRAYSIZE)
+        as_tuples: Возвращать строки кортежами вместо sqlite3.Row
+    
+    Yields:
+        Очередная строка результата
+    """
+    for rows in fetch_chunks(query, params, arraysize, as_tuples):
+        yield from rows
+
+# Стратегии подсчёта общего количества записей при пагинации
+COUNT_EXACT = 'exact'        # COUNT(*) на каждый запрос страницы
+COUNT_CACHED = 'cached'      # COUNT(*) с кэшированием до записи в таблицу
+COUNT_ESTIMATE = 'estimate'  # Оценка по статистике таблицы без сканирования
+COUNT_NONE = 'none'          # Без подсчёта: has_next определяется по LIMIT n+1
+COUNT_STRATEGIES = (COUNT_EXACT, COUNT_CACHED, COUNT_ESTIMATE, COUNT_NONE)
+
+_count_cache = {}
+_count_cache_lock = threading.Lock()
+_table_versions = {}
+
+_WRITE_TABLE_RE = re.compile(
+    r'^\s*(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)\s+(\w+)',
+    re.IGNORECASE
+)
+_READ_TABLES_RE = re.compile(r'\b(?:FROM|JOIN)\s+(\w+)', re.IGNORECASE)
+_WHOLE_TABLE_RE = re.compile(r'^\s*SELECT\s+\*\s+FROM\s+(\w+)(?:\s+ORDER\s+BY\s+[\w\s,]+)?\s*$', re.IGNORECASE)
+
+def _written_table(query):
+    """Определение таблицы, изменяемой SQL-запросом."""
+    match = _WRITE_TABLE_RE.match(query)
+    return match.group(1).lower() if match else None
+
+def invalidate_count_cache(table=None):
+    """
+    Сброс закэшированных количеств записей.
+    
+    Args:
+        table: Изменённая таблица; None - сбросить весь кэш
+    """
+    with _count_cache_lock:
+        if table is None:
+            _count_cache.clear()
+        else:
+            _table_versions[table] = _table_versions.get(table, 0) + 1
+
+def _table_snapshot(tables):
+    """Текущие версии таблиц для проверки актуальности кэша."""
+    return tuple(_table_versions.get(table, 0) for table in tables)
+
+def count_cached(query, params=None):
+    """
+    Подсчёт количества записей запроса с кэшированием.
+    
+    Значение хранится до записи в любую из таблиц запроса в этом процессе,
+    но не дольше PAGINATION_COUNT_CACHE_TTL секунд (записи других процессов).
+    
+    Args:
+        query: SQL-запрос
+        params: Параметры для запроса
+    
+    Returns:
+        int: Количество записей
+    """
+    key = (query, tuple(params) if params else ())
+    tables = tuple(sorted({table.lower() for table in _READ_TABLES_RE.findall(query)}))
+    ttl = current_app.config.get('PAGINATION_COUNT_CACHE_TTL', 60)
+    now = time.monotonic()
+    
+    with _count_cache_lock:
+        entry = _count_cache.get(key)
+        if entry is not None:
+            total, snapshot, stored_at = entry
+            if snapshot == _table_snapshot(tables) and now - stored_at < ttl:
+                return total
+        snapshot = _table_snapshot(tables)
+    
+    total = fetch_one(f"SELECT COUNT(*) FROM ({query})", params)[0]
+    
+    with _count_cache_lock:
+        _count_cache.pop(key, None)
+        _count_cache[key] = (total, snapshot, now)
+        max_entries = current_app.config.get('PAGINATION_COUNT_CACHE_SIZE', 1024)
+        while len(_count_cache) > max_entries:
+            _count_cache.pop(next(iter(_count_cache)))
+    return total
+
+def count_estimate(query, params=None):
+    """
+    Оценка количества записей без сканирования таблицы.
+    
+    Для выборки всей таблицы используется статистика sqlite_stat1 (после
+    ANALYZE), а при её отсутствии - максимальный rowid. Запросы с условиями
+    оценить нельзя, для них используется кэшированный точный подсчёт.
+    
+    Args:
+        query: SQL-запрос
+        params: Параметры для запроса
+    
+    Returns:
+        tuple: (количество записей, является ли значение оценкой)
+    """
+    match = _WHOLE_TABLE_RE.match(query)
+    if not match:
+        return count_cached(query, params), False
+    
+    table = match.group(1)
+    try:
+        row = fetch_one("SELECT stat FROM sqlite_stat1 WHERE tbl = ? LIMIT 1", (table,))
+    except sqlite3.OperationalError:
+        row = None  # ANALYZE ещё не выполнялся
+    if row and row['stat']:
+        return int(row['stat'].split()[0]), True
+    
+    row = fetch_one(f"SELECT COALESCE(MAX(rowid), 0) FROM {table}")
+    return row[0], True
+
+def project_columns(query, columns):
+    """
+    Ограничение результата запроса перечисленными столбцами.
+    
+    Запрос оборачивается во внешний SELECT, который SQLite разворачивает в
+    исходный: при выборке только проиндексированных столбцов строки читаются
+    из покрывающего индекса без обращения к таблице.
+    
+    Args:
+        query: SQL-запрос
+        columns: Имена столбцов результата
+    
+    Returns:
+        str: Запрос, возвращающий только columns
+    
+    Raises:
+        ValueError: Если список столбцов пуст или содержит не имя столбца
+    """
+    columns = list(dict.fromkeys(columns))
+    if not columns or not all(re.fullmatch(r'\w+', column) for column in columns):
+        raise ValueError(f"Некорректный список столбцов: {columns}")
+    return f"SELECT {', '.join(columns)} FROM ({query})"
+
+def fetch_paginated(query, params=None, page=1, per_page=10, keyset=None, cursor=None, count=COUNT_EXACT,
+                    columns=None):
+    """
+    Получение записей с поддержкой пагинации для работы с большими объемами данных.
+    
+    По умолчанию используется пагинация через LIMIT/OFFSET. Если передан keyset,
+    используется курсорная (keyset) пагинация: каждая страница - это поиск по
+    индексу от ключа последней записи, стоимость не зависит от номера страницы.
+    
+    Args:
+        query: SQL-запрос (в режиме keyset - без ORDER BY)
         params: Параметры для запроса
         page: Номер страницы (начиная с 1)
         per_page: Количество записей на странице
+        keyset: Ключ сортировки для курсорной пагинации (см. build_keyset)
+        cursor: Токен курсора (None или пустая строка - первая страница)
+        count: Стратегия подсчёта общего количества записей (COUNT_STRATEGIES);
+            в режиме keyset подсчёт не выполняется
+        columns: Столбцы записей страницы (None - все столбцы запроса)
     
     Returns:
         dict: Словарь с данными пагинации
     """
+    if keyset is not None:
+        return fetch_keyset_paginated(query, params, keyset, cursor, per_page, columns)
+    
+    if count not in COUNT_STRATEGIES:
+        raise ValueError(f"Неизвестная стратегия подсчёта записей: {count}")
+    
     # Подсчет общего количества записей
-    count_query = f"SELECT COUNT(*) FROM ({query})"
-    total = fetch_one(count_query, params)[0]
+    total = None
+    total_is_estimate = False
+    if count == COUNT_EXACT:
+        count_query = f"SELECT COUNT(*) FROM ({query})"
+        total = fetch_one(count_query, params)[0]
+    elif count == COUNT_CACHED:
+        total = count_cached(query, params)
+    elif count == COUNT_ESTIMATE:
+        total, total_is_estimate = count_estimate(query, params)
     
     # Вычисление смещения
     offset = (page - 1) * per_page
     
-    # Добавление LIMIT и OFFSET к основному запросу
-    paginated_query = f"{query} LIMIT ? OFFSET ?"
+    # Добавление LIMIT и OFFSET к основному запросу; без подсчёта запрашиваем
+    # на одну запись больше, чтобы узнать о наличии следующей страницы
+    limit = per_page + 1 if total is None or total_is_estimate else per_page
+    page_query = project_columns(query, columns) if columns else query
+    paginated_query = f"{page_query} LIMIT ? OFFSET ?"
     if params:
-        paginated_params = list(params) + [per_page, offset]
+        paginated_params = list(params) + [limit, offset]
     else:
-        paginated_params = [per_page, offset]
+        paginated_params = [limit, offset]
     
     # Получение данных для текущей страницы
     items = fetch_all(paginated_query, paginated_params)
     
     # Вычисление информации о пагинации
-    total_pages = (total + per_page - 1) // per_page
     has_prev = page > 1
-    has_next = page < total_pages
+    if total is None or total_is_estimate:
+        has_next = len(items) > per_page
+        items = items[:per_page]
+    if total is None:
+        total_pages = None
+    else:
+        total_pages = (total + per_page - 1) // per_page
+        if total_is_estimate:
+            total_pages = max(total_pages, page + 1 if has_next else page)
+        else:
+            has_next = page < total_pages
     
     return {
         'items': items,
         'total': total,
+        'total_is_estimate': total_is_estimate,
         'page': page,
         'per_page': per_page,
         'total_pages': total_pages,
@@ -237,7 +1021,133 @@ def fetch_paginated(query, params=None, page=1, per_page=10):
         'next_num': page + 1 if has_next else None
     }
 
-def search_with_pagination(table, search_fields, search_term, page=1, per_page=10, order_by=None):
+def build_keyset(order_by, primary_key):
+    """
+    Построение ключа курсорной пагинации из выражения сортировки.
+    
+    Первичный ключ добавляется последним столбцом ключа, чтобы порядок записей
+    был однозначным при совпадающих значениях сортировки.
+    
+    Args:
+        order_by: Поле сортировки, например "fio" или "dispensing_date DESC"
+        primary_key: Первичный ключ таблицы
+    
+    Returns:
+        list: Список кортежей (столбец, по убыванию)
+    
+    Raises:
+        ValueError: Если выражение сортировки не поддерживается
+    """
+    match = re.fullmatch(r'\s*(\w+)(?:\s+(ASC|DESC))?\s*', order_by, re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Неподдерживаемая сортировка для курсорной пагинации: {order_by}")
+    
+    column, direction = match.group(1), (match.group(2) or 'ASC').upper()
+    descending = direction == 'DESC'
+    
+    keyset = [(column, descending)]
+    if column != primary_key:
+        keyset.append((primary_key, descending))
+    return keyset
+
+def encode_cursor(row, keyset, direction):
+    """Формирование непрозрачного токена курсора из ключа записи."""
+    payload = [direction] + [row[column] for column, _ in keyset]
+    data = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor, keyset):
+    """
+    Разбор токена курсора.
+    
+    Returns:
+        tuple: (направление 'next' или 'prev', список значений ключа)
+    
+    Raises:
+        ValueError: Если токен повреждён или не соответствует ключу сортировки
+    """
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(data.decode('utf-8'))
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Некорректный курсор пагинации")
+    
+    if (not isinstance(payload, list) or len(payload) != len(keyset) + 1
+            or payload[0] not in ('next', 'prev')):
+        raise ValueError("Некорректный курсор пагинации")
+    # Значения ключа подставляются в запрос, поэтому допускаются только скаляры
+    if not all(value is None or isinstance(value, (str, int, float)) for value in payload[1:]):
+        raise ValueError("Некорректный курсор пагинации")
+    return payload[0], payload[1:]
+
+def fetch_keyset_paginated(query, params, keyset, cursor=None, per_page=10, columns=None):
+    """
+    Курсорная (keyset) пагинация.
+    
+    Args:
+        query: SQL-запрос без ORDER BY
+        params: Параметры для запроса
+        keyset: Ключ сортировки (см. build_keyset); все столбцы в одном направлении
+        cursor: Токен курсора из next_cursor/prev_cursor предыдущего ответа
+        per_page: Количество записей на странице
+        columns: Столбцы записей страницы (None - все); столбцы ключа добавляются всегда
+    
+    Returns:
+        dict: Данные страницы с токенами next_cursor и prev_cursor
+    """
+    descending = keyset[0][1]
+    if any(desc != descending for _, desc in keyset):
+        raise ValueError("Курсорная пагинация требует единого направления сортировки")
+    
+    direction, values = decode_cursor(cursor, keyset) if cursor else ('next', None)
+    backward = direction == 'prev'
+    
+    # При движении назад сортировка и сравнение инвертируются
+    scan_descending = descending != backward
+    key_columns = ', '.join(column for column, _ in keyset)
+    order = ' DESC' if scan_descending else ''
+    
+    if columns:
+        keyset_query = project_columns(query, list(columns) + [column for column, _ in keyset])
+    else:
+        keyset_query = f"SELECT * FROM ({query})"
+    keyset_params = list(params) if params else []
+    if values is not None:
+        placeholders = ', '.join('?' for _ in keyset)
+        operator = '<' if scan_descending else '>'
+        keyset_query += f" WHERE ({key_columns}) {operator} ({placeholders})"
+        keyset_params += values
+    keyset_query += " ORDER BY " + ', '.join(f"{column}{order}" for column, _ in keyset)
+    keyset_query += " LIMIT ?"
+    keyset_params.append(per_page + 1)
+    
+    rows = fetch_all(keyset_query, keyset_params)
+    has_more = len(rows) > per_page
+    items = rows[:per_page]
+    
+    if backward:
+        items.reverse()
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = values is not None, has_more
+    
+    return {
+        'items': items,
+        'total': None,
+        'total_is_estimate': False,
+        'page': None,
+        'per_page': per_page,
+        'total_pages': None,
+        'has_prev': has_prev and bool(items),
+        'has_next': has_next and bool(items),
+        'prev_num': None,
+        'next_num': None,
+        'prev_cursor': encode_cursor(items[0], keyset, 'prev') if has_prev and items else None,
+        'next_cursor': encode_cursor(items[-1], keyset, 'next') if has_next and items else None
+    }
+
+def search_with_pagination(table, search_fields, search_term, page=1, per_page=10, order_by=None, count=COUNT_EXACT,
+                           columns=None):
     """
     Поиск записей с пагинацией для оптимизации работы с большими объемами данных.
     
@@ -248,20 +1158,53 @@ def search_with_pagination(table, search_fields, search_term, page=1, per_page=1
         page: Номер страницы
         per_page: Количество записей на странице
         order_by: Поле для сортировки
+        count: Стратегия подсчёта общего количества записей
+        columns: Столбцы записей результата (None - все столбцы таблицы)
     
     Returns:
         dict: Результаты поиска с пагинацией
+    
+    Поиск ведётся без учёта регистра по нормализованным ключам полей
+    (SEARCH_KEY_FIELDS). Если для таблицы есть поисковый индекс (SEARCH_INDEXES),
+    поиск идёт по нему: для пациентов слова запроса ищутся как префиксы слов с
+    упорядочиванием по релевантности, для препаратов - как подстрока по
+    триграммному индексу. Слишком короткие для триграммного индекса запросы
+    ищутся как подстрока ключей через LIKE.
     """
     if not search_term:
         query = f"SELECT * FROM {table}"
         if order_by:
             query += f" ORDER BY {order_by}"
-        return fetch_paginated(query, None, page, per_page)
+        return fetch_paginated(query, None, page, per_page, count=count, columns=columns)
+    
+    key_fields = SEARCH_KEY_FIELDS.get(table, ())
+    if set(search_fields) <= set(key_fields):
+        search_fields = [search_key_column(field) for field in search_fields]
+        search_term = normalize_search_key(search_term)
+    
+    index = SEARCH_INDEXES.get(table)
+    if index and set(search_fields) <= set(index['columns']) and search_index_available(table):
+        match_columns = None if set(search_fields) == set(index['columns']) else search_fields
+        match = build_fulltext_query(search_term, match_columns, index['match'])
+        if match:
+            fts = index['fts_table']
+            query = (
+                f"SELECT {table}.* FROM {fts} "
+                f"JOIN {table} ON {table}.{index['primary_key']} = {fts}.rowid "
+                f"WHERE {fts} MATCH ?"
+            )
+            order_terms = [f"{fts}.rank"] if index['match'] == 'prefix' else []
+            if order_by:
+                order_terms.append(f"{table}.{order_by}")
+            if order_terms:
+                query += " ORDER BY " + ", ".join(order_terms)
+            return fetch_paginated(query, [match], page, per_page, count=count, columns=columns)
     
     # Создание условий поиска
     search_conditions = []
     params = []
     
+    # Короткий для триграммного индекса запрос ищется как подстрока нормализованных ключей
     for field in search_fields:
         search_conditions.append(f"{field} LIKE ?")
         params.append(f"%{search_term}%")
@@ -272,7 +1215,12 @@ def search_with_pagination(table, search_fields, search_term, page=1, per_page=1
     if order_by:
         query += f" ORDER BY {order_by}"
     
-    return fetch_paginated(query, params, page, per_page)
+    return fetch_paginated(query, params, page, per_page, count=count, columns=columns)
+
+def _insert_batches(db, query, data_list, batch_size):
+    """Вставка строк пакетами для оптимизации памяти (без фиксации)."""
+    for i in range(0, len(data_list), batch_size):
+        db.executemany(query, data_list[i:i + batch_size])
 
 def bulk_insert(table, columns, data_list, batch_size=1000):
     """
@@ -283,18 +1231,32 @@ def bulk_insert(table, columns, data_list, batch_size=1000):
         columns: Список названий колонок
         data_list: Список кортежей с данными
         batch_size: Размер пакета для вставки
+    
+    Для таблиц с ключами поиска (SEARCH_KEY_FIELDS) нормализованные ключи
+    вычисляются и вставляются вместе с данными.
     """
-    db = get_db()
+    key_fields = [field for field in SEARCH_KEY_FIELDS.get(table, ()) if field in columns]
+    if key_fields:
+        positions = [list(columns).index(field) for field in key_fields]
+        data_list = [
+            tuple(row) + tuple(normalize_search_key(row[position]) for position in positions)
+            for row in data_list
+        ]
+        columns = list(columns) + [search_key_column(field) for field in key_fields]
     
     placeholders = ', '.join(['?' for _ in columns])
     query = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
     
-    # Обработка данных пакетами для оптимизации памяти
-    for i in range(0, len(data_list), batch_size):
-        batch = data_list[i:i + batch_size]
-        db.executemany(query, batch)
-    
-    db.commit()
+    writer = _request_writer()
+    if writer is not None:
+        writer.execute(_insert_batches, query, data_list, batch_size)
+    else:
+        db = get_db()
+        _insert_batches(db, query, data_list, batch_size)
+        if not in_transaction():
+            db.commit()
+    forget_identities(table)
+    after_commit(invalidate_count_cache, table)
 
 def create_indexes_for_performance():
     """Создание дополнительных индексов для улучшения производительности."""
@@ -302,10 +1264,12 @@ def create_indexes_for_performance():
     
     # Композитные индексы для частых запросов
     indexes = [
-        'CREATE INDEX IF NOT EXISTS idx_patients_fio_diagnosis ON patients (fio, diagnosis)',
         'CREATE INDEX IF NOT EXISTS idx_medicines_mnn_trade ON medicines (standardized_mnn, trade_name_vk)',
         'CREATE INDEX IF NOT EXISTS idx_prescriptions_date_patient ON prescriptions (prescription_date, patient_id)',
         'CREATE INDEX IF NOT EXISTS idx_dispensings_date_patient ON dispensings (dispensing_date, patient_id)',
+        # Индексы для курсорной пагинации назначений и выдач пациента
+        'CREATE INDEX IF NOT EXISTS idx_prescriptions_patient_date ON prescriptions (patient_id, prescription_date)',
+        'CREATE INDEX IF NOT EXISTS idx_dispensings_patient_date ON dispensings (patient_id, dispensing_date)',
         'CREATE INDEX IF NOT EXISTS idx_medicines_price ON medicines (price)',
         'CREATE INDEX IF NOT EXISTS idx_patients_birth_year ON patients (birth_year)',
     ]
@@ -0,0 +1,86 @@
+"""
+Модуль карты идентичности объектов моделей в пределах запроса.
+"""
+
+from flask import g, has_app_context
+
+
+class IdentityMap:
+    """
+    Карта загруженных объектов: таблица -> {первичный ключ: объект}.
+
+    Повторная загрузка записи в том же запросе возвращает тот же объект без
+    обращения к базе данных. Отсутствие записи тоже запоминается (значение None),
+    чтобы повторная проверка несуществующего ID не выполняла запрос.
+    """
+
+    def __init__(self):
+        self._tables = {}
+        self._stats = {'hits': 0, 'misses': 0}
+
+    def lookup(self, table, ids):
+        """
+        Поиск объектов в карте.
+
+        Args:
+            table (str): Таблица модели
+            ids (iterable): Первичные ключи
+
+        Returns:
+            tuple: (словарь найденных в карте ключей -> объект или None, список отсутствующих в карте ключей)
+        """
+        entries = self._tables.get(table, {})
+        found, missing = {}, []
+        for record_id in ids:
+            if record_id in entries:
+                found[record_id] = entries[record_id]
+            else:
+                missing.append(record_id)
+        self._stats['hits'] += len(found)
+        self._stats['misses'] += len(missing)
+        return found, missing
+
+    def add(self, table, record_id, obj):
+        """Запоминание объекта (или None для отсутствующей записи)."""
+        self._tables.setdefault(table, {})[record_id] = obj
+
+    def forget(self, table=None):
+        """
+        Сброс объектов таблицы после её изменения.
+
+        Args:
+            table (str): Изменённая таблица; None - сбросить всю карту
+        """
+        if table is None:
+            self._tables.clear()
+        else:
+            self._tables.pop(table, None)
+
+    def stats(self):
+        """
+        Статистика работы карты.
+
+        Returns:
+            dict: Счётчики попаданий, промахов и количество объектов в карте
+        """
+        stats = dict(self._stats)
+        stats['size'] = sum(len(entries) for entries in self._tables.values())
+        return stats
+
+def get_identity_map():
+    """
+    Карта идентичности текущего контекста приложения.
+
+    Returns:
+        IdentityMap: Карта, создаваемая при первом обращении; None вне контекста приложения
+    """
+    if not has_app_context():
+        return None
+    if 'identity_map' not in g:
+        g.identity_map = IdentityMap()
+    return g.identity_map
+
+def forget_identities(table=None):
+    """Сброс объектов изменённой таблицы (None - всех таблиц) в карте текущего контекста."""
+    if has_app_context() and 'identity_map' in g:
+        g.identity_map.forget(table)
@@ -1,4 +1,6 @@
 from database import execute_update, fetch_one, fetch_all
+from autocomplete import patient_index, medicine_index
+from cache import patient_summary_cache
 
 class Patient:
     def __init__(self, patient_id=None, fio=None, birth_year=None, diagnosis=None, attending_doctor=None):
@@ -12,13 +14,16 @@ class Patient:
         if self.patient_id is None:
             query = "INSERT INTO patients (fio, birth_year, diagnosis, attending_doctor) VALUES (?, ?, ?, ?)"
             execute_update(query, (self.fio, self.birth_year, self.diagnosis, self.attending_doctor))
+            patient_index.note_insert()
         else:
             query = "UPDATE patients SET fio = ?, birth_year = ?, diagnosis = ?, attending_doctor = ? WHERE patient_id = ?"
             execute_update(query, (self.fio, self.birth_year, self.diagnosis, self.attending_doctor, self.patient_id))
+            patient_index.note_update(self.patient_id)
 
     def delete(self):
         query = "DELETE FROM patients WHERE patient_id = ?"
         execute_update(query, (self.patient_id,))
+        patient_index.note_delete(self.patient_id)
 
     @staticmethod
     def get_by_id(patient_id):
@@ -51,13 +56,18 @@ class Medicine:
         if self.medicine_id is None:
             query = "INSERT INTO medicines (smmn_node_code, section, standardized_mnn, trade_name_vk, standardized_dosage_form, standardized_dosage, characteristic, packaging, price) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
             execute_update(query, (self.smmn_node_code, self.section, self.standardized_mnn, self.trade_name_vk, self.standardized_dosage_form, self.standardized_dosage, self.characteristic, self.packaging, self.price))
+            medicine_index.note_insert()
         else:
             query = "UPDATE medicines SET smmn_node_code = ?, section = ?, standardized_mnn = ?, trade_name_vk = ?, standardized_dosage_form = ?, standardized_dosage = ?, characteristic = ?, packaging = ?, price = ? WHERE medicine_id = ?"
             execute_update(query, (self.smmn_node_code, self.section, self.standardized_mnn, self.trade_name_vk, self.standardized_dosage_form, self.standardized_dosage, self.characteristic, self.packaging, self.price, self.medicine_id))
+            medicine_index.note_update(self.medicine_id)
+            # Название и цена препарата входят в сводки пациентов
+            patient_summary_cache.clear()
 
     def delete(self):
         query = "DELETE FROM medicines WHERE medicine_id = ?"
         execute_update(query, (self.medicine_id,))
+        medicine_index.note_delete(self.medicine_id)
 
     @staticmethod
     def get_by_id(medicine_id):
@@ -87,13 +97,17 @@ class Prescription:
         if self.prescription_id is None:
             query = "INSERT INTO prescriptions (patient_id, medicine_id, prescription_date, quantity_packs, daily_dose, treatment_days) VALUES (?, ?, ?, ?, ?, ?)"
             execute_update(query, (self.patient_id, self.medicine_id, self.prescription_date, self.quantity_packs, self.daily_dose, self.treatment_days))
+            patient_summary_cache.invalidate(self.patient_id)
         else:
             query = "UPDATE prescriptions SET patient_id = ?, medicine_id = ?, prescription_date = ?, quantity_packs = ?, daily_dose = ?, treatment_days = ? WHERE prescription_id = ?"
             execute_update(query, (self.patient_id, self.medicine_id, self.prescription_date, self.quantity_packs, self.daily_dose, self.treatment_days, self.prescription_id))
+            # Назначение могло быть перенесено к другому пациенту
+            patient_summary_cache.clear()
 
     def delete(self):
         query = "DELETE FROM prescriptions WHERE prescription_id = ?"
         execute_update(query, (self.prescription_id,))
+        patient_summary_cache.invalidate(self.patient_id)
 
     @staticmethod
     def get_by_id(prescription_id):
@@ -128,13 +142,17 @@ class Dispensing:
         if self.dispensing_id is None:
             query = "INSERT INTO dispensings (patient_id, medicine_id, dispensing_date, quantity_packs) VALUES (?, ?, ?, ?)"
             execute_update(query, (self.patient_id, self.medicine_id, self.dispensing_date, self.quantity_packs))
+            patient_summary_cache.invalidate(self.patient_id)
         else:
             query = "UPDATE dispensings SET patient_id = ?, medicine_id = ?, dispensing_date = ?, quantity_packs = ? WHERE dispensing_id = ?"
             execute_update(query, (self.patient_id, self.medicine_id, self.dispensing_date, self.quantity_packs, self.dispensing_id))
+            # Выдача могла быть перенесена к другому пациенту
+            patient_summary_cache.clear()
 
     def delete(self):
         query = "DELETE FROM dispensings WHERE dispensing_id = ?"
         execute_update(query, (self.dispensing_id,))
+        patient_summary_cache.invalidate(self.patient_id)
 
     @staticmethod
     def get_by_id(dispensing_id):
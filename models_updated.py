@@ -1,64 +1,182 @@
-from database_updated import execute_update, fetch_one, fetch_all, fetch_paginated, search_with_pagination, bulk_insert
+from autocomplete import patient_index, medicine_index
+from cache import patient_summary_cache
+from identity_map import get_identity_map
+from database_updated import execute_update, fetch_all, fetch_iter, fetch_paginated, search_with_pagination, bulk_insert, build_keyset, project_columns, after_commit, normalize_search_key, COUNT_EXACT
+
+class _RowModel:
+    """
+    Базовый класс моделей с хранением полей в слотах.
+
+    Поля модели перечисляются в __slots__ подкласса, поэтому у объектов нет
+    __dict__. Построение объектов из строк выборки идёт через дескрипторы
+    слотов напрямую, минуя __init__; позиции колонок определяются один раз
+    на выборку. Объект, построенный по выборке части столбцов, заполнен только
+    ими и предназначен для чтения, а не для save().
+    """
+    __slots__ = ()
+
+    # Максимальное количество ключей в одном запросе get_many
+    GET_MANY_BATCH_SIZE = 500
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Пары (имя поля, запись в слот), вычисляемые один раз для класса
+        cls._setters = tuple((name, getattr(cls, name).__set__) for name in cls.__slots__)
+
+    @classmethod
+    def from_row(cls, row):
+        """
+        Построение объекта из строки выборки.
+
+        Args:
+            row: Строка sqlite3.Row со всеми полями модели
+
+        Returns:
+            Объект модели
+        """
+        obj = cls.__new__(cls)
+        for name, setter in cls._setters:
+            setter(obj, row[name])
+        return obj
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Ленивое построение объектов из строк одной выборки.
+
+        Индексы колонок вычисляются по первой строке, дальше поля заполняются
+        по позициям без поиска колонок по имени. Поля, которых нет в выборке,
+        остаются незаполненными.
 
-class Patient:
-    def __init__(self, patient_id=None, fio=None, birth_year=None, diagnosis=None, attending_doctor=None):
+        Args:
+            rows (iterable): Строки sqlite3.Row с одинаковым набором колонок
+
+        Yields:
+            Объекты модели
+        """
+        new = cls.__new__
+        plan = None
+        for row in rows:
+            if plan is None:
+                keys = row.keys()
+                plan = tuple((keys.index(name), setter) for name, setter in cls._setters if name in keys)
+            obj = new(cls)
+            for index, setter in plan:
+                setter(obj, row[index])
+            yield obj
+
+    @classmethod
+    def get_many(cls, ids):
+        """
+        Пакетная загрузка объектов по первичным ключам.
+
+        Объекты, уже загруженные в текущем запросе, берутся из карты
+        идентичности; остальные читаются одним запросом WHERE ... IN (...)
+        на каждые GET_MANY_BATCH_SIZE ключей и запоминаются в карте.
+
+        Args:
+            ids (iterable): Первичные ключи; повторы и None допускаются
+
+        Returns:
+            dict: Первичный ключ -> объект для найденных записей в порядке ids
+        """
+        ids = [record_id for record_id in dict.fromkeys(ids) if record_id is not None]
+        identity_map = get_identity_map()
+        if identity_map is not None:
+            found, missing = identity_map.lookup(cls._table, ids)
+        else:
+            found, missing = {}, ids
+
+        primary_key = cls.__slots__[0]
+        for start in range(0, len(missing), cls.GET_MANY_BATCH_SIZE):
+            batch = missing[start:start + cls.GET_MANY_BATCH_SIZE]
+            placeholders = ', '.join('?' for _ in batch)
+            query = f"SELECT * FROM {cls._table} WHERE {primary_key} IN ({placeholders})"
+            loaded = {getattr(obj, primary_key): obj for obj in cls.from_rows(fetch_all(query, batch))}
+            for record_id in batch:
+                found[record_id] = loaded.get(record_id)
+                if identity_map is not None:
+                    identity_map.add(cls._table, record_id, found[record_id])
+
+        return {record_id: found[record_id] for record_id in ids if found[record_id] is not None}
+
+    def to_dict(self):
+        """Заполненные поля объекта в виде словаря (даты - строками в том виде, как они хранятся в базе)."""
+        return {name: getattr(self, name) for name in self.__slots__ if hasattr(self, name)}
+
+class Patient(_RowModel):
+    _table = 'patients'
+    __slots__ = ('patient_id', 'fio', 'birth_year', 'diagnosis', 'attending_doctor', 'created_at', 'updated_at')
+
+    # Поля для выпадающих списков; покрываются индексом idx_patients_fio_diagnosis
+    CHOICE_FIELDS = ('patient_id', 'fio', 'diagnosis')
+
+    def __init__(self, patient_id=None, fio=None, birth_year=None, diagnosis=None, attending_doctor=None,
+                 created_at=None, updated_at=None):
         self.patient_id = patient_id
         self.fio = fio
         self.birth_year = birth_year
         self.diagnosis = diagnosis
         self.attending_doctor = attending_doctor
+        self.created_at = created_at
+        self.updated_at = updated_at
 
     def save(self):
         """Сохранение пациента с обновлением updated_at."""
         if self.patient_id is None:
             query = """
-                INSERT INTO patients (fio, birth_year, diagnosis, attending_doctor)
-                VALUES (?, ?, ?, ?)
+                INSERT INTO patients (fio, birth_year, diagnosis, attending_doctor,
+                                      fio_key, diagnosis_key, attending_doctor_key)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
             """
-            execute_update(query, (self.fio, self.birth_year, self.diagnosis, self.attending_doctor))
+            execute_update(query, (self.fio, self.birth_year, self.diagnosis, self.attending_doctor) + self._search_keys())
+            after_commit(patient_index.note_insert)
         else:
             query = """
                 UPDATE patients 
-                SET fio = ?, birth_year = ?, diagnosis = ?, attending_doctor = ?, updated_at = CURRENT_TIMESTAMP
+                SET fio = ?, birth_year = ?, diagnosis = ?, attending_doctor = ?,
+                    fio_key = ?, diagnosis_key = ?, attending_doctor_key = ?, updated_at = CURRENT_TIMESTAMP
                 WHERE patient_id = ?
             """
-            execute_update(query, (self.fio, self.birth_year, self.diagnosis, self.attending_doctor, self.patient_id))
+            execute_update(query, (self.fio, self.birth_year, self.diagnosis, self.attending_doctor)
+                           + self._search_keys() + (self.patient_id,))
+            after_commit(patient_index.note_update, self.patient_id)
+
+    def _search_keys(self):
+        """Нормализованные ключи поиска (fio_key, diagnosis_key, attending_doctor_key)."""
+        return tuple(normalize_search_key(value) for value in (self.fio, self.diagnosis, self.attending_doctor))
 
     def delete(self):
         """Удаление пациента."""
         query = "DELETE FROM patients WHERE patient_id = ?"
         execute_update(query, (self.patient_id,))
+        after_commit(patient_index.note_delete, self.patient_id)
 
     @staticmethod
     def get_by_id(patient_id):
-        """Получение пациента по ID."""
-        query = "SELECT * FROM patients WHERE patient_id = ?"
-        row = fetch_one(query, (patient_id,))
-        if row:
-            return Patient(
-                patient_id=row["patient_id"], 
-                fio=row["fio"], 
-                birth_year=row["birth_year"], 
-                diagnosis=row["diagnosis"], 
-                attending_doctor=row["attending_doctor"]
-            )
-        return None
+        """Получение пациента по ID (через карту идентичности запроса)."""
+        return Patient.get_many([patient_id]).get(patient_id)
 
     @staticmethod
     def get_all():
         """Получение всех пациентов (для обратной совместимости)."""
+        return list(Patient.iter_all())
+
+    @staticmethod
+    def iter_all(columns=None):
+        """
+        Ленивый перебор всех пациентов: строки читаются из курсора пакетами.
+
+        Args:
+            columns: Загружаемые поля (None - все поля модели)
+        """
         query = "SELECT * FROM patients ORDER BY fio"
-        rows = fetch_all(query)
-        return [Patient(
-            patient_id=row["patient_id"], 
-            fio=row["fio"], 
-            birth_year=row["birth_year"], 
-            diagnosis=row["diagnosis"], 
-            attending_doctor=row["attending_doctor"]
-        ) for row in rows]
+        if columns:
+            query = project_columns(query, columns)
+        yield from Patient.from_rows(fetch_iter(query))
 
     @staticmethod
-    def get_paginated(page=1, per_page=10, order_by="fio"):
+    def get_paginated(page=1, per_page=10, order_by="fio", cursor=None, count=COUNT_EXACT, columns=None):
         """
         Получение пациентов с пагинацией для работы с большими объемами данных.
         
@@ -66,26 +184,27 @@ class Patient:
             page: Номер страницы (начиная с 1)
             per_page: Количество записей на странице
             order_by: Поле для сортировки
+            cursor: Токен курсора (пустая строка - первая страница, None - пагинация по номеру страницы)
+            count: Стратегия подсчёта общего количества записей
+            columns: Загружаемые поля (None - все поля модели)
         
         Returns:
             dict: Данные с пагинацией
         """
-        query = f"SELECT * FROM patients ORDER BY {order_by}"
-        result = fetch_paginated(query, None, page, per_page)
+        query = "SELECT * FROM patients"
+        keyset = None
+        if cursor is not None:
+            keyset = build_keyset(order_by, "patient_id")
+        else:
+            query += f" ORDER BY {order_by}"
+        result = fetch_paginated(query, None, page, per_page, keyset=keyset, cursor=cursor, count=count, columns=columns)
         
-        # Преобразование строк в объекты Patient
-        result['items'] = [Patient(
-            patient_id=row["patient_id"], 
-            fio=row["fio"], 
-            birth_year=row["birth_year"], 
-            diagnosis=row["diagnosis"], 
-            attending_doctor=row["attending_doctor"]
-        ) for row in result['items']]
+        result['items'] = list(Patient.from_rows(result['items']))
         
         return result
 
     @staticmethod
-    def search_paginated(search_term, page=1, per_page=10):
+    def search_paginated(search_term, page=1, per_page=10, count=COUNT_EXACT, columns=None):
         """
         Поиск пациентов с пагинацией.
         
@@ -93,21 +212,16 @@ class Patient:
             search_term: Поисковый запрос
             page: Номер страницы
             per_page: Количество записей на странице
+            count: Стратегия подсчёта общего количества записей
+            columns: Загружаемые поля (None - все поля модели)
         
         Returns:
             dict: Результаты поиска с пагинацией
         """
         search_fields = ['fio', 'diagnosis', 'attending_doctor']
-        result = search_with_pagination('patients', search_fields, search_term, page, per_page, 'fio')
+        result = search_with_pagination('patients', search_fields, search_term, page, per_page, 'fio', count, columns=columns)
         
-        # Преобразование строк в объекты Patient
-        result['items'] = [Patient(
-            patient_id=row["patient_id"], 
-            fio=row["fio"], 
-            birth_year=row["birth_year"], 
-            diagnosis=row["diagnosis"], 
-            attending_doctor=row["attending_doctor"]
-        ) for row in result['items']]
+        result['items'] = list(Patient.from_rows(result['items']))
         
         return result
 
@@ -121,11 +235,21 @@ class Patient:
         """
         columns = ['fio', 'birth_year', 'diagnosis', 'attending_doctor']
         bulk_insert('patients', columns, patients_data)
+        after_commit(patient_index.note_insert)
+
+class Medicine(_RowModel):
+    _table = 'medicines'
+    __slots__ = ('medicine_id', 'smmn_node_code', 'section', 'standardized_mnn', 'trade_name_vk',
+                 'standardized_dosage_form', 'standardized_dosage', 'characteristic', 'packaging', 'price',
+                 'created_at', 'updated_at')
+
+    # Поля для выпадающих списков (форма назначения показывает дозировку и фасовку);
+    # покрываются индексом idx_medicines_choice
+    CHOICE_FIELDS = ('medicine_id', 'trade_name_vk', 'standardized_mnn', 'price', 'standardized_dosage', 'packaging')
 
-class Medicine:
     def __init__(self, medicine_id=None, smmn_node_code=None, section=None, standardized_mnn=None, 
                  trade_name_vk=None, standardized_dosage_form=None, standardized_dosage=None, 
-                 characteristic=None, packaging=None, price=None):
+                 characteristic=None, packaging=None, price=None, created_at=None, updated_at=None):
         self.medicine_id = medicine_id
         self.smmn_node_code = smmn_node_code
         self.section = section
@@ -136,6 +260,8 @@ class Medicine:
         self.characteristic = characteristic
         self.packaging = packaging
         self.price = price
+        self.created_at = created_at
+        self.updated_at = updated_at
 
     def save(self):
         """Сохранение препарата с обновлением updated_at."""
@@ -143,73 +269,68 @@ class Medicine:
             query = """
                 INSERT INTO medicines (smmn_node_code, section, standardized_mnn, trade_name_vk, 
                                      standardized_dosage_form, standardized_dosage, characteristic, 
-                                     packaging, price)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                                     packaging, price, trade_name_vk_key, standardized_mnn_key, section_key)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """
             execute_update(query, (
                 self.smmn_node_code, self.section, self.standardized_mnn, self.trade_name_vk,
                 self.standardized_dosage_form, self.standardized_dosage, self.characteristic,
                 self.packaging, self.price
-            ))
+            ) + self._search_keys())
+            after_commit(medicine_index.note_insert)
         else:
             query = """
                 UPDATE medicines 
                 SET smmn_node_code = ?, section = ?, standardized_mnn = ?, trade_name_vk = ?, 
                     standardized_dosage_form = ?, standardized_dosage = ?, characteristic = ?, 
-                    packaging = ?, price = ?, updated_at = CURRENT_TIMESTAMP
+                    packaging = ?, price = ?, trade_name_vk_key = ?, standardized_mnn_key = ?, 
+                    section_key = ?, updated_at = CURRENT_TIMESTAMP
                 WHERE medicine_id = ?
             """
             execute_update(query, (
                 self.smmn_node_code, self.section, self.standardized_mnn, self.trade_name_vk,
                 self.standardized_dosage_form, self.standardized_dosage, self.characteristic,
-                self.packaging, self.price, self.medicine_id
-            ))
+                self.packaging, self.price
+            ) + self._search_keys() + (self.medicine_id,))
+            after_commit(medicine_index.note_update, self.medicine_id)
+            # Название и цена препарата входят в сводки пациентов
+            after_commit(patient_summary_cache.clear)
+
+    def _search_keys(self):
+        """Нормализованные ключи поиска (trade_name_vk_key, standardized_mnn_key, section_key)."""
+        return tuple(normalize_search_key(value) for value in (self.trade_name_vk, self.standardized_mnn, self.section))
 
     def delete(self):
         """Удаление препарата."""
         query = "DELETE FROM medicines WHERE medicine_id = ?"
         execute_update(query, (self.medicine_id,))
+        after_commit(medicine_index.note_delete, self.medicine_id)
 
     @staticmethod
     def get_by_id(medicine_id):
-        """Получение препарата по ID."""
-        query = "SELECT * FROM medicines WHERE medicine_id = ?"
-        row = fetch_one(query, (medicine_id,))
-        if row:
-            return Medicine(
-                medicine_id=row["medicine_id"], 
-                smmn_node_code=row["smmn_node_code"], 
-                section=row["section"], 
-                standardized_mnn=row["standardized_mnn"], 
-                trade_name_vk=row["trade_name_vk"], 
-                standardized_dosage_form=row["standardized_dosage_form"], 
-                standardized_dosage=row["standardized_dosage"], 
-                characteristic=row["characteristic"], 
-                packaging=row["packaging"], 
-                price=row["price"]
-            )
-        return None
+        """Получение препарата по ID (через карту идентичности запроса)."""
+        return Medicine.get_many([medicine_id]).get(medicine_id)
 
     @staticmethod
     def get_all():
         """Получение всех препаратов (для обратной совместимости)."""
+        return list(Medicine.iter_all())
+
+    @staticmethod
+    def iter_all(columns=None):
+        """
+        Ленивый перебор всех препаратов: строки читаются из курсора пакетами.
+
+        Args:
+            columns: Загружаемые поля (None - все поля модели)
+        """
         query = "SELECT * FROM medicines ORDER BY trade_name_vk"
-        rows = fetch_all(query)
-        return [Medicine(
-            medicine_id=row["medicine_id"], 
-            smmn_node_code=row["smmn_node_code"], 
-            section=row["section"], 
-            standardized_mnn=row["standardized_mnn"], 
-            trade_name_vk=row["trade_name_vk"], 
-            standardized_dosage_form=row["standardized_dosage_form"], 
-            standardized_dosage=row["standardized_dosage"], 
-            characteristic=row["characteristic"], 
-            packaging=row["packaging"], 
-            price=row["price"]
-        ) for row in rows]
+        if columns:
+            query = project_columns(query, columns)
+        yield from Medicine.from_rows(fetch_iter(query))
 
     @staticmethod
-    def get_paginated(page=1, per_page=10, order_by="trade_name_vk"):
+    def get_paginated(page=1, per_page=10, order_by="trade_name_vk", cursor=None, count=COUNT_EXACT, columns=None):
         """
         Получение препаратов с пагинацией для работы с большими объемами данных.
         
@@ -217,31 +338,27 @@ class Medicine:
             page: Номер страницы (начиная с 1)
             per_page: Количество записей на странице
             order_by: Поле для сортировки
+            cursor: Токен курсора (пустая строка - первая страница, None - пагинация по номеру страницы)
+            count: Стратегия подсчёта общего количества записей
+            columns: Загружаемые поля (None - все поля модели)
         
         Returns:
             dict: Данные с пагинацией
         """
-        query = f"SELECT * FROM medicines ORDER BY {order_by}"
-        result = fetch_paginated(query, None, page, per_page)
-        
-        # Преобразование строк в объекты Medicine
-        result['items'] = [Medicine(
-            medicine_id=row["medicine_id"], 
-            smmn_node_code=row["smmn_node_code"], 
-            section=row["section"], 
-            standardized_mnn=row["standardized_mnn"], 
-            trade_name_vk=row["trade_name_vk"], 
-            standardized_dosage_form=row["standardized_dosage_form"], 
-            standardized_dosage=row["standardized_dosage"], 
-            characteristic=row["characteristic"], 
-            packaging=row["packaging"], 
-            price=row["price"]
-        ) for row in result['items']]
+        query = "SELECT * FROM medicines"
+        keyset = None
+        if cursor is not None:
+            keyset = build_keyset(order_by, "medicine_id")
+        else:
+            query += f" ORDER BY {order_by}"
+        result = fetch_paginated(query, None, page, per_page, keyset=keyset, cursor=cursor, count=count, columns=columns)
+        
+        result['items'] = list(Medicine.from_rows(result['items']))
         
         return result
 
     @staticmethod
-    def search_paginated(search_term, page=1, per_page=10):
+    def search_paginated(search_term, page=1, per_page=10, count=COUNT_EXACT, columns=None):
         """
         Поиск препаратов с пагинацией.
         
@@ -249,26 +366,16 @@ class Medicine:
             search_term: Поисковый запрос
             page: Номер страницы
             per_page: Количество записей на странице
+            count: Стратегия подсчёта общего количества записей
+            columns: Загружаемые поля (None - все поля модели)
         
         Returns:
             dict: Результаты поиска с пагинацией
         """
         search_fields = ['trade_name_vk', 'standardized_mnn', 'section']
-        result = search_with_pagination('medicines', search_fields, search_term, page, per_page, 'trade_name_vk')
-        
-        # Преобразование строк в объекты Medicine
-        result['items'] = [Medicine(
-            medicine_id=row["medicine_id"], 
-            smmn_node_code=row["smmn_node_code"], 
-            section=row["section"], 
-            standardized_mnn=row["standardized_mnn"], 
-            trade_name_vk=row["trade_name_vk"], 
-            standardized_dosage_form=row["standardized_dosage_form"], 
-            standardized_dosage=row["standardized_dosage"], 
-            characteristic=row["characteristic"], 
-            packaging=row["packaging"], 
-            price=row["price"]
-        ) for row in result['items']]
+        result = search_with_pagination('medicines', search_fields, search_term, page, per_page, 'trade_name_vk', count, columns=columns)
+        
+        result['items'] = list(Medicine.from_rows(result['items']))
         
         return result
 
@@ -286,9 +393,10 @@ class Medicine:
             'packaging', 'price'
         ]
         bulk_insert('medicines', columns, medicines_data)
+        after_commit(medicine_index.note_insert)
 
     @staticmethod
-    def get_by_price_range(min_price=None, max_price=None, page=1, per_page=10):
+    def get_by_price_range(min_price=None, max_price=None, page=1, per_page=10, count=COUNT_EXACT, columns=None):
         """
         Получение препаратов в определенном ценовом диапазоне с пагинацией.
         
@@ -297,6 +405,8 @@ class Medicine:
             max_price: Максимальная цена
             page: Номер страницы
             per_page: Количество записей на странице
+            count: Стратегия подсчёта общего количества записей
+            columns: Загружаемые поля (None - все поля модели)
         
         Returns:
             dict: Результаты с пагинацией
@@ -315,27 +425,19 @@ class Medicine:
         where_clause = " AND ".join(conditions) if conditions else "1=1"
         query = f"SELECT * FROM medicines WHERE {where_clause} ORDER BY price"
         
-        result = fetch_paginated(query, params, page, per_page)
-        
-        # Преобразование строк в объекты Medicine
-        result['items'] = [Medicine(
-            medicine_id=row["medicine_id"], 
-            smmn_node_code=row["smmn_node_code"], 
-            section=row["section"], 
-            standardized_mnn=row["standardized_mnn"], 
-            trade_name_vk=row["trade_name_vk"], 
-            standardized_dosage_form=row["standardized_dosage_form"], 
-            standardized_dosage=row["standardized_dosage"], 
-            characteristic=row["characteristic"], 
-            packaging=row["packaging"], 
-            price=row["price"]
-        ) for row in result['items']]
+        result = fetch_paginated(query, params, page, per_page, count=count, columns=columns)
+        
+        result['items'] = list(Medicine.from_rows(result['items']))
         
         return result
 
-class Prescription:
+class Prescription(_RowModel):
+    _table = 'prescriptions'
+    __slots__ = ('prescription_id', 'patient_id', 'medicine_id', 'prescription_date', 'quantity_packs',
+                 'daily_dose', 'treatment_days', 'created_at', 'updated_at')
+
     def __init__(self, prescription_id=None, patient_id=None, medicine_id=None, prescription_date=None, 
-                 quantity_packs=None, daily_dose=None, treatment_days=None):
+                 quantity_packs=None, daily_dose=None, treatment_days=None, created_at=None, updated_at=None):
         self.prescription_id = prescription_id
         self.patient_id = patient_id
         self.medicine_id = medicine_id
@@ -343,6 +445,8 @@ class Prescription:
         self.quantity_packs = quantity_packs
         self.daily_dose = daily_dose
         self.treatment_days = treatment_days
+        self.created_at = created_at
+        self.updated_at = updated_at
 
     def save(self):
         """Сохранение назначения с обновлением updated_at."""
@@ -355,6 +459,7 @@ class Prescription:
                 self.patient_id, self.medicine_id, self.prescription_date, 
                 self.quantity_packs, self.daily_dose, self.treatment_days
             ))
+            after_commit(patient_summary_cache.invalidate, self.patient_id)
         else:
             query = """
                 UPDATE prescriptions 
@@ -366,46 +471,40 @@ class Prescription:
                 self.patient_id, self.medicine_id, self.prescription_date, 
                 self.quantity_packs, self.daily_dose, self.treatment_days, self.prescription_id
             ))
+            # Назначение могло быть перенесено к другому пациенту
+            after_commit(patient_summary_cache.clear)
 
     def delete(self):
         """Удаление назначения."""
         query = "DELETE FROM prescriptions WHERE prescription_id = ?"
         execute_update(query, (self.prescription_id,))
+        after_commit(patient_summary_cache.invalidate, self.patient_id)
 
     @staticmethod
     def get_by_id(prescription_id):
-        """Получение назначения по ID."""
-        query = "SELECT * FROM prescriptions WHERE prescription_id = ?"
-        row = fetch_one(query, (prescription_id,))
-        if row:
-            return Prescription(
-                prescription_id=row["prescription_id"], 
-                patient_id=row["patient_id"], 
-                medicine_id=row["medicine_id"], 
-                prescription_date=row["prescription_date"], 
-                quantity_packs=row["quantity_packs"], 
-                daily_dose=row.get("daily_dose"), 
-                treatment_days=row.get("treatment_days")
-            )
-        return None
+        """Получение назначения по ID (через карту идентичности запроса)."""
+        return Prescription.get_many([prescription_id]).get(prescription_id)
 
     @staticmethod
     def get_all():
         """Получение всех назначений (для обратной совместимости)."""
+        return list(Prescription.iter_all())
+
+    @staticmethod
+    def iter_all(columns=None):
+        """
+        Ленивый перебор всех назначений: строки читаются из курсора пакетами.
+
+        Args:
+            columns: Загружаемые поля (None - все поля модели)
+        """
         query = "SELECT * FROM prescriptions ORDER BY prescription_date DESC"
-        rows = fetch_all(query)
-        return [Prescription(
-            prescription_id=row["prescription_id"], 
-            patient_id=row["patient_id"], 
-            medicine_id=row["medicine_id"], 
-            prescription_date=row["prescription_date"], 
-            quantity_packs=row["quantity_packs"], 
-            daily_dose=row.get("daily_dose"), 
-            treatment_days=row.get("treatment_days")
-        ) for row in rows]
+        if columns:
+            query = project_columns(query, columns)
+        yield from Prescription.from_rows(fetch_iter(query))
 
     @staticmethod
-    def get_paginated(page=1, per_page=10, order_by="prescription_date DESC"):
+    def get_paginated(page=1, per_page=10, order_by="prescription_date DESC", cursor=None, count=COUNT_EXACT, columns=None):
         """
         Получение назначений с пагинацией.
         
@@ -413,28 +512,27 @@ class Prescription:
             page: Номер страницы
             per_page: Количество записей на странице
             order_by: Поле для сортировки
+            cursor: Токен курсора (пустая строка - первая страница, None - пагинация по номеру страницы)
+            count: Стратегия подсчёта общего количества записей
+            columns: Загружаемые поля (None - все поля модели)
         
         Returns:
             dict: Данные с пагинацией
         """
-        query = f"SELECT * FROM prescriptions ORDER BY {order_by}"
-        result = fetch_paginated(query, None, page, per_page)
+        query = "SELECT * FROM prescriptions"
+        keyset = None
+        if cursor is not None:
+            keyset = build_keyset(order_by, "prescription_id")
+        else:
+            query += f" ORDER BY {order_by}"
+        result = fetch_paginated(query, None, page, per_page, keyset=keyset, cursor=cursor, count=count, columns=columns)
         
-        # Преобразование строк в объекты Prescription
-        result['items'] = [Prescription(
-            prescription_id=row["prescription_id"], 
-            patient_id=row["patient_id"], 
-            medicine_id=row["medicine_id"], 
-            prescription_date=row["prescription_date"], 
-            quantity_packs=row["quantity_packs"], 
-            daily_dose=row.get("daily_dose"), 
-            treatment_days=row.get("treatment_days")
-        ) for row in result['items']]
+        result['items'] = list(Prescription.from_rows(result['items']))
         
         return result
 
     @staticmethod
-    def get_by_patient_paginated(patient_id, page=1, per_page=10):
+    def get_by_patient_paginated(patient_id, page=1, per_page=10, cursor=None, count=COUNT_EXACT, columns=None):
         """
         Получение назначений для конкретного пациента с пагинацией.
         
@@ -442,33 +540,53 @@ class Prescription:
             patient_id: ID пациента
             page: Номер страницы
             per_page: Количество записей на странице
+            cursor: Токен курсора (пустая строка - первая страница, None - пагинация по номеру страницы)
+            count: Стратегия подсчёта общего количества записей
+            columns: Загружаемые поля (None - все поля модели)
         
         Returns:
             dict: Данные с пагинацией
         """
-        query = "SELECT * FROM prescriptions WHERE patient_id = ? ORDER BY prescription_date DESC"
-        result = fetch_paginated(query, (patient_id,), page, per_page)
+        query = "SELECT * FROM prescriptions WHERE patient_id = ?"
+        keyset = None
+        if cursor is not None:
+            keyset = build_keyset("prescription_date DESC", "prescription_id")
+        else:
+            query += " ORDER BY prescription_date DESC"
+        result = fetch_paginated(query, (patient_id,), page, per_page, keyset=keyset, cursor=cursor, count=count, columns=columns)
         
-        # Преобразование строк в объекты Prescription
-        result['items'] = [Prescription(
-            prescription_id=row["prescription_id"], 
-            patient_id=row["patient_id"], 
-            medicine_id=row["medicine_id"], 
-            prescription_date=row["prescription_date"], 
-            quantity_packs=row["quantity_packs"], 
-            daily_dose=row.get("daily_dose"), 
-            treatment_days=row.get("treatment_days")
-        ) for row in result['items']]
+        result['items'] = list(Prescription.from_rows(result['items']))
         
         return result
 
-class Dispensing:
-    def __init__(self, dispensing_id=None, patient_id=None, medicine_id=None, dispensing_date=None, quantity_packs=None):
+    @staticmethod
+    def bulk_create(prescriptions_data):
+        """
+        Массовое создание назначений.
+        
+        Args:
+            prescriptions_data: Список кортежей (patient_id, medicine_id, prescription_date, quantity_packs,
+                daily_dose, treatment_days)
+        """
+        columns = ['patient_id', 'medicine_id', 'prescription_date', 'quantity_packs', 'daily_dose', 'treatment_days']
+        bulk_insert('prescriptions', columns, prescriptions_data)
+        for patient_id in {row[0] for row in prescriptions_data}:
+            after_commit(patient_summary_cache.invalidate, patient_id)
+
+class Dispensing(_RowModel):
+    _table = 'dispensings'
+    __slots__ = ('dispensing_id', 'patient_id', 'medicine_id', 'dispensing_date', 'quantity_packs',
+                 'created_at', 'updated_at')
+
+    def __init__(self, dispensing_id=None, patient_id=None, medicine_id=None, dispensing_date=None, quantity_packs=None,
+                 created_at=None, updated_at=None):
         self.dispensing_id = dispensing_id
         self.patient_id = patient_id
         self.medicine_id = medicine_id
         self.dispensing_date = dispensing_date
         self.quantity_packs = quantity_packs
+        self.created_at = created_at
+        self.updated_at = updated_at
 
     def save(self):
         """Сохранение выдачи с обновлением updated_at."""
@@ -478,6 +596,7 @@ class Dispensing:
                 VALUES (?, ?, ?, ?)
             """
             execute_update(query, (self.patient_id, self.medicine_id, self.dispensing_date, self.quantity_packs))
+            after_commit(patient_summary_cache.invalidate, self.patient_id)
         else:
             query = """
                 UPDATE dispensings 
@@ -488,42 +607,40 @@ class Dispensing:
                 self.patient_id, self.medicine_id, self.dispensing_date, 
                 self.quantity_packs, self.dispensing_id
             ))
+            # Выдача могла быть перенесена к другому пациенту
+            after_commit(patient_summary_cache.clear)
 
     def delete(self):
         """Удаление выдачи."""
         query = "DELETE FROM dispensings WHERE dispensing_id = ?"
         execute_update(query, (self.dispensing_id,))
+        after_commit(patient_summary_cache.invalidate, self.patient_id)
 
     @staticmethod
     def get_by_id(dispensing_id):
-        """Получение выдачи по ID."""
-        query = "SELECT * FROM dispensings WHERE dispensing_id = ?"
-        row = fetch_one(query, (dispensing_id,))
-        if row:
-            return Dispensing(
-                dispensing_id=row["dispensing_id"], 
-                patient_id=row["patient_id"], 
-                medicine_id=row["medicine_id"], 
-                dispensing_date=row["dispensing_date"], 
-                quantity_packs=row["quantity_packs"]
-            )
-        return None
+        """Получение выдачи по ID (через карту идентичности запроса)."""
+        return Dispensing.get_many([dispensing_id]).get(dispensing_id)
 
     @staticmethod
     def get_all():
         """Получение всех выдач (для обратной совместимости)."""
+        return list(Dispensing.iter_all())
+
+    @staticmethod
+    def iter_all(columns=None):
+        """
+        Ленивый перебор всех выдач: строки читаются из курсора пакетами.
+
+        Args:
+            columns: Загружаемые поля (None - все поля модели)
+        """
         query = "SELECT * FROM dispensings ORDER BY dispensing_date DESC"
-        rows = fetch_all(query)
-        return [Dispensing(
-            dispensing_id=row["dispensing_id"], 
-            patient_id=row["patient_id"], 
-            medicine_id=row["medicine_id"], 
-            dispensing_date=row["dispensing_date"], 
-            quantity_packs=row["quantity_packs"]
-        ) for row in rows]
+        if columns:
+            query = project_columns(query, columns)
+        yield from Dispensing.from_rows(fetch_iter(query))
 
     @staticmethod
-    def get_paginated(page=1, per_page=10, order_by="dispensing_date DESC"):
+    def get_paginated(page=1, per_page=10, order_by="dispensing_date DESC", cursor=None, count=COUNT_EXACT, columns=None):
         """
         Получение выдач с пагинацией.
         
@@ -531,26 +648,27 @@ class Dispensing:
             page: Номер страницы
             per_page: Количество записей на странице
             order_by: Поле для сортировки
+            cursor: Токен курсора (пустая строка - первая страница, None - пагинация по номеру страницы)
+            count: Стратегия подсчёта общего количества записей
+            columns: Загружаемые поля (None - все поля модели)
         
         Returns:
             dict: Данные с пагинацией
         """
-        query = f"SELECT * FROM dispensings ORDER BY {order_by}"
-        result = fetch_paginated(query, None, page, per_page)
+        query = "SELECT * FROM dispensings"
+        keyset = None
+        if cursor is not None:
+            keyset = build_keyset(order_by, "dispensing_id")
+        else:
+            query += f" ORDER BY {order_by}"
+        result = fetch_paginated(query, None, page, per_page, keyset=keyset, cursor=cursor, count=count, columns=columns)
         
-        # Преобразование строк в объекты Dispensing
-        result['items'] = [Dispensing(
-            dispensing_id=row["dispensing_id"], 
-            patient_id=row["patient_id"], 
-            medicine_id=row["medicine_id"], 
-            dispensing_date=row["dispensing_date"], 
-            quantity_packs=row["quantity_packs"]
-        ) for row in result['items']]
+        result['items'] = list(Dispensing.from_rows(result['items']))
         
         return result
 
     @staticmethod
-    def get_by_patient_paginated(patient_id, page=1, per_page=10):
+    def get_by_patient_paginated(patient_id, page=1, per_page=10, cursor=None, count=COUNT_EXACT, columns=None):
         """
         Получение выдач для конкретного пациента с пагинацией.
         
@@ -558,21 +676,34 @@ class Dispensing:
             patient_id: ID пациента
             page: Номер страницы
             per_page: Количество записей на странице
+            cursor: Токен курсора (пустая строка - первая страница, None - пагинация по номеру страницы)
+            count: Стратегия подсчёта общего количества записей
+            columns: Загружаемые поля (None - все поля модели)
         
         Returns:
             dict: Данные с пагинацией
         """
-        query = "SELECT * FROM dispensings WHERE patient_id = ? ORDER BY dispensing_date DESC"
-        result = fetch_paginated(query, (patient_id,), page, per_page)
+        query = "SELECT * FROM dispensings WHERE patient_id = ?"
+        keyset = None
+        if cursor is not None:
+            keyset = build_keyset("dispensing_date DESC", "dispensing_id")
+        else:
+            query += " ORDER BY dispensing_date DESC"
+        result = fetch_paginated(query, (patient_id,), page, per_page, keyset=keyset, cursor=cursor, count=count, columns=columns)
         
-        # Преобразование строк в объекты Dispensing
-        result['items'] = [Dispensing(
-            dispensing_id=row["dispensing_id"], 
-            patient_id=row["patient_id"], 
-            medicine_id=row["medicine_id"], 
-            dispensing_date=row["dispensing_date"], 
-            quantity_packs=row["quantity_packs"]
-        ) for row in result['items']]
+        result['items'] = list(Dispensing.from_rows(result['items']))
         
         return result
 
+    @staticmethod
+    def bulk_create(dispensings_data):
+        """
+        Массовое создание выдач.
+        
+        Args:
+            dispensings_data: Список кортежей (patient_id, medicine_id, dispensing_date, quantity_packs)
+        """
+        columns = ['patient_id', 'medicine_id', 'dispensing_date', 'quantity_packs']
+        bulk_insert('dispensings', columns, dispensings_data)
+        for patient_id in {row[0] for row in dispensings_data}:
+            after_commit(patient_summary_cache.invalidate, patient_id)
@@ -0,0 +1,100 @@
+"""
+Модуль параллельного выполнения независимых разделов отчётов.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+
+class SectionExecutor:
+    """
+    Пул потоков для независимых разделов отчёта.
+
+    Каждый поток пула читает через собственное соединение, создаваемое при
+    первом разделе и открытое только на чтение (PRAGMA query_only). В режиме
+    WAL читатели не блокируют друг друга и писателя, поэтому разделы,
+    выполняемые одновременно, занимают время самого долгого из них, а не
+    сумму. Соединения пула соединений запросов при этом не расходуются.
+
+    Разделы читают каждый в своей транзакции чтения: запись, зафиксированная
+    между ними, может попасть в одни разделы отчёта и не попасть в другие.
+    """
+
+    def __init__(self, factory, workers=4):
+        """
+        Args:
+            factory (callable): Функция без аргументов, создающая соединение потока
+            workers (int): Количество потоков
+        """
+        self._factory = factory
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._pid = os.getpid()
+        self._executor = None
+
+    def _get_executor(self):
+        """Пул потоков текущего процесса (создаётся при первом вызове и после fork)."""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid, self._executor = os.getpid(), None
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='report-section')
+            return self._executor
+
+    def in_worker(self):
+        """Выполняется ли текущий код в потоке пула (вложенные разделы выполняются последовательно)."""
+        return getattr(self._local, 'active', False)
+
+    def _connection(self):
+        """Соединение текущего потока пула."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = self._factory()
+            conn.execute('PRAGMA query_only = ON')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _run_section(self, section, bind):
+        """Выполнение раздела в потоке пула на соединении потока."""
+        conn = self._connection()
+        self._local.active = True
+        try:
+            with bind(conn):
+                return section()
+        except Exception:
+            # Соединение пересоздаётся, если ошибка оставила его в неизвестном состоянии
+            if conn.in_transaction:
+                conn.close()
+                self._local.conn = None
+            raise
+        finally:
+            self._local.active = False
+
+    def run(self, sections, bind):
+        """
+        Параллельное выполнение разделов.
+
+        Args:
+            sections (dict): Имя раздела -> функция без аргументов
+            bind (callable): bind(conn) - контекстный менеджер, делающий conn
+                соединением раздела (например, контекст приложения с g.db)
+
+        Returns:
+            dict: Имя раздела -> результат функции, в порядке sections
+
+        Raises:
+            Exception: Первая по порядку разделов ошибка - после завершения всех разделов
+        """
+        executor = self._get_executor()
+        futures = {name: executor.submit(self._run_section, section, bind) for name, section in sections.items()}
+        wait(futures.values())
+        return {name: future.result() for name, future in futures.items()}
+
+    def shutdown(self, wait=True):
+        """Остановка пула потоков."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
@@ -0,0 +1,331 @@
+"""
+Модуль фонового построения отчётов в пуле процессов с хранилищем результатов.
+"""
+
+import json
+import multiprocessing
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from flask import Flask, current_app, g
+import config
+
+# Типы фоновых отчётов: тип -> допустимые параметры построения
+REPORT_JOB_TYPES = {
+    'patient': ('start_date', 'end_date', 'patient_id'),
+    'dispensing': ('start_date', 'end_date', 'medicine_id'),
+    'financial': ('start_date', 'end_date'),
+    'medicine': (),
+}
+
+# Форматы результата: формат -> MIME-тип файла
+REPORT_JOB_FORMATS = {
+    'csv': 'text/csv',
+    'json': 'application/json',
+}
+
+# Настройки приложения, передаваемые процессу построения отчёта
+JOB_CONFIG_KEYS = ('DATABASE_PATH', 'REPORTS_EXPORT_CHUNK_SIZE')
+
+_JOB_ID = re.compile(r'[0-9a-f]{32}')
+
+def _now():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+class ReportResultStore:
+    """
+    Хранилище заданий и результатов отчётов в локальном каталоге.
+
+    Для каждого задания хранится файл состояния <job_id>.job.json и, после
+    построения, файл результата <job_id>.csv или <job_id>.json. Файлы
+    записываются через временный файл и переименование, поэтому состояние
+    видно всем процессам (воркерам приложения и процессам пула) и никогда
+    не читается недописанным.
+    """
+
+    def __init__(self, directory):
+        """
+        Args:
+            directory (str): Каталог хранилища (создаётся при необходимости)
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _meta_path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}.job.json")
+
+    def result_path(self, job_id, fmt):
+        """Путь к файлу результата задания."""
+        return os.path.join(self.directory, f"{job_id}.{fmt}")
+
+    def _write_meta(self, job):
+        path = self._meta_path(job['job_id'])
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(job, f, ensure_ascii=False)
+        os.replace(path + '.tmp', path)
+
+    def create(self, job):
+        """Сохранение нового задания."""
+        self._write_meta(job)
+
+    def get(self, job_id):
+        """
+        Состояние задания.
+
+        Returns:
+            dict: Описание задания; None, если задание не найдено
+        """
+        if not _JOB_ID.fullmatch(job_id or ''):
+            return None
+        try:
+            with open(self._meta_path(job_id), encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def update(self, job_id, **fields):
+        """Изменение полей задания."""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job.update(fields)
+        self._write_meta(job)
+        return job
+
+    def prune(self, max_age):
+        """
+        Удаление заданий и результатов старше max_age секунд.
+
+        Returns:
+            int: Количество удалённых файлов
+        """
+        removed = 0
+        threshold = time.time() - max_age
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < threshold:
+                    os.remove(path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+def _json_default(value):
+    """Сериализация строк sqlite3.Row и прочих значений отчёта в JSON."""
+    if isinstance(value, sqlite3.Row):
+        return dict(value)
+    return str(value)
+
+def _report_chunks(report_type, fmt, params, chunk_size):
+    """Блоки результата отчёта в формате fmt."""
+    from business_logic import BusinessLogic
+    from reports_generator import ReportsGenerator
+
+    if fmt == 'csv':
+        if report_type == 'medicine':
+            yield from BusinessLogic.stream_medicine_report_csv(chunk_size)
+        else:
+            yield from ReportsGenerator.stream_report_csv(report_type, chunk_size=chunk_size, **params)
+        return
+
+    builders = {
+        'patient': ReportsGenerator.generate_patient_report,
+        'dispensing': ReportsGenerator.generate_dispensing_report,
+        'financial': ReportsGenerator.generate_financial_report,
+        'medicine': BusinessLogic.generate_medicine_report,
+    }
+    report = builders[report_type](use_cache=False, **params)
+    yield json.dumps(report, ensure_ascii=False, default=_json_default)
+
+def run_report_job(job_config, directory, job_id):
+    """
+    Построение отчёта задания в процессе пула.
+
+    Отчёт строится в собственном контексте приложения на соединении только
+    для чтения; результат записывается в хранилище, ошибка построения -
+    в состояние задания.
+
+    Args:
+        job_config (dict): Настройки приложения (JOB_CONFIG_KEYS)
+        directory (str): Каталог хранилища результатов
+        job_id (str): ID задания
+
+    Returns:
+        str: Итоговый статус задания
+    """
+    store = ReportResultStore(directory)
+    job = store.update(job_id, status='running', started_at=_now())
+    if job is None:
+        return 'failed'
+
+    app = Flask(__name__)
+    app.config.from_object(config)
+    app.config.update(job_config)
+
+    path = store.result_path(job_id, job['format'])
+    try:
+        with app.app_context():
+            # Соединение запроса общее для database и database_updated
+            g.db = sqlite3.connect(f"file:{app.config['DATABASE_PATH']}?mode=ro", uri=True)
+            g.db.row_factory = sqlite3.Row
+            try:
+                chunks = _report_chunks(job['type'], job['format'], job['params'],
+                                        app.config.get('REPORTS_EXPORT_CHUNK_SIZE', 1000))
+                with open(path + '.tmp', 'w', encoding='utf-8', newline='') as f:
+                    for chunk in chunks:
+                        f.write(chunk)
+                os.replace(path + '.tmp', path)
+            finally:
+                g.pop('db').close()
+    except Exception as e:
+        store.update(job_id, status='failed', error=str(e), finished_at=_now())
+        return 'failed'
+
+    store.update(job_id, status='done', size=os.path.getsize(path), finished_at=_now())
+    return 'done'
+
+class ReportJobRunner:
+    """
+    Фоновое построение отчётов в пуле процессов.
+
+    Тяжёлые отчёты строятся вне процесса веб-воркера, поэтому не занимают его
+    на всё время построения и не конкурируют за GIL с обработкой запросов.
+    Процессы пула запускаются методом spawn: fork процесса с потоками
+    (писатель очереди записи, потоки сервера) может унаследовать захваченные
+    блокировки. Пул создаётся отдельно в каждом процессе приложения.
+    """
+
+    def __init__(self, store, workers=2, retention=24 * 60 * 60):
+        """
+        Args:
+            store (ReportResultStore): Хранилище заданий и результатов
+            workers (int): Количество процессов пула
+            retention (int): Время хранения заданий и результатов в секундах
+        """
+        self.store = store
+        self.workers = workers
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._executor = None
+
+    def _get_executor(self):
+        """Пул процессов текущего процесса (создаётся при первом задании и после fork)."""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid, self._executor = os.getpid(), None
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+    def _on_done(self, job_id, executor, future):
+        """Отметка задания, не выполненного из-за сбоя пула."""
+        if future.cancelled() or future.exception() is not None:
+            error = 'Задание отменено' if future.cancelled() else str(future.exception())
+            self.store.update(job_id, status='failed', error=error, finished_at=_now())
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+
+    def submit(self, report_type, fmt='csv', params=None, job_config=None):
+        """
+        Постановка отчёта в очередь построения.
+
+        Args:
+            report_type (str): Тип отчёта (REPORT_JOB_TYPES)
+            fmt (str): Формат результата ('csv' или 'json')
+            params (dict): Параметры построения отчёта
+            job_config (dict): Настройки приложения для процесса построения
+
+        Returns:
+            dict: Описание созданного задания
+
+        Raises:
+            ValueError: Если тип, формат, параметры отчёта или их значения недопустимы
+        """
+        # Нестроковые значения из JSON (списки, объекты) не хешируются
+        if not isinstance(report_type, str) or report_type not in REPORT_JOB_TYPES:
+            raise ValueError(f"Неизвестный тип отчёта: {report_type}")
+        if not isinstance(fmt, str) or fmt not in REPORT_JOB_FORMATS:
+            raise ValueError(f"Неподдерживаемый формат отчёта: {fmt}")
+        params = {name: value for name, value in (params or {}).items() if value not in (None, '')}
+        unknown = set(params) - set(REPORT_JOB_TYPES[report_type])
+        if unknown:
+            raise ValueError(f"Недопустимые параметры отчёта: {', '.join(sorted(unknown))}")
+        for name, value in params.items():
+            try:
+                if name.endswith('_date'):
+                    datetime.strptime(value, '%Y-%m-%d')
+                elif isinstance(value, bool) or not isinstance(value, (int, str)):
+                    raise TypeError(name)
+                else:
+                    params[name] = int(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"Некорректное значение параметра отчёта: {name}") from None
+
+        self.store.prune(self.retention)
+        job = {
+            'job_id': uuid.uuid4().hex,
+            'type': report_type,
+            'format': fmt,
+            'params': params,
+            'status': 'queued',
+            'error': None,
+            'size': None,
+            'created_at': _now(),
+            'started_at': None,
+            'finished_at': None,
+        }
+        self.store.create(job)
+
+        executor = self._get_executor()
+        future = executor.submit(run_report_job, job_config or {}, self.store.directory, job['job_id'])
+        future.add_done_callback(lambda f: self._on_done(job['job_id'], executor, f))
+        return job
+
+    def get(self, job_id):
+        """Состояние задания (см. ReportResultStore.get)."""
+        return self.store.get(job_id)
+
+    def result_path(self, job):
+        """Путь к результату выполненного задания; None, если результат не готов."""
+        if job['status'] != 'done':
+            return None
+        path = self.store.result_path(job['job_id'], job['format'])
+        return path if os.path.exists(path) else None
+
+    def shutdown(self, wait=True):
+        """Остановка пула процессов."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+def get_report_jobs():
+    """
+    Исполнитель фоновых отчётов приложения.
+
+    Returns:
+        ReportJobRunner: Исполнитель, создаваемый при первом обращении
+    """
+    runner = current_app.extensions.get('report_jobs')
+    if runner is None:
+        runner = current_app.extensions['report_jobs'] = ReportJobRunner(
+            ReportResultStore(current_app.config['REPORT_JOBS_DIR']),
+            workers=current_app.config.get('REPORT_JOBS_WORKERS', 2),
+            retention=current_app.config.get('REPORT_JOBS_RETENTION', 24 * 60 * 60),
+        )
+    return runner
+
+def submit_report_job(report_type, fmt='csv', params=None):
+    """Постановка отчёта в очередь построения с настройками текущего приложения."""
+    job_config = {key: current_app.config[key] for key in JOB_CONFIG_KEYS if key in current_app.config}
+    return get_report_jobs().submit(report_type, fmt, params, job_config)
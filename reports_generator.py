@@ -2,78 +2,141 @@
 Модуль для генерации различных отчетов в медицинской информационной системе.
 """
 
-from database import fetch_all, fetch_one
+from database import fetch_all, fetch_one, fetch_iter
+from csv_export import iter_csv
+from database_updated import build_keyset, fetch_keyset_paginated, run_sections
+from cache import cached_report
 from datetime import datetime, timedelta
-import csv
-import io
 
 class ReportsGenerator:
     """Класс для генерации отчетов."""
     
+    # Ключ курсорной пагинации строк отчета по выдачам (новые выдачи первыми)
+    DISPENSING_KEYSET = build_keyset('dispensing_date DESC', 'dispensing_id')
+    
     @staticmethod
-    def generate_patient_report(start_date=None, end_date=None, patient_id=None):
+    def _patient_report_query(start_date=None, end_date=None, patient_id=None):
         """
-        Генерирует отчет по пациентам.
-        
-        Args:
-            start_date (str): Начальная дата в формате YYYY-MM-DD
-            end_date (str): Конечная дата в формате YYYY-MM-DD
-            patient_id (int): ID конкретного пациента (опционально)
-            
-        Returns:
-            dict: Отчет по пациентам
+        Запрос строк отчёта по пациентам: (query, params).
+        
+        Назначения и выдачи агрегируются по пациенту каждые в своём подзапросе
+        с фильтрами по дате и пациенту, и только затем присоединяются к
+        пациентам: совместное соединение строк обеих таблиц давало бы их
+        декартово произведение по каждому пациенту и завышенные суммы.
+        При фильтре по датам в отчёт входят пациенты с назначениями или
+        выдачами за период.
         """
+        def source_filters(alias, date_column):
+            conditions = []
+            params = []
+            if patient_id:
+                conditions.append(f"{alias}.patient_id = ?")
+                params.append(patient_id)
+            if start_date:
+                conditions.append(f"{alias}.{date_column} >= ?")
+                params.append(start_date)
+            if end_date:
+                conditions.append(f"{alias}.{date_column} <= ?")
+                params.append(end_date)
+            return (" WHERE " + " AND ".join(conditions) if conditions else ""), params
+        
+        prescriptions_where, prescriptions_params = source_filters('pr', 'prescription_date')
+        dispensings_where, dispensings_params = source_filters('d', 'dispensing_date')
+        
         # Базовый запрос
-        base_query = """
+        query = f"""
             SELECT 
                 p.patient_id,
                 p.fio,
                 p.birth_year,
                 p.diagnosis,
                 p.attending_doctor,
-                COUNT(DISTINCT pr.prescription_id) as total_prescriptions,
-                COUNT(DISTINCT d.dispensing_id) as total_dispensings,
-                COALESCE(SUM(pr.quantity_packs), 0) as total_prescribed_packs,
-                COALESCE(SUM(d.quantity_packs), 0) as total_dispensed_packs,
-                COALESCE(SUM(d.quantity_packs * m.price), 0) as total_cost
+                COALESCE(pr.total_prescriptions, 0) as total_prescriptions,
+                COALESCE(d.total_dispensings, 0) as total_dispensings,
+                COALESCE(pr.total_prescribed_packs, 0) as total_prescribed_packs,
+                COALESCE(d.total_dispensed_packs, 0) as total_dispensed_packs,
+                COALESCE(d.total_cost, 0) as total_cost
             FROM patients p
-            LEFT JOIN prescriptions pr ON p.patient_id = pr.patient_id
-            LEFT JOIN dispensings d ON p.patient_id = d.patient_id
-            LEFT JOIN medicines m ON d.medicine_id = m.medicine_id
+            LEFT JOIN (
+                SELECT 
+                    pr.patient_id,
+                    COUNT(*) as total_prescriptions,
+                    SUM(pr.quantity_packs) as total_prescribed_packs
+                FROM prescriptions pr{prescriptions_where}
+                GROUP BY pr.patient_id
+            ) pr ON p.patient_id = pr.patient_id
+            LEFT JOIN (
+                SELECT 
+                    d.patient_id,
+                    COUNT(*) as total_dispensings,
+                    SUM(d.quantity_packs) as total_dispensed_packs,
+                    SUM(d.quantity_packs * m.price) as total_cost
+                FROM dispensings d
+                LEFT JOIN medicines m ON d.medicine_id = m.medicine_id{dispensings_where}
+                GROUP BY d.patient_id
+            ) d ON p.patient_id = d.patient_id
         """
+        params = prescriptions_params + dispensings_params
         
         conditions = []
-        params = []
         
         # Добавляем условия фильтрации
         if patient_id:
             conditions.append("p.patient_id = ?")
             params.append(patient_id)
             
-        if start_date:
-            conditions.append("(pr.prescription_date >= ? OR d.dispensing_date >= ?)")
-            params.extend([start_date, start_date])
-            
-        if end_date:
-            conditions.append("(pr.prescription_date <= ? OR d.dispensing_date <= ?)")
-            params.extend([end_date, end_date])
+        if start_date or end_date:
+            conditions.append("(pr.patient_id IS NOT NULL OR d.patient_id IS NOT NULL)")
         
         # Формируем финальный запрос
         if conditions:
-            query = base_query + " WHERE " + " AND ".join(conditions)
-        else:
-            query = base_query
+            query += " WHERE " + " AND ".join(conditions)
             
-        query += " GROUP BY p.patient_id ORDER BY p.fio"
-        
-        # Выполняем запрос
-        patients_data = fetch_all(query, params if params else None)
+        query += " ORDER BY p.fio, p.patient_id"
+        return query, params
+    
+    @staticmethod
+    def _summarize(query, params, columns):
+        """Количество строк запроса и суммы колонок одним агрегирующим запросом."""
+        sums = ", ".join(f"COALESCE(SUM({column}), 0) as {column}" for column in columns)
+        return fetch_one(f"SELECT COUNT(*) as row_count, {sums} FROM ({query})", params if params else None)
+    
+    @staticmethod
+    @cached_report('patient')
+    def generate_patient_report(start_date=None, end_date=None, patient_id=None, lazy=False):
+        """
+        Генерирует отчет по пациентам.
         
-        # Подсчитываем общую статистику
-        total_patients = len(patients_data)
-        total_prescriptions = sum(row['total_prescriptions'] for row in patients_data)
-        total_dispensings = sum(row['total_dispensings'] for row in patients_data)
-        total_cost = sum(row['total_cost'] for row in patients_data)
+        Args:
+            start_date (str): Начальная дата в формате YYYY-MM-DD
+            end_date (str): Конечная дата в формате YYYY-MM-DD
+            patient_id (int): ID конкретного пациента (опционально)
+            lazy (bool): Вернуть строки отчета итератором по курсору; итоги
+                         при этом считаются отдельным агрегирующим запросом
+            
+        Returns:
+            dict: Отчет по пациентам
+        """
+        query, params = ReportsGenerator._patient_report_query(start_date, end_date, patient_id)
+        
+        if lazy:
+            patients_data = fetch_iter(query, params if params else None)
+            totals = ReportsGenerator._summarize(
+                query, params, ('total_prescriptions', 'total_dispensings', 'total_cost')
+            )
+            total_patients = totals['row_count']
+            total_prescriptions = totals['total_prescriptions']
+            total_dispensings = totals['total_dispensings']
+            total_cost = totals['total_cost']
+        else:
+            # Выполняем запрос
+            patients_data = fetch_all(query, params if params else None)
+            
+            # Подсчитываем общую статистику
+            total_patients = len(patients_data)
+            total_prescriptions = sum(row['total_prescriptions'] for row in patients_data)
+            total_dispensings = sum(row['total_dispensings'] for row in patients_data)
+            total_cost = sum(row['total_cost'] for row in patients_data)
         
         return {
             'patients': patients_data,
@@ -91,17 +154,38 @@ class ReportsGenerator:
         }
     
     @staticmethod
-    def generate_dispensing_report(start_date=None, end_date=None, medicine_id=None):
+    def _dispensing_conditions(start_date=None, end_date=None, medicine_id=None, alias='d'):
+        """Условия фильтрации выдач или их дневных агрегатов с псевдонимом alias: (conditions, params)."""
+        conditions = []
+        params = []
+        
+        # Добавляем условия фильтрации
+        if start_date:
+            conditions.append(f"{alias}.dispensing_date >= ?")
+            params.append(start_date)
+            
+        if end_date:
+            conditions.append(f"{alias}.dispensing_date <= ?")
+            params.append(end_date)
+            
+        if medicine_id:
+            conditions.append(f"{alias}.medicine_id = ?")
+            params.append(medicine_id)
+        
+        return conditions, params
+    
+    @staticmethod
+    def _dispensing_report_query(start_date=None, end_date=None, medicine_id=None, ordered=True):
         """
-        Генерирует отчет по выдачам.
+        Запрос строк отчёта по выдачам: (query, params).
+        
+        Каждой выдаче соответствует одна строка: из назначений пары (пациент,
+        препарат) берётся последнее на дату выдачи, а если таких нет - ближайшее
+        после неё; при совпадении дат - с большим ID.
         
         Args:
-            start_date (str): Начальная дата в формате YYYY-MM-DD
-            end_date (str): Конечная дата в формате YYYY-MM-DD
-            medicine_id (int): ID конкретного препарата (опционально)
-            
-        Returns:
-            dict: Отчет по выдачам
+            ordered (bool): Добавить сортировку по дате и ID выдачи (по убыванию);
+                            без неё запрос подходит для курсорной пагинации
         """
         # Базовый запрос
         base_query = """
@@ -122,24 +206,19 @@ class ReportsGenerator:
             FROM dispensings d
             JOIN patients p ON d.patient_id = p.patient_id
             JOIN medicines m ON d.medicine_id = m.medicine_id
-            LEFT JOIN prescriptions pr ON d.patient_id = pr.patient_id AND d.medicine_id = pr.medicine_id
+            LEFT JOIN prescriptions pr ON pr.prescription_id = COALESCE(
+                (SELECT pr2.prescription_id FROM prescriptions pr2
+                 WHERE pr2.patient_id = d.patient_id AND pr2.medicine_id = d.medicine_id
+                   AND pr2.prescription_date <= d.dispensing_date
+                 ORDER BY pr2.prescription_date DESC, pr2.prescription_id DESC LIMIT 1),
+                (SELECT pr2.prescription_id FROM prescriptions pr2
+                 WHERE pr2.patient_id = d.patient_id AND pr2.medicine_id = d.medicine_id
+                   AND pr2.prescription_date > d.dispensing_date
+                 ORDER BY pr2.prescription_date, pr2.prescription_id DESC LIMIT 1)
+            )
         """
         
-        conditions = []
-        params = []
-        
-        # Добавляем условия фильтрации
-        if start_date:
-            conditions.append("d.dispensing_date >= ?")
-            params.append(start_date)
-            
-        if end_date:
-            conditions.append("d.dispensing_date <= ?")
-            params.append(end_date)
-            
-        if medicine_id:
-            conditions.append("d.medicine_id = ?")
-            params.append(medicine_id)
+        conditions, params = ReportsGenerator._dispensing_conditions(start_date, end_date, medicine_id)
         
         # Формируем финальный запрос
         if conditions:
@@ -147,22 +226,60 @@ class ReportsGenerator:
         else:
             query = base_query
             
-        query += " ORDER BY d.dispensing_date DESC, p.fio"
+        if ordered:
+            query += " ORDER BY d.dispensing_date DESC, d.dispensing_id DESC"
+        return query, params
+    
+    @staticmethod
+    @cached_report('dispensing')
+    def generate_dispensing_report(start_date=None, end_date=None, medicine_id=None, lazy=False,
+                                   per_page=None, cursor=None):
+        """
+        Генерирует отчет по выдачам.
         
-        # Выполняем запрос
-        dispensings_data = fetch_all(query, params if params else None)
+        Статистика по препаратам и итоги считаются в SQL по дневным агрегатам
+        выдач и не зависят от того, как читаются строки отчета.
         
-        # Подсчитываем статистику по препаратам
+        Args:
+            start_date (str): Начальная дата в формате YYYY-MM-DD
+            end_date (str): Конечная дата в формате YYYY-MM-DD
+            medicine_id (int): ID конкретного препарата (опционально)
+            lazy (bool): Вернуть строки отчета итератором по курсору
+            per_page (int): Вернуть одну страницу строк отчета (курсорная пагинация)
+            cursor (str): Токен курсора из pagination предыдущей страницы
+            
+        Returns:
+            dict: Отчет по выдачам; при per_page - с данными пагинации в 'pagination'
+            
+        Raises:
+            ValueError: Если токен курсора некорректен
+        """
+        pagination = None
+        if per_page:
+            query, params = ReportsGenerator._dispensing_report_query(start_date, end_date, medicine_id, ordered=False)
+            page = fetch_keyset_paginated(query, params, ReportsGenerator.DISPENSING_KEYSET,
+                                          cursor=cursor, per_page=per_page)
+            dispensings_data = page.pop('items')
+            pagination = page
+        else:
+            query, params = ReportsGenerator._dispensing_report_query(start_date, end_date, medicine_id)
+            if lazy:
+                dispensings_data = fetch_iter(query, params if params else None)
+            else:
+                dispensings_data = fetch_all(query, params if params else None)
+        
+        # Статистика по препаратам из дневных агрегатов выдач
+        conditions, rollup_params = ReportsGenerator._dispensing_conditions(start_date, end_date, medicine_id, alias='r')
         medicine_stats_query = """
             SELECT 
                 m.medicine_id,
                 m.trade_name_vk,
                 m.standardized_mnn,
-                COUNT(d.dispensing_id) as dispensing_count,
-                SUM(d.quantity_packs) as total_packs,
-                SUM(d.quantity_packs * m.price) as total_revenue
-            FROM dispensings d
-            JOIN medicines m ON d.medicine_id = m.medicine_id
+                SUM(r.dispensings_count) as dispensing_count,
+                SUM(r.total_packs) as total_packs,
+                SUM(r.total_packs * m.price) as total_revenue
+            FROM dispensing_daily_medicines r
+            JOIN medicines m ON r.medicine_id = m.medicine_id
         """
         
         if conditions:
@@ -170,14 +287,14 @@ class ReportsGenerator:
             
         medicine_stats_query += " GROUP BY m.medicine_id ORDER BY total_revenue DESC"
         
-        medicine_stats = fetch_all(medicine_stats_query, params if params else None)
+        medicine_stats = fetch_all(medicine_stats_query, rollup_params if rollup_params else None)
         
-        # Общая статистика
-        total_dispensings = len(dispensings_data)
-        total_packs = sum(row['quantity_packs'] for row in dispensings_data)
-        total_revenue = sum(row['total_cost'] for row in dispensings_data)
+        # Общая статистика по строкам статистики препаратов
+        total_dispensings = sum(row['dispensing_count'] for row in medicine_stats)
+        total_packs = sum(row['total_packs'] for row in medicine_stats)
+        total_revenue = sum(row['total_revenue'] or 0 for row in medicine_stats)
         
-        return {
+        report = {
             'dispensings': dispensings_data,
             'medicine_statistics': medicine_stats,
             'summary': {
@@ -191,8 +308,64 @@ class ReportsGenerator:
             },
             'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         }
+        if pagination is not None:
+            report['pagination'] = pagination
+        return report
+    
+    @staticmethod
+    def _unique_patients_by_medicine(medicine_ids, start_date=None, end_date=None):
+        """
+        Количество разных пациентов с выдачами препаратов за период.
+        
+        Уникальные пациенты не складываются по дням, поэтому считаются по парам
+        (пациент, препарат) таблицы остатков с проверкой выдачи за период по индексу.
+        
+        Returns:
+            dict: ID препарата -> количество пациентов
+        """
+        if not medicine_ids:
+            return {}
+        query = f"""
+            SELECT b.medicine_id, COUNT(*) as unique_patients
+            FROM medicine_balances b
+            WHERE b.medicine_id IN ({", ".join("?" * len(medicine_ids))})
+              AND b.last_dispensing_date IS NOT NULL
+        """
+        params = list(medicine_ids)
+        conditions, date_params = ReportsGenerator._dispensing_conditions(start_date, end_date)
+        if start_date:
+            query += " AND b.last_dispensing_date >= ?"
+            params.append(start_date)
+        if conditions:
+            query += f"""
+              AND EXISTS (SELECT 1 FROM dispensings d
+                          WHERE d.patient_id = b.patient_id AND d.medicine_id = b.medicine_id
+                            AND {" AND ".join(conditions)})
+            """
+            params.extend(date_params)
+        query += " GROUP BY b.medicine_id"
+        return {row['medicine_id']: row['unique_patients'] for row in fetch_all(query, params)}
     
     @staticmethod
+    def _patients_by_doctor(start_date=None, end_date=None):
+        """
+        Количество пациентов с выдачами за период по лечащим врачам.
+        
+        Returns:
+            dict: Лечащий врач -> количество пациентов
+        """
+        conditions, params = ReportsGenerator._dispensing_conditions(start_date, end_date)
+        query = f"""
+            SELECT p.attending_doctor, COUNT(*) as patients_count
+            FROM patients p
+            WHERE EXISTS (SELECT 1 FROM dispensings d
+                          WHERE {" AND ".join(["d.patient_id = p.patient_id"] + conditions)})
+            GROUP BY p.attending_doctor
+        """
+        return {row['attending_doctor']: row['patients_count'] for row in fetch_all(query, params if params else None)}
+    
+    @staticmethod
+    @cached_report('financial')
     def generate_financial_report(start_date=None, end_date=None):
         """
         Генерирует финансовый отчет.
@@ -204,72 +377,71 @@ class ReportsGenerator:
         Returns:
             dict: Финансовый отчет
         """
+        # Все разделы читаются из дневных агрегатов выдач (см. rollups.py):
+        # стоимость - упаковки по текущей цене препарата
+        conditions, params = ReportsGenerator._dispensing_conditions(start_date, end_date, alias='r')
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        
         # Доходы по выдачам
-        revenue_query = """
+        revenue_query = f"""
             SELECT 
-                d.dispensing_date,
-                SUM(d.quantity_packs * m.price) as daily_revenue,
-                COUNT(d.dispensing_id) as dispensings_count
-            FROM dispensings d
-            JOIN medicines m ON d.medicine_id = m.medicine_id
+                r.dispensing_date,
+                SUM(r.total_packs * m.price) as daily_revenue,
+                SUM(r.dispensings_count) as dispensings_count
+            FROM dispensing_daily_medicines r
+            JOIN medicines m ON r.medicine_id = m.medicine_id
+            {where}
+            GROUP BY r.dispensing_date ORDER BY r.dispensing_date
         """
         
-        conditions = []
-        params = []
-        
-        if start_date:
-            conditions.append("d.dispensing_date >= ?")
-            params.append(start_date)
-            
-        if end_date:
-            conditions.append("d.dispensing_date <= ?")
-            params.append(end_date)
-        
-        if conditions:
-            revenue_query += " WHERE " + " AND ".join(conditions)
-            
-        revenue_query += " GROUP BY d.dispensing_date ORDER BY d.dispensing_date"
-        
-        daily_revenue = fetch_all(revenue_query, params if params else None)
-        
         # Топ препаратов по доходам
-        top_medicines_query = """
+        top_medicines_query = f"""
             SELECT 
+                m.medicine_id,
                 m.trade_name_vk,
                 m.standardized_mnn,
                 m.price,
-                SUM(d.quantity_packs) as total_packs_sold,
-                SUM(d.quantity_packs * m.price) as total_revenue,
-                COUNT(DISTINCT d.patient_id) as unique_patients
-            FROM dispensings d
-            JOIN medicines m ON d.medicine_id = m.medicine_id
+                SUM(r.total_packs) as total_packs_sold,
+                SUM(r.total_packs * m.price) as total_revenue
+            FROM dispensing_daily_medicines r
+            JOIN medicines m ON r.medicine_id = m.medicine_id
+            {where}
+            GROUP BY m.medicine_id ORDER BY total_revenue DESC LIMIT 10
         """
         
-        if conditions:
-            top_medicines_query += " WHERE " + " AND ".join(conditions)
-            
-        top_medicines_query += " GROUP BY m.medicine_id ORDER BY total_revenue DESC LIMIT 10"
-        
-        top_medicines = fetch_all(top_medicines_query, params if params else None)
+        def top_medicines_section():
+            top_medicines = [dict(row) for row in fetch_all(top_medicines_query, params if params else None)]
+            unique_patients = ReportsGenerator._unique_patients_by_medicine(
+                [row['medicine_id'] for row in top_medicines], start_date, end_date
+            )
+            for row in top_medicines:
+                row['unique_patients'] = unique_patients.get(row['medicine_id'], 0)
+            return top_medicines
         
         # Статистика по врачам
-        doctors_stats_query = """
+        doctors_stats_query = f"""
             SELECT 
-                p.attending_doctor,
-                COUNT(DISTINCT d.dispensing_id) as dispensings_count,
-                COUNT(DISTINCT d.patient_id) as patients_count,
-                SUM(d.quantity_packs * m.price) as total_revenue
-            FROM dispensings d
-            JOIN patients p ON d.patient_id = p.patient_id
-            JOIN medicines m ON d.medicine_id = m.medicine_id
+                r.attending_doctor,
+                SUM(r.dispensings_count) as dispensings_count,
+                SUM(r.total_packs * m.price) as total_revenue
+            FROM dispensing_daily_doctors r
+            JOIN medicines m ON r.medicine_id = m.medicine_id
+            {where}
+            GROUP BY r.attending_doctor ORDER BY total_revenue DESC
         """
         
-        if conditions:
-            doctors_stats_query += " WHERE " + " AND ".join(conditions)
-            
-        doctors_stats_query += " GROUP BY p.attending_doctor ORDER BY total_revenue DESC"
-        
-        doctors_stats = fetch_all(doctors_stats_query, params if params else None)
+        # Разделы независимы и выполняются параллельно на отдельных соединениях
+        sections = run_sections({
+            'daily_revenue': lambda: fetch_all(revenue_query, params if params else None),
+            'top_medicines': top_medicines_section,
+            'doctors_stats': lambda: fetch_all(doctors_stats_query, params if params else None),
+            'patients_count': lambda: ReportsGenerator._patients_by_doctor(start_date, end_date),
+        })
+        daily_revenue = sections['daily_revenue']
+        top_medicines = sections['top_medicines']
+        doctors_stats = [dict(row) for row in sections['doctors_stats']]
+        for row in doctors_stats:
+            row['patients_count'] = sections['patients_count'].get(row['attending_doctor'], 0)
         
         # Общая статистика
         total_revenue = sum(row['daily_revenue'] for row in daily_revenue)
@@ -296,6 +468,63 @@ class ReportsGenerator:
             'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         }
     
+    # Колонки CSV по типам отчётов: (ключ строк в данных отчёта, заголовки)
+    CSV_LAYOUTS = {
+        'patient': ('patients', ['ФИО', 'Год рождения', 'Диагноз', 'Лечащий врач', 
+                                 'Назначений', 'Выдач', 'Назначено упаковок', 'Выдано упаковок', 'Общая стоимость']),
+        'dispensing': ('dispensings', ['Дата выдачи', 'Пациент', 'Диагноз', 'Препарат', 
+                                       'МНН', 'Дозировка', 'Форма выпуска', 'Количество упаковок', 
+                                       'Цена за упаковку', 'Общая стоимость']),
+        'financial': ('top_medicines', ['Препарат', 'МНН', 'Цена за упаковку', 
+                                        'Продано упаковок', 'Общий доход', 'Уникальных пациентов']),
+    }
+    
+    @staticmethod
+    def _csv_row(report_type, row):
+        """Преобразование строки отчёта в строку CSV."""
+        if report_type == 'patient':
+            return [
+                row['fio'],
+                row['birth_year'],
+                row['diagnosis'],
+                row['attending_doctor'],
+                row['total_prescriptions'],
+                row['total_dispensings'],
+                row['total_prescribed_packs'],
+                row['total_dispensed_packs'],
+                f"{row['total_cost']:.2f}"
+            ]
+        if report_type == 'dispensing':
+            return [
+                row['dispensing_date'],
+                row['patient_name'],
+                row['diagnosis'],
+                row['medicine_name'],
+                row['standardized_mnn'],
+                row['standardized_dosage'],
+                row['standardized_dosage_form'],
+                row['quantity_packs'],
+                f"{row['price']:.2f}",
+                f"{row['total_cost']:.2f}"
+            ]
+        return [
+            row['trade_name_vk'],
+            row['standardized_mnn'],
+            f"{row['price']:.2f}",
+            row['total_packs_sold'],
+            f"{row['total_revenue']:.2f}",
+            row['unique_patients']
+        ]
+    
+    @staticmethod
+    def _csv_rows(report_type, rows):
+        """Заголовок и строки CSV отчёта."""
+        if report_type not in ReportsGenerator.CSV_LAYOUTS:
+            return
+        yield ReportsGenerator.CSV_LAYOUTS[report_type][1]
+        for row in rows:
+            yield ReportsGenerator._csv_row(report_type, row)
+    
     @staticmethod
     def export_report_to_csv(report_data, report_type):
         """
@@ -308,65 +537,43 @@ class ReportsGenerator:
         Returns:
             str: CSV содержимое
         """
-        output = io.StringIO()
+        if report_type not in ReportsGenerator.CSV_LAYOUTS:
+            return ''
+        rows = report_data[ReportsGenerator.CSV_LAYOUTS[report_type][0]]
+        return ''.join(iter_csv(ReportsGenerator._csv_rows(report_type, rows)))
+    
+    @staticmethod
+    def stream_report_csv(report_type, start_date=None, end_date=None, patient_id=None, 
+                          medicine_id=None, chunk_size=1000):
+        """
+        Потоковая выгрузка отчета в CSV без построения отчета в памяти.
         
-        if report_type == 'patient':
-            writer = csv.writer(output)
-            writer.writerow(['ФИО', 'Год рождения', 'Диагноз', 'Лечащий врач', 
-                           'Назначений', 'Выдач', 'Назначено упаковок', 'Выдано упаковок', 'Общая стоимость'])
+        Строки отчетов по пациентам и выдачам читаются из курсора частями по
+        chunk_size и сразу сериализуются; финансовый отчет содержит не более
+        10 строк и строится целиком.
+        
+        Args:
+            report_type (str): Тип отчета ('patient', 'dispensing', 'financial')
+            start_date (str): Начальная дата в формате YYYY-MM-DD
+            end_date (str): Конечная дата в формате YYYY-MM-DD
+            patient_id (int): ID пациента для отчета по пациентам (опционально)
+            medicine_id (int): ID препарата для отчета по выдачам (опционально)
+            chunk_size (int): Количество строк, читаемых из курсора за раз
             
-            for patient in report_data['patients']:
-                writer.writerow([
-                    patient['fio'],
-                    patient['birth_year'],
-                    patient['diagnosis'],
-                    patient['attending_doctor'],
-                    patient['total_prescriptions'],
-                    patient['total_dispensings'],
-                    patient['total_prescribed_packs'],
-                    patient['total_dispensed_packs'],
-                    f"{patient['total_cost']:.2f}"
-                ])
-                
+        Yields:
+            str: Очередной блок CSV
+        """
+        if report_type == 'patient':
+            query, params = ReportsGenerator._patient_report_query(start_date, end_date, patient_id)
         elif report_type == 'dispensing':
-            writer = csv.writer(output)
-            writer.writerow(['Дата выдачи', 'Пациент', 'Диагноз', 'Препарат', 
-                           'МНН', 'Дозировка', 'Форма выпуска', 'Количество упаковок', 
-                           'Цена за упаковку', 'Общая стоимость'])
-            
-            for dispensing in report_data['dispensings']:
-                writer.writerow([
-                    dispensing['dispensing_date'],
-                    dispensing['patient_name'],
-                    dispensing['diagnosis'],
-                    dispensing['medicine_name'],
-                    dispensing['standardized_mnn'],
-                    dispensing['standardized_dosage'],
-                    dispensing['standardized_dosage_form'],
-                    dispensing['quantity_packs'],
-                    f"{dispensing['price']:.2f}",
-                    f"{dispensing['total_cost']:.2f}"
-                ])
-                
-        elif report_type == 'financial':
-            writer = csv.writer(output)
-            writer.writerow(['Препарат', 'МНН', 'Цена за упаковку', 
-                           'Продано упаковок', 'Общий доход', 'Уникальных пациентов'])
-            
-            for medicine in report_data['top_medicines']:
-                writer.writerow([
-                    medicine['trade_name_vk'],
-                    medicine['standardized_mnn'],
-                    f"{medicine['price']:.2f}",
-                    medicine['total_packs_sold'],
-                    f"{medicine['total_revenue']:.2f}",
-                    medicine['unique_patients']
-                ])
-        
-        csv_content = output.getvalue()
-        output.close()
-        
-        return csv_content
+            query, params = ReportsGenerator._dispensing_report_query(start_date, end_date, medicine_id)
+        else:
+            report_data = ReportsGenerator.generate_financial_report(start_date, end_date)
+            yield ReportsGenerator.export_report_to_csv(report_data, report_type)
+            return
+        
+        rows = fetch_iter(query, params if params else None, arraysize=chunk_size)
+        yield from iter_csv(ReportsGenerator._csv_rows(report_type, rows))
     
     @staticmethod
     def get_date_range_presets():
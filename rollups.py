@@ -0,0 +1,219 @@
+"""
+Модуль дневных агрегатов выдач для финансовых отчётов и отчётов по выдачам.
+"""
+
+import sqlite3
+import click
+from flask import current_app
+
+# Агрегаты выдач: таблица -> колонки ключа (помимо даты выдачи)
+ROLLUP_TABLES = {
+    'dispensing_daily_medicines': ('medicine_id',),
+    'dispensing_daily_doctors': ('attending_doctor', 'medicine_id'),
+}
+
+def create_rollup_tables(db):
+    """
+    Создание таблиц дневных агрегатов выдач и триггеров их синхронизации.
+
+    dispensing_daily_medicines хранит количество выдач и упаковок за день по
+    препарату, dispensing_daily_doctors - за день по лечащему врачу и препарату.
+    Стоимость в агрегатах не хранится: отчёты умножают упаковки на текущую цену
+    препарата, поэтому изменение цены не требует пересчёта. Вставка выдачи
+    увеличивает агрегаты, удаление и изменение выдачи или смена лечащего врача
+    пациента пересчитывают затронутые ключи по исходным строкам. Вновь
+    созданные таблицы заполняются из существующих данных.
+
+    Args:
+        db: Соединение с базой данных
+    """
+    exists = db.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name IN ({})".format(
+            ", ".join("?" * len(ROLLUP_TABLES))),
+        tuple(ROLLUP_TABLES)
+    ).fetchone()[0] == len(ROLLUP_TABLES)
+
+    for table, key in ROLLUP_TABLES.items():
+        key_columns = "".join(
+            f"{column} {'TEXT' if column == 'attending_doctor' else 'INTEGER'} NOT NULL, " for column in key
+        )
+        db.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                dispensing_date DATE NOT NULL,
+                {key_columns}
+                dispensings_count INTEGER NOT NULL DEFAULT 0,
+                total_packs REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (dispensing_date, {", ".join(key)})
+            ) WITHOUT ROWID
+        ''')
+
+    db.execute('''
+        CREATE TRIGGER IF NOT EXISTS dispensings_rollup_ai AFTER INSERT ON dispensings BEGIN
+            INSERT INTO dispensing_daily_medicines (dispensing_date, medicine_id, dispensings_count, total_packs)
+            VALUES (new.dispensing_date, new.medicine_id, 1, new.quantity_packs)
+            ON CONFLICT (dispensing_date, medicine_id) DO UPDATE SET
+                dispensings_count = dispensings_count + 1,
+                total_packs = total_packs + excluded.total_packs;
+            INSERT INTO dispensing_daily_doctors (dispensing_date, attending_doctor, medicine_id,
+                                                  dispensings_count, total_packs)
+            SELECT new.dispensing_date, attending_doctor, new.medicine_id, 1, new.quantity_packs
+            FROM patients WHERE patient_id = new.patient_id
+            ON CONFLICT (dispensing_date, attending_doctor, medicine_id) DO UPDATE SET
+                dispensings_count = dispensings_count + 1,
+                total_packs = total_packs + excluded.total_packs;
+        END
+    ''')
+    db.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS dispensings_rollup_ad AFTER DELETE ON dispensings BEGIN
+            {_refresh_dispensing_sql('old')}
+        END
+    ''')
+    db.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS dispensings_rollup_au
+        AFTER UPDATE OF patient_id, medicine_id, quantity_packs, dispensing_date ON dispensings BEGIN
+            {_refresh_dispensing_sql('old')}
+            {_refresh_dispensing_sql('new')}
+        END
+    ''')
+    db.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS patients_rollup_au AFTER UPDATE OF attending_doctor ON patients
+        WHEN old.attending_doctor IS NOT new.attending_doctor BEGIN
+            {_refresh_doctors_sql('old.patient_id', 'old.attending_doctor, new.attending_doctor')}
+        END
+    ''')
+    db.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS patients_rollup_ad AFTER DELETE ON patients BEGIN
+            {_refresh_doctors_sql('old.patient_id', 'old.attending_doctor')}
+        END
+    ''')
+
+    if not exists:
+        rebuild_rollups(db)
+
+# Агрегаты, рассчитанные заново по выдачам: таблица -> запрос
+_ROLLUPS_FROM_SOURCES = {
+    'dispensing_daily_medicines': """
+        SELECT dispensing_date, medicine_id, COUNT(*) as dispensings_count, SUM(quantity_packs) as total_packs
+        FROM dispensings
+        {where}
+        GROUP BY dispensing_date, medicine_id
+    """,
+    'dispensing_daily_doctors': """
+        SELECT d.dispensing_date, p.attending_doctor, d.medicine_id,
+               COUNT(*) as dispensings_count, SUM(d.quantity_packs) as total_packs
+        FROM dispensings d
+        JOIN patients p ON d.patient_id = p.patient_id
+        {where}
+        GROUP BY d.dispensing_date, p.attending_doctor, d.medicine_id
+    """,
+}
+
+def _refresh_doctors_sql(patient_id, doctors):
+    """Операторы пересчёта агрегатов врачей doctors по дням и препаратам выдач пациента patient_id."""
+    keys = f"(SELECT dispensing_date, medicine_id FROM dispensings WHERE patient_id = {patient_id})"
+    return f"""
+        DELETE FROM dispensing_daily_doctors
+        WHERE attending_doctor IN ({doctors}) AND (dispensing_date, medicine_id) IN {keys};
+        INSERT INTO dispensing_daily_doctors (dispensing_date, attending_doctor, medicine_id,
+                                              dispensings_count, total_packs)
+        {_ROLLUPS_FROM_SOURCES['dispensing_daily_doctors'].format(
+            where=f"WHERE p.attending_doctor IN ({doctors}) AND (d.dispensing_date, d.medicine_id) IN {keys}")};
+    """
+
+def _refresh_dispensing_sql(row):
+    """Операторы пересчёта агрегатов дня и препарата строки row ('old' или 'new') выдач."""
+    doctor = f"(SELECT attending_doctor FROM patients WHERE patient_id = {row}.patient_id)"
+    return f"""
+        DELETE FROM dispensing_daily_medicines
+        WHERE dispensing_date = {row}.dispensing_date AND medicine_id = {row}.medicine_id;
+        INSERT INTO dispensing_daily_medicines (dispensing_date, medicine_id, dispensings_count, total_packs)
+        {_ROLLUPS_FROM_SOURCES['dispensing_daily_medicines'].format(
+            where=f"WHERE dispensing_date = {row}.dispensing_date AND medicine_id = {row}.medicine_id")};
+        DELETE FROM dispensing_daily_doctors
+        WHERE dispensing_date = {row}.dispensing_date AND medicine_id = {row}.medicine_id
+          AND attending_doctor = {doctor};
+        INSERT INTO dispensing_daily_doctors (dispensing_date, attending_doctor, medicine_id,
+                                              dispensings_count, total_packs)
+        {_ROLLUPS_FROM_SOURCES['dispensing_daily_doctors'].format(
+            where=f"WHERE d.dispensing_date = {row}.dispensing_date AND d.medicine_id = {row}.medicine_id "
+                  f"AND p.attending_doctor = {doctor}")};
+    """
+
+def rebuild_rollups(db):
+    """
+    Полная перестройка таблиц дневных агрегатов по выдачам.
+
+    Args:
+        db: Соединение с базой данных
+
+    Returns:
+        dict: Количество строк в каждой таблице агрегатов после перестройки
+    """
+    counts = {}
+    for table, key in ROLLUP_TABLES.items():
+        columns = ", ".join(('dispensing_date',) + key + ('dispensings_count', 'total_packs'))
+        db.execute(f"DELETE FROM {table}")
+        db.execute(f"INSERT INTO {table} ({columns}) {_ROLLUPS_FROM_SOURCES[table].format(where='')}")
+        counts[table] = db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    return counts
+
+def verify_rollups(db, tolerance=1e-6):
+    """
+    Сверка таблиц дневных агрегатов с выдачами.
+
+    Args:
+        db: Соединение с базой данных
+        tolerance (float): Допустимое расхождение сумм упаковок
+
+    Returns:
+        list: Ключи с расхождениями в виде словарей с ожидаемыми и сохранёнными значениями
+    """
+    mismatches = []
+    for table, key in ROLLUP_TABLES.items():
+        key_columns = ('dispensing_date',) + key
+        row_key = lambda row: tuple(row[column] for column in key_columns)
+        expected = {row_key(row): row for row in db.execute(_ROLLUPS_FROM_SOURCES[table].format(where=''))}
+        stored = {row_key(row): row for row in db.execute(f"SELECT * FROM {table}")}
+
+        for row_id in sorted(expected.keys() | stored.keys()):
+            exp, got = expected.get(row_id), stored.get(row_id)
+            if exp is not None and got is not None and exp['dispensings_count'] == got['dispensings_count'] \
+                    and abs(exp['total_packs'] - got['total_packs']) <= tolerance:
+                continue
+            mismatches.append({
+                'table': table,
+                'key': dict(zip(key_columns, row_id)),
+                'expected': dict(exp) if exp is not None else None,
+                'stored': dict(got) if got is not None else None,
+            })
+    return mismatches
+
+def init_rollup_commands(app):
+    """
+    Регистрация команды обслуживания дневных агрегатов:
+
+        flask --app app_updated rollups verify
+        flask --app app_updated rollups rebuild
+    """
+    @app.cli.command("rollups")
+    @click.argument("action", type=click.Choice(["verify", "rebuild"]))
+    def rollups_command(action):
+        """Сверка (verify) или перестройка (rebuild) таблиц дневных агрегатов выдач."""
+        db = sqlite3.connect(current_app.config['DATABASE_PATH'])
+        db.row_factory = sqlite3.Row
+        try:
+            if action == "rebuild":
+                with db:
+                    counts = rebuild_rollups(db)
+                for table, count in counts.items():
+                    click.echo(f"Таблица {table} перестроена: {count} строк")
+                return
+
+            mismatches = verify_rollups(db)
+            for mismatch in mismatches[:20]:
+                click.echo(f"Расхождение: {mismatch}")
+            if mismatches:
+                raise click.ClickException(f"Найдено расхождений: {len(mismatches)}")
+            click.echo("Расхождений не найдено")
+        finally:
+            db.close()
@@ -1,6 +1,8 @@
-from flask import render_template, request, redirect, url_for, flash, make_response
+from flask import render_template, request, redirect, url_for, flash
 from models import Patient, Medicine, Prescription, Dispensing
 from business_logic import BusinessLogic
+from autocomplete import patient_index, medicine_index
+from csv_export import csv_response
 from datetime import datetime
 
 def init_routes(app):
@@ -331,21 +333,15 @@ def init_routes(app):
         if len(query) < 2:
             return jsonify([])
         
-        # Поиск пациентов по ФИО или диагнозу
-        patients = Patient.get_all()
-        filtered_patients = []
-        
-        for patient in patients:
-            if (query.lower() in patient.fio.lower() or 
-                query.lower() in patient.diagnosis.lower()):
-                filtered_patients.append({
-                    "id": patient.patient_id,
-                    "text": f"{patient.fio} ({patient.diagnosis})",
-                    "fio": patient.fio,
-                    "diagnosis": patient.diagnosis
-                })
-        
-        return jsonify(filtered_patients[:10])  # Ограничиваем до 10 результатов
+        # Поиск пациентов по началу слов ФИО или диагноза через индекс автозаполнения
+        patients = patient_index.search(query, app.config.get("AUTOCOMPLETE_LIMIT", 10))
+        
+        return jsonify([{
+            "id": patient["patient_id"],
+            "text": f"{patient['fio']} ({patient['diagnosis']})",
+            "fio": patient["fio"],
+            "diagnosis": patient["diagnosis"]
+        } for patient in patients])
     
     @app.route("/api/medicines/search")
     def search_medicines():
@@ -356,24 +352,18 @@ def init_routes(app):
         if len(query) < 2:
             return jsonify([])
         
-        # Поиск препаратов по торговому названию или МНН
-        medicines = Medicine.get_all()
-        filtered_medicines = []
-        
-        for medicine in medicines:
-            if (query.lower() in medicine.trade_name_vk.lower() or 
-                query.lower() in medicine.standardized_mnn.lower()):
-                filtered_medicines.append({
-                    "id": medicine.medicine_id,
-                    "text": f"{medicine.trade_name_vk} ({medicine.standardized_mnn}) - {medicine.price} руб.",
-                    "trade_name": medicine.trade_name_vk,
-                    "mnn": medicine.standardized_mnn,
-                    "price": medicine.price,
-                    "dosage": medicine.standardized_dosage,
-                    "packaging": medicine.packaging
-                })
-        
-        return jsonify(filtered_medicines[:10])  # Ограничиваем до 10 результатов
+        # Поиск препаратов по началу слов торгового названия или МНН через индекс автозаполнения
+        medicines = medicine_index.search(query, app.config.get("AUTOCOMPLETE_LIMIT", 10))
+        
+        return jsonify([{
+            "id": medicine["medicine_id"],
+            "text": f"{medicine['trade_name_vk']} ({medicine['standardized_mnn']}) - {medicine['price']} руб.",
+            "trade_name": medicine["trade_name_vk"],
+            "mnn": medicine["standardized_mnn"],
+            "price": medicine["price"],
+            "dosage": medicine["standardized_dosage"],
+            "packaging": medicine["packaging"]
+        } for medicine in medicines])
 
     # Маршруты для отчётов
     @app.route("/reports")
@@ -396,13 +386,8 @@ def init_routes(app):
     @app.route("/reports/export/medicines")
     def export_medicine_report():
         """Экспорт отчёта по препаратам в CSV."""
-        csv_content = BusinessLogic.export_medicine_report_to_csv()
-        
-        response = make_response(csv_content)
-        response.headers["Content-Type"] = "text/csv; charset=utf-8"
-        response.headers["Content-Disposition"] = f"attachment; filename=medicine_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        
-        return response
+        chunks = BusinessLogic.stream_medicine_report_csv(app.config.get("REPORTS_EXPORT_CHUNK_SIZE", 1000))
+        return csv_response(chunks, f"medicine_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
     
     @app.route("/reports/patient", methods=["GET", "POST"])
     def patient_report():
@@ -446,17 +431,23 @@ def init_routes(app):
         """Отчёт по выдачам."""
         from reports_generator import ReportsGenerator
         
-        if request.method == "POST":
-            start_date = request.form.get("start_date")
-            end_date = request.form.get("end_date")
-            medicine_id = request.form.get("medicine_id")
+        # Фильтры приходят из формы, а при переходе по страницам - из параметров ссылки
+        if request.method == "POST" or "cursor" in request.args:
+            start_date = request.values.get("start_date")
+            end_date = request.values.get("end_date")
+            medicine_id = request.values.get("medicine_id")
             medicine_id = int(medicine_id) if medicine_id else None
             
-            report_data = ReportsGenerator.generate_dispensing_report(
-                start_date=start_date,
-                end_date=end_date,
-                medicine_id=medicine_id
-            )
+            # Строки отчёта выводятся постранично, итоги считаются по всему периоду
+            report_args = dict(start_date=start_date, end_date=end_date, medicine_id=medicine_id,
+                               per_page=app.config.get("REPORTS_PAGE_SIZE", 100))
+            try:
+                report_data = ReportsGenerator.generate_dispensing_report(
+                    cursor=request.args.get("cursor") or None, **report_args
+                )
+            except ValueError as e:
+                flash(str(e), "error")
+                report_data = ReportsGenerator.generate_dispensing_report(**report_args)
             
             medicines = Medicine.get_all()
             date_presets = ReportsGenerator.get_date_range_presets()
@@ -518,19 +509,14 @@ def init_routes(app):
         patient_id = request.args.get("patient_id")
         patient_id = int(patient_id) if patient_id else None
         
-        report_data = ReportsGenerator.generate_patient_report(
+        chunks = ReportsGenerator.stream_report_csv(
+            'patient',
             start_date=start_date,
             end_date=end_date,
-            patient_id=patient_id
+            patient_id=patient_id,
+            chunk_size=app.config.get("REPORTS_EXPORT_CHUNK_SIZE", 1000)
         )
-        
-        csv_content = ReportsGenerator.export_report_to_csv(report_data, 'patient')
-        
-        response = make_response(csv_content)
-        response.headers["Content-Type"] = "text/csv; charset=utf-8"
-        response.headers["Content-Disposition"] = f"attachment; filename=patient_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        
-        return response
+        return csv_response(chunks, f"patient_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
     
     @app.route("/reports/export/dispensing")
     def export_dispensing_report():
@@ -542,19 +528,14 @@ def init_routes(app):
         medicine_id = request.args.get("medicine_id")
         medicine_id = int(medicine_id) if medicine_id else None
         
-        report_data = ReportsGenerator.generate_dispensing_report(
+        chunks = ReportsGenerator.stream_report_csv(
+            'dispensing',
             start_date=start_date,
             end_date=end_date,
-            medicine_id=medicine_id
+            medicine_id=medicine_id,
+            chunk_size=app.config.get("REPORTS_EXPORT_CHUNK_SIZE", 1000)
         )
-        
-        csv_content = ReportsGenerator.export_report_to_csv(report_data, 'dispensing')
-        
-        response = make_response(csv_content)
-        response.headers["Content-Type"] = "text/csv; charset=utf-8"
-        response.headers["Content-Disposition"] = f"attachment; filename=dispensing_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        
-        return response
+        return csv_response(chunks, f"dispensing_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
     
     @app.route("/reports/export/financial")
     def export_financial_report():
@@ -564,18 +545,12 @@ def init_routes(app):
         start_date = request.args.get("start_date")
         end_date = request.args.get("end_date")
         
-        report_data = ReportsGenerator.generate_financial_report(
+        chunks = ReportsGenerator.stream_report_csv(
+            'financial',
             start_date=start_date,
             end_date=end_date
         )
-        
-        csv_content = ReportsGenerator.export_report_to_csv(report_data, 'financial')
-        
-        response = make_response(csv_content)
-        response.headers["Content-Type"] = "text/csv; charset=utf-8"
-        response.headers["Content-Disposition"] = f"attachment; filename=financial_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        
-        return response
+        return csv_response(chunks, f"financial_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
     
     # API маршруты для AJAX запросов
     @app.route("/api/patient/<int:patient_id>/remaining_need/<int:medicine_id>")
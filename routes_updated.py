@@ -1,13 +1,20 @@
-from flask import render_template, request, redirect, url_for, flash, make_response, jsonify
+from flask import render_template, request, redirect, url_for, flash, jsonify, send_file
 from models_updated import Patient, Medicine, Prescription, Dispensing
+from database_updated import fetch_iter, transaction, COUNT_EXACT, COUNT_NONE
 from business_logic import BusinessLogic
+from autocomplete import patient_index, medicine_index
+from csv_export import iter_csv, csv_response
+from cache import report_cache, patient_summary_cache
+from report_jobs import REPORT_JOB_FORMATS, get_report_jobs, submit_report_job
 from datetime import datetime
-import csv
-import io
 
 def init_routes(app):
     """Инициализация маршрутов Flask приложения с поддержкой пагинации."""
     
+    def count_strategy(name):
+        """Стратегия подсчёта общего количества записей для списка (PAGINATION_COUNT_STRATEGIES)."""
+        return app.config.get("PAGINATION_COUNT_STRATEGIES", {}).get(name, COUNT_EXACT)
+    
     @app.route("/")
     def index():
         """Главная страница."""
@@ -25,9 +32,9 @@ def init_routes(app):
         per_page = min(per_page, 100)
         
         if search:
-            pagination_data = Patient.search_paginated(search, page, per_page)
+            pagination_data = Patient.search_paginated(search, page, per_page, count=count_strategy("patients"))
         else:
-            pagination_data = Patient.get_paginated(page, per_page)
+            pagination_data = Patient.get_paginated(page, per_page, count=count_strategy("patients"))
         
         return render_template("patients_paginated.html", 
                              patients=pagination_data["items"],
@@ -104,11 +111,11 @@ def init_routes(app):
         per_page = min(per_page, 100)
         
         if min_price is not None or max_price is not None:
-            pagination_data = Medicine.get_by_price_range(min_price, max_price, page, per_page)
+            pagination_data = Medicine.get_by_price_range(min_price, max_price, page, per_page, count=count_strategy("medicines"))
         elif search:
-            pagination_data = Medicine.search_paginated(search, page, per_page)
+            pagination_data = Medicine.search_paginated(search, page, per_page, count=count_strategy("medicines"))
         else:
-            pagination_data = Medicine.get_paginated(page, per_page)
+            pagination_data = Medicine.get_paginated(page, per_page, count=count_strategy("medicines"))
         
         return render_template("medicines_paginated.html", 
                              medicines=pagination_data["items"],
@@ -190,18 +197,26 @@ def init_routes(app):
         page = request.args.get("page", 1, type=int)
         per_page = request.args.get("per_page", 10, type=int)
         patient_id = request.args.get("patient_id", type=int)
+        cursor = request.args.get("cursor", type=str)
         
         # Ограничение количества записей на странице для производительности
         per_page = min(per_page, 100)
         
-        if patient_id:
-            pagination_data = Prescription.get_by_patient_paginated(patient_id, page, per_page)
-        else:
-            pagination_data = Prescription.get_paginated(page, per_page)
+        def load_page(page, cursor):
+            if patient_id:
+                return Prescription.get_by_patient_paginated(patient_id, page, per_page, cursor=cursor, count=count_strategy("prescriptions"))
+            return Prescription.get_paginated(page, per_page, cursor=cursor, count=count_strategy("prescriptions"))
+        
+        # Повреждённый курсор из ссылки - переход на первую страницу
+        try:
+            pagination_data = load_page(page, cursor)
+        except ValueError as e:
+            flash(str(e), "error")
+            pagination_data = load_page(1, None)
         
         # Получаем списки пациентов и препаратов для фильтров (ограниченное количество)
-        patients = Patient.get_paginated(1, 50)["items"]  # Первые 50 пациентов для выпадающего списка
-        medicines = Medicine.get_paginated(1, 50)["items"]  # Первые 50 препаратов для выпадающего списка
+        patients = Patient.get_paginated(1, 50, count=COUNT_NONE, columns=Patient.CHOICE_FIELDS)["items"]  # Первые 50 пациентов для выпадающего списка
+        medicines = Medicine.get_paginated(1, 50, count=COUNT_NONE, columns=Medicine.CHOICE_FIELDS)["items"]  # Первые 50 препаратов для выпадающего списка
         
         return render_template("prescriptions_paginated.html", 
                              prescriptions=pagination_data["items"],
@@ -221,31 +236,33 @@ def init_routes(app):
                 treatment_days = int(request.form.get("treatment_days", 0)) if request.form.get("treatment_days") else None
                 quantity_packs = float(request.form["quantity_packs"])
                 
-                # Валидация
-                is_valid, error_message = BusinessLogic.validate_prescription(
-                    patient_id, medicine_id, quantity_packs
-                )
-                
-                if not is_valid:
-                    flash(error_message, "error")
-                else:
-                    prescription = Prescription(
-                        patient_id=patient_id,
-                        medicine_id=medicine_id,
-                        prescription_date=request.form["prescription_date"],
-                        quantity_packs=quantity_packs,
-                        daily_dose=daily_dose,
-                        treatment_days=treatment_days
+                # Проверка и запись в одной транзакции: пациент и препарат не удаляются между ними
+                with transaction(immediate=True):
+                    # Валидация
+                    is_valid, error_message = BusinessLogic.validate_prescription(
+                        patient_id, medicine_id, quantity_packs
                     )
-                    prescription.save()
-                    flash("Назначение успешно добавлено", "success")
-                    return redirect(url_for("prescriptions"))
+                
+                    if not is_valid:
+                        flash(error_message, "error")
+                    else:
+                        prescription = Prescription(
+                            patient_id=patient_id,
+                            medicine_id=medicine_id,
+                            prescription_date=request.form["prescription_date"],
+                            quantity_packs=quantity_packs,
+                            daily_dose=daily_dose,
+                            treatment_days=treatment_days
+                        )
+                        prescription.save()
+                        flash("Назначение успешно добавлено", "success")
+                        return redirect(url_for("prescriptions"))
             except Exception as e:
                 flash(f"Ошибка при добавлении назначения: {str(e)}", "error")
         
         # Получаем ограниченные списки для форм
-        patients = Patient.get_paginated(1, 100)["items"]
-        medicines = Medicine.get_paginated(1, 100)["items"]
+        patients = Patient.get_paginated(1, 100, count=COUNT_NONE, columns=Patient.CHOICE_FIELDS)["items"]
+        medicines = Medicine.get_paginated(1, 100, count=COUNT_NONE, columns=Medicine.CHOICE_FIELDS)["items"]
         return render_template("prescription_form.html", patients=patients, medicines=medicines)
     
     @app.route("/prescriptions/edit/<int:prescription_id>", methods=["GET", "POST"])
@@ -270,8 +287,8 @@ def init_routes(app):
             except Exception as e:
                 flash(f"Ошибка при обновлении назначения: {str(e)}", "error")
         
-        patients = Patient.get_paginated(1, 100)["items"]
-        medicines = Medicine.get_paginated(1, 100)["items"]
+        patients = Patient.get_paginated(1, 100, count=COUNT_NONE, columns=Patient.CHOICE_FIELDS)["items"]
+        medicines = Medicine.get_paginated(1, 100, count=COUNT_NONE, columns=Medicine.CHOICE_FIELDS)["items"]
         return render_template("prescription_form.html", prescription=prescription, patients=patients, medicines=medicines)
 
     @app.route("/prescriptions/delete/<int:prescription_id>", methods=["POST"])
@@ -296,18 +313,26 @@ def init_routes(app):
         page = request.args.get("page", 1, type=int)
         per_page = request.args.get("per_page", 10, type=int)
         patient_id = request.args.get("patient_id", type=int)
+        cursor = request.args.get("cursor", type=str)
         
         # Ограничение количества записей на странице для производительности
         per_page = min(per_page, 100)
         
-        if patient_id:
-            pagination_data = Dispensing.get_by_patient_paginated(patient_id, page, per_page)
-        else:
-            pagination_data = Dispensing.get_paginated(page, per_page)
+        def load_page(page, cursor):
+            if patient_id:
+                return Dispensing.get_by_patient_paginated(patient_id, page, per_page, cursor=cursor, count=count_strategy("dispensings"))
+            return Dispensing.get_paginated(page, per_page, cursor=cursor, count=count_strategy("dispensings"))
+        
+        # Повреждённый курсор из ссылки - переход на первую страницу
+        try:
+            pagination_data = load_page(page, cursor)
+        except ValueError as e:
+            flash(str(e), "error")
+            pagination_data = load_page(1, None)
         
         # Получаем списки пациентов и препаратов для фильтров (ограниченное количество)
-        patients = Patient.get_paginated(1, 50)["items"]
-        medicines = Medicine.get_paginated(1, 50)["items"]
+        patients = Patient.get_paginated(1, 50, count=COUNT_NONE, columns=Patient.CHOICE_FIELDS)["items"]
+        medicines = Medicine.get_paginated(1, 50, count=COUNT_NONE, columns=Medicine.CHOICE_FIELDS)["items"]
         
         return render_template("dispensings_paginated.html", 
                              dispensings=pagination_data["items"],
@@ -325,28 +350,30 @@ def init_routes(app):
                 medicine_id = int(request.form["medicine_id"])
                 quantity_packs = float(request.form["quantity_packs"])
                 
-                # Валидация
-                is_valid, error_message = BusinessLogic.validate_dispensing(
-                    patient_id, medicine_id, quantity_packs
-                )
-                
-                if not is_valid:
-                    flash(error_message, "error")
-                else:
-                    dispensing = Dispensing(
-                        patient_id=patient_id,
-                        medicine_id=medicine_id,
-                        dispensing_date=request.form["dispensing_date"],
-                        quantity_packs=quantity_packs
+                # Проверка и запись в одной транзакции: остатки не меняются между ними
+                with transaction(immediate=True):
+                    # Валидация
+                    is_valid, error_message = BusinessLogic.validate_dispensing(
+                        patient_id, medicine_id, quantity_packs
                     )
-                    dispensing.save()
-                    flash("Выдача успешно зарегистрирована", "success")
-                    return redirect(url_for("dispensings"))
+                
+                    if not is_valid:
+                        flash(error_message, "error")
+                    else:
+                        dispensing = Dispensing(
+                            patient_id=patient_id,
+                            medicine_id=medicine_id,
+                            dispensing_date=request.form["dispensing_date"],
+                            quantity_packs=quantity_packs
+                        )
+                        dispensing.save()
+                        flash("Выдача успешно зарегистрирована", "success")
+                        return redirect(url_for("dispensings"))
             except Exception as e:
                 flash(f"Ошибка при регистрации выдачи: {str(e)}", "error")
         
-        patients = Patient.get_paginated(1, 100)["items"]
-        medicines = Medicine.get_paginated(1, 100)["items"]
+        patients = Patient.get_paginated(1, 100, count=COUNT_NONE, columns=Patient.CHOICE_FIELDS)["items"]
+        medicines = Medicine.get_paginated(1, 100, count=COUNT_NONE, columns=Medicine.CHOICE_FIELDS)["items"]
         return render_template("dispensing_form.html", patients=patients, medicines=medicines)
     
     @app.route("/dispensings/edit/<int:dispensing_id>", methods=["GET", "POST"])
@@ -369,8 +396,8 @@ def init_routes(app):
             except Exception as e:
                 flash(f"Ошибка при обновлении данных выдачи: {str(e)}", "error")
         
-        patients = Patient.get_paginated(1, 100)["items"]
-        medicines = Medicine.get_paginated(1, 100)["items"]
+        patients = Patient.get_paginated(1, 100, count=COUNT_NONE, columns=Patient.CHOICE_FIELDS)["items"]
+        medicines = Medicine.get_paginated(1, 100, count=COUNT_NONE, columns=Medicine.CHOICE_FIELDS)["items"]
         return render_template("dispensing_form.html", dispensing=dispensing, patients=patients, medicines=medicines)
 
     @app.route("/dispensings/delete/<int:dispensing_id>", methods=["POST"])
@@ -388,190 +415,288 @@ def init_routes(app):
         
         return redirect(url_for("dispensings"))
 
+    # API маршруты для автозаполнения
+    @app.route("/api/patients/search")
+    def search_patients():
+        """Поиск пациентов для автозаполнения."""
+        query = request.args.get("q", "").strip()
+        if len(query) < 2:
+            return jsonify([])
+        
+        patients = patient_index.search(query, app.config.get("AUTOCOMPLETE_LIMIT", 10))
+        
+        return jsonify([{
+            "id": patient["patient_id"],
+            "text": f"{patient['fio']} ({patient['diagnosis']})",
+            "fio": patient["fio"],
+            "diagnosis": patient["diagnosis"]
+        } for patient in patients])
+    
+    @app.route("/api/medicines/search")
+    def search_medicines():
+        """Поиск препаратов для автозаполнения."""
+        query = request.args.get("q", "").strip()
+        if len(query) < 2:
+            return jsonify([])
+        
+        medicines = medicine_index.search(query, app.config.get("AUTOCOMPLETE_LIMIT", 10))
+        
+        return jsonify([{
+            "id": medicine["medicine_id"],
+            "text": f"{medicine['trade_name_vk']} ({medicine['standardized_mnn']}) - {medicine['price']} руб.",
+            "trade_name": medicine["trade_name_vk"],
+            "mnn": medicine["standardized_mnn"],
+            "price": medicine["price"],
+            "dosage": medicine["standardized_dosage"],
+            "packaging": medicine["packaging"]
+        } for medicine in medicines])
+
     # Маршруты для отчетов и экспорта данных
     @app.route("/reports")
     def reports():
         """Страница отчетов."""
         return render_template("reports.html")
 
+    # Выгружаемые таблицы: имя -> (первичный ключ, колонки)
+    export_tables = {
+        "patients": ("patient_id", ["patient_id", "fio", "birth_year", "diagnosis", "attending_doctor",
+                                    "created_at", "updated_at"]),
+        "medicines": ("medicine_id", ["medicine_id", "smmn_node_code", "section", "standardized_mnn", "trade_name_vk", 
+                                      "standardized_dosage_form", "standardized_dosage", "characteristic", "packaging", 
+                                      "price", "created_at", "updated_at"]),
+        "prescriptions": ("prescription_id", ["prescription_id", "patient_id", "medicine_id", "prescription_date", 
+                                              "quantity_packs", "daily_dose", "treatment_days", "created_at", "updated_at"]),
+        "dispensings": ("dispensing_id", ["dispensing_id", "patient_id", "medicine_id", "dispensing_date", 
+                                          "quantity_packs", "created_at", "updated_at"]),
+    }
+
     @app.route("/export_data/<string:model_name>")
     def export_data(model_name):
-        """Экспорт данных в CSV."""
-        si = io.StringIO()
-        cw = csv.writer(si)
-
-        if model_name == "patients":
-            headers = ["patient_id", "fio", "birth_year", "diagnosis", "attending_doctor", "created_at", "updated_at"]
-            data = Patient.get_all()
-        elif model_name == "medicines":
-            headers = ["medicine_id", "smmn_node_code", "section", "standardized_mnn", "trade_name_vk", 
-                       "standardized_dosage_form", "standardized_dosage", "characteristic", "packaging", 
-                       "price", "created_at", "updated_at"]
-            data = Medicine.get_all()
-        elif model_name == "prescriptions":
-            headers = ["prescription_id", "patient_id", "medicine_id", "prescription_date", 
-                       "quantity_packs", "daily_dose", "treatment_days", "created_at", "updated_at"]
-            data = Prescription.get_all()
-        elif model_name == "dispensings":
-            headers = ["dispensing_id", "patient_id", "medicine_id", "dispensing_date", 
-                       "quantity_packs", "created_at", "updated_at"]
-            data = Dispensing.get_all()
-        else:
+        """Потоковый экспорт данных в CSV: строки читаются из курсора частями."""
+        if model_name not in export_tables:
             flash("Неизвестный тип данных для экспорта", "error")
             return redirect(url_for("reports"))
 
-        cw.writerow(headers)
-        for row in data:
-            cw.writerow([getattr(row, col) for col in headers])
+        primary_key, headers = export_tables[model_name]
+        query = f"SELECT {', '.join(headers)} FROM {model_name} ORDER BY {primary_key}"
+        chunk_size = app.config.get("REPORTS_EXPORT_CHUNK_SIZE", 1000)
+
+        def rows():
+            yield headers
+            yield from fetch_iter(query, arraysize=chunk_size, as_tuples=True)
 
-        output = make_response(si.getvalue())
-        output.headers["Content-Disposition"] = f"attachment; filename={model_name}.csv"
-        output.headers["Content-type"] = "text/csv"
-        return output
+        return csv_response(iter_csv(rows()), f"{model_name}.csv")
 
     @app.route("/api/patients")
     def api_patients():
         page = request.args.get("page", 1, type=int)
         per_page = request.args.get("per_page", 10, type=int)
+        cursor = request.args.get("cursor", type=str)
         search = request.args.get("search", "", type=str)
         
         per_page = min(per_page, 100)
         
-        if search:
-            pagination_data = Patient.search_paginated(search, page, per_page)
-        else:
-            pagination_data = Patient.get_paginated(page, per_page)
+        try:
+            if search:
+                pagination_data = Patient.search_paginated(search, page, per_page, count=count_strategy("patients"))
+            else:
+                pagination_data = Patient.get_paginated(page, per_page, cursor=cursor, count=count_strategy("patients"))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
         # Преобразование объектов Patient в словари для JSON сериализации
-        patients_data = [
-            {
-                "patient_id": p.patient_id,
-                "fio": p.fio,
-                "birth_year": p.birth_year,
-                "diagnosis": p.diagnosis,
-                "attending_doctor": p.attending_doctor,
-                "created_at": p.created_at.isoformat() if p.created_at else None,
-                "updated_at": p.updated_at.isoformat() if p.updated_at else None
-            } for p in pagination_data["items"]
-        ]
+        patients_data = [p.to_dict() for p in pagination_data["items"]]
         
         return jsonify({
             "items": patients_data,
             "total_pages": pagination_data["total_pages"],
-            "total_items": pagination_data["total_items"],
-            "current_page": pagination_data["current_page"],
-            "per_page": pagination_data["per_page"]
+            "total_items": pagination_data["total"],
+            "total_is_estimate": pagination_data["total_is_estimate"],
+            "current_page": pagination_data["page"],
+            "per_page": pagination_data["per_page"],
+            "next_cursor": pagination_data.get("next_cursor"),
+            "prev_cursor": pagination_data.get("prev_cursor")
         })
 
     @app.route("/api/medicines")
     def api_medicines():
         page = request.args.get("page", 1, type=int)
         per_page = request.args.get("per_page", 10, type=int)
+        cursor = request.args.get("cursor", type=str)
         search = request.args.get("search", "", type=str)
         min_price = request.args.get("min_price", type=float)
         max_price = request.args.get("max_price", type=float)
         
         per_page = min(per_page, 100)
         
-        if min_price is not None or max_price is not None:
-            pagination_data = Medicine.get_by_price_range(min_price, max_price, page, per_page)
-        elif search:
-            pagination_data = Medicine.search_paginated(search, page, per_page)
-        else:
-            pagination_data = Medicine.get_paginated(page, per_page)
-        
-        medicines_data = [
-            {
-                "medicine_id": m.medicine_id,
-                "smmn_node_code": m.smmn_node_code,
-                "section": m.section,
-                "standardized_mnn": m.standardized_mnn,
-                "trade_name_vk": m.trade_name_vk,
-                "standardized_dosage_form": m.standardized_dosage_form,
-                "standardized_dosage": m.standardized_dosage,
-                "characteristic": m.characteristic,
-                "packaging": m.packaging,
-                "price": m.price,
-                "created_at": m.created_at.isoformat() if m.created_at else None,
-                "updated_at": m.updated_at.isoformat() if m.updated_at else None
-            } for m in pagination_data["items"]
-        ]
+        try:
+            if min_price is not None or max_price is not None:
+                pagination_data = Medicine.get_by_price_range(min_price, max_price, page, per_page, count=count_strategy("medicines"))
+            elif search:
+                pagination_data = Medicine.search_paginated(search, page, per_page, count=count_strategy("medicines"))
+            else:
+                pagination_data = Medicine.get_paginated(page, per_page, cursor=cursor, count=count_strategy("medicines"))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        medicines_data = [m.to_dict() for m in pagination_data["items"]]
         
         return jsonify({
             "items": medicines_data,
             "total_pages": pagination_data["total_pages"],
-            "total_items": pagination_data["total_items"],
-            "current_page": pagination_data["current_page"],
-            "per_page": pagination_data["per_page"]
+            "total_items": pagination_data["total"],
+            "total_is_estimate": pagination_data["total_is_estimate"],
+            "current_page": pagination_data["page"],
+            "per_page": pagination_data["per_page"],
+            "next_cursor": pagination_data.get("next_cursor"),
+            "prev_cursor": pagination_data.get("prev_cursor")
         })
 
     @app.route("/api/prescriptions")
     def api_prescriptions():
         page = request.args.get("page", 1, type=int)
         per_page = request.args.get("per_page", 10, type=int)
+        cursor = request.args.get("cursor", type=str)
         patient_id = request.args.get("patient_id", type=int)
         
         per_page = min(per_page, 100)
         
-        if patient_id:
-            pagination_data = Prescription.get_by_patient_paginated(patient_id, page, per_page)
-        else:
-            pagination_data = Prescription.get_paginated(page, per_page)
-        
-        prescriptions_data = [
-            {
-                "prescription_id": p.prescription_id,
-                "patient_id": p.patient_id,
-                "medicine_id": p.medicine_id,
-                "prescription_date": p.prescription_date.isoformat() if p.prescription_date else None,
-                "quantity_packs": p.quantity_packs,
-                "daily_dose": p.daily_dose,
-                "treatment_days": p.treatment_days,
-                "created_at": p.created_at.isoformat() if p.created_at else None,
-                "updated_at": p.updated_at.isoformat() if p.updated_at else None
-            } for p in pagination_data["items"]
-        ]
+        try:
+            if patient_id:
+                pagination_data = Prescription.get_by_patient_paginated(patient_id, page, per_page, cursor=cursor, count=count_strategy("prescriptions"))
+            else:
+                pagination_data = Prescription.get_paginated(page, per_page, cursor=cursor, count=count_strategy("prescriptions"))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        prescriptions_data = [p.to_dict() for p in pagination_data["items"]]
         
         return jsonify({
             "items": prescriptions_data,
             "total_pages": pagination_data["total_pages"],
-            "total_items": pagination_data["total_items"],
-            "current_page": pagination_data["current_page"],
-            "per_page": pagination_data["per_page"]
+            "total_items": pagination_data["total"],
+            "total_is_estimate": pagination_data["total_is_estimate"],
+            "current_page": pagination_data["page"],
+            "per_page": pagination_data["per_page"],
+            "next_cursor": pagination_data.get("next_cursor"),
+            "prev_cursor": pagination_data.get("prev_cursor")
         })
 
     @app.route("/api/dispensings")
     def api_dispensings():
         page = request.args.get("page", 1, type=int)
         per_page = request.args.get("per_page", 10, type=int)
+        cursor = request.args.get("cursor", type=str)
         patient_id = request.args.get("patient_id", type=int)
         
         per_page = min(per_page, 100)
         
-        if patient_id:
-            pagination_data = Dispensing.get_by_patient_paginated(patient_id, page, per_page)
-        else:
-            pagination_data = Dispensing.get_paginated(page, per_page)
-        
-        dispensings_data = [
-            {
-                "dispensing_id": d.dispensing_id,
-                "patient_id": d.patient_id,
-                "medicine_id": d.medicine_id,
-                "dispensing_date": d.dispensing_date.isoformat() if d.dispensing_date else None,
-                "quantity_packs": d.quantity_packs,
-                "created_at": d.created_at.isoformat() if d.created_at else None,
-                "updated_at": d.updated_at.isoformat() if d.updated_at else None
-            } for d in pagination_data["items"]
-        ]
+        try:
+            if patient_id:
+                pagination_data = Dispensing.get_by_patient_paginated(patient_id, page, per_page, cursor=cursor, count=count_strategy("dispensings"))
+            else:
+                pagination_data = Dispensing.get_paginated(page, per_page, cursor=cursor, count=count_strategy("dispensings"))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        dispensings_data = [d.to_dict() for d in pagination_data["items"]]
         
         return jsonify({
             "items": dispensings_data,
             "total_pages": pagination_data["total_pages"],
-            "total_items": pagination_data["total_items"],
-            "current_page": pagination_data["current_page"],
-            "per_page": pagination_data["per_page"]
+            "total_items": pagination_data["total"],
+            "total_is_estimate": pagination_data["total_is_estimate"],
+            "current_page": pagination_data["page"],
+            "per_page": pagination_data["per_page"],
+            "next_cursor": pagination_data.get("next_cursor"),
+            "prev_cursor": pagination_data.get("prev_cursor")
+        })
+
+    @app.route("/api/cache/stats")
+    def api_cache_stats():
+        """Статистика кэшей отчётов и сводок пациентов."""
+        return jsonify({
+            "reports": report_cache.stats(),
+            "patient_summaries": patient_summary_cache.stats()
         })
+    
+    def ingest_batch(ingest):
+        """
+        Разбор тела пакетного запроса и загрузка записей.
+        
+        Тело - JSON-массив записей или объект {"items": [...], "atomic": false}.
+        """
+        payload = request.get_json(silent=True)
+        atomic = False
+        if isinstance(payload, dict):
+            atomic = bool(payload.get("atomic", False))
+            payload = payload.get("items")
+        if not isinstance(payload, list):
+            return jsonify({"error": "Ожидается JSON-массив записей"}), 400
+        
+        max_size = app.config.get("INGEST_MAX_BATCH_SIZE", 10000)
+        if len(payload) > max_size:
+            return jsonify({"error": f"Пакет не может содержать более {max_size} записей"}), 413
+        
+        return jsonify(ingest(payload, atomic=atomic))
+    
+    @app.route("/api/prescriptions/batch", methods=["POST"])
+    def api_prescriptions_batch():
+        """Пакетная загрузка назначений."""
+        return ingest_batch(BusinessLogic.ingest_prescriptions)
+    
+    @app.route("/api/dispensings/batch", methods=["POST"])
+    def api_dispensings_batch():
+        """Пакетная загрузка выдач с проверкой остаточной потребности."""
+        return ingest_batch(BusinessLogic.ingest_dispensings)
+    
+    def report_job_response(job):
+        """Описание задания отчёта со ссылками на состояние и результат."""
+        job = dict(job)
+        job["status_url"] = url_for("api_report_job", job_id=job["job_id"])
+        job["result_url"] = url_for("api_report_job_result", job_id=job["job_id"]) if job["status"] == "done" else None
+        return job
+    
+    @app.route("/api/reports/jobs", methods=["POST"])
+    def api_report_jobs():
+        """
+        Постановка отчёта в очередь фонового построения.
+        
+        Тело - JSON-объект {"type": "financial", "format": "csv", "params": {"start_date": ...}}.
+        """
+        payload = request.get_json(silent=True)
+        if not isinstance(payload, dict) or not isinstance(payload.get("params", {}), dict):
+            return jsonify({"error": "Ожидается JSON-объект с типом и параметрами отчёта"}), 400
+        
+        try:
+            job = submit_report_job(payload.get("type"), payload.get("format", "csv"), payload.get("params"))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        return jsonify(report_job_response(job)), 202
+    
+    @app.route("/api/reports/jobs/<job_id>")
+    def api_report_job(job_id):
+        """Состояние задания фонового отчёта."""
+        job = get_report_jobs().get(job_id)
+        if job is None:
+            return jsonify({"error": "Задание не найдено"}), 404
+        return jsonify(report_job_response(job))
+    
+    @app.route("/api/reports/jobs/<job_id>/result")
+    def api_report_job_result(job_id):
+        """Загрузка результата фонового отчёта."""
+        runner = get_report_jobs()
+        job = runner.get(job_id)
+        if job is None:
+            return jsonify({"error": "Задание не найдено"}), 404
+        
+        path = runner.result_path(job)
+        if path is None:
+            return jsonify({"error": "Отчёт ещё не построен", "status": job["status"]}), 409
+        
+        return send_file(path, mimetype=REPORT_JOB_FORMATS[job["format"]], as_attachment=True,
+                         download_name=f"{job['type']}_report_{job['job_id']}.{job['format']}")
 
 
 
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Тест расчётной логики остаточной потребности
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database_updated import init_db, close_db, get_db, execute_update, fetch_one
+from models_updated import Patient, Medicine, Dispensing
+from cache import patient_summary_cache
+from business_logic import BusinessLogic
+from balances import verify_balances, rebuild_balances, init_balance_commands
+from routes_updated import init_routes
+from flask import Flask
+import config
+
+# Создание тестового приложения Flask
+app = Flask(__name__)
+app.config.from_object(config)
+app.teardown_appcontext(close_db)
+init_balance_commands(app)
+init_routes(app)
+
+def create_test_data(tag):
+    """Создание пациентов, препарата, назначений и выдач для теста"""
+    Patient.bulk_create([(f"Потребность {tag} {i}", 1980, "Диагноз", "Врач") for i in range(3)])
+    Medicine.bulk_create([(f"NEED-{tag}", "Потребность", f"МНН {tag}", f"Препарат {tag}",
+                           "таблетки", "10 мг", None, "30", 100.0)])
+
+    patient_ids = [Patient.search_paginated(f"Потребность {tag} {i}", 1, 1)['items'][0].patient_id
+                   for i in range(3)]
+    medicine_id = fetch_one("SELECT medicine_id FROM medicines WHERE smmn_node_code = ?",
+                            (f"NEED-{tag}",))['medicine_id']
+
+    # Пациент 0: назначено 5, выдано 2; пациент 1: назначено 1, выдано 3; пациент 2: только выдача
+    for patient_id, quantity in ((patient_ids[0], 3), (patient_ids[0], 2), (patient_ids[1], 1)):
+        execute_update("INSERT INTO prescriptions (patient_id, medicine_id, prescription_date, quantity_packs) "
+                       "VALUES (?, ?, '2024-03-01', ?)", (patient_id, medicine_id, quantity))
+    for patient_id, quantity in ((patient_ids[0], 2), (patient_ids[1], 3), (patient_ids[2], 1)):
+        execute_update("INSERT INTO dispensings (patient_id, medicine_id, dispensing_date, quantity_packs) "
+                       "VALUES (?, ?, '2024-03-02', ?)", (patient_id, medicine_id, quantity))
+
+    return patient_ids, medicine_id
+
+def test_remaining_needs_batch():
+    """Тест пакетного расчёта остаточной потребности"""
+    print("\n=== Тестирование пакетного расчёта потребности ===")
+
+    with app.app_context():
+        init_db()
+        patient_ids, medicine_id = create_test_data("пакет")
+
+        needs = BusinessLogic.calculate_remaining_needs(medicine_id=medicine_id)
+        print(f"Пар с движением препарата: {len(needs)}")
+        assert needs[(patient_ids[0], medicine_id)] == {'prescribed': 5, 'dispensed': 2, 'remaining_need': 3}
+        assert needs[(patient_ids[1], medicine_id)]['remaining_need'] == 0
+        assert needs[(patient_ids[2], medicine_id)]['prescribed'] == 0
+
+        # Результат по списку пар совпадает с расчётом по всем парам
+        all_needs = BusinessLogic.calculate_remaining_needs()
+        pairs = [(patient_id, medicine_id) for patient_id in patient_ids]
+        pairs += [(0, i) for i in range(BusinessLogic.REMAINING_NEED_BATCH_SIZE + 1)]  # несколько пакетов
+        selected = BusinessLogic.calculate_remaining_needs(pairs)
+        assert selected == {pair: all_needs[pair] for pair in pairs if pair in all_needs}
+        assert BusinessLogic.calculate_remaining_needs([]) == {}
+
+        assert BusinessLogic.calculate_remaining_need(patient_ids[0], medicine_id) == 3
+        assert BusinessLogic.calculate_remaining_need(0, medicine_id) == 0
+
+def test_reports_use_batch_needs():
+    """Тест отчёта, сводки пациента и валидации выдачи"""
+    print("\n=== Тестирование отчётов на пакетном расчёте ===")
+
+    with app.app_context():
+        init_db()
+        patient_ids, medicine_id = create_test_data("отчёт")
+
+        report = BusinessLogic.generate_medicine_report()
+        item = next(row for row in report['data'] if row['medicine_id'] == medicine_id)
+        print(f"Потребность по препарату: {item['total_need']}")
+        assert item['patients_count'] == 1
+        assert item['total_need'] == 3
+        assert item['total_cost'] == 300.0
+
+        summary = BusinessLogic.get_patient_medicine_summary(patient_ids[0])
+        assert [row['remaining_need'] for row in summary if row['medicine_id'] == medicine_id] == [3]
+
+        assert BusinessLogic.validate_dispensing(patient_ids[0], medicine_id, 3) == (True, "")
+        assert not BusinessLogic.validate_dispensing(patient_ids[0], medicine_id, 4)[0]
+        assert not BusinessLogic.validate_dispensing(patient_ids[1], medicine_id, 1)[0]
+
+def test_balance_table():
+    """Тест таблицы остатков, поддерживаемой триггерами"""
+    print("\n=== Тестирование таблицы остатков ===")
+
+    with app.app_context():
+        init_db()
+        patient_ids, medicine_id = create_test_data("остатки")
+        balance_query = "SELECT * FROM medicine_balances WHERE patient_id = ? AND medicine_id = ?"
+
+        balance = fetch_one(balance_query, (patient_ids[0], medicine_id))
+        assert (balance['prescribed_total'], balance['dispensed_total']) == (5, 2)
+        assert balance['last_prescription_date'] == '2024-03-01'
+
+        # Изменение и перенос назначения на другого пациента
+        execute_update("UPDATE prescriptions SET quantity_packs = 4, prescription_date = '2024-04-01' "
+                       "WHERE patient_id = ? AND medicine_id = ? AND quantity_packs = 2",
+                       (patient_ids[0], medicine_id))
+        execute_update("UPDATE prescriptions SET patient_id = ? WHERE patient_id = ? AND medicine_id = ?",
+                       (patient_ids[2], patient_ids[1], medicine_id))
+        balance = fetch_one(balance_query, (patient_ids[0], medicine_id))
+        assert (balance['prescribed_total'], balance['last_prescription_date']) == (7, '2024-04-01')
+        assert fetch_one(balance_query, (patient_ids[2], medicine_id))['prescribed_total'] == 1
+
+        # Пара без назначений и выдач удаляется
+        execute_update("DELETE FROM dispensings WHERE patient_id = ?", (patient_ids[1],))
+        assert fetch_one(balance_query, (patient_ids[1], medicine_id)) is None
+
+        db = get_db()
+        assert verify_balances(db) == []
+        assert BusinessLogic.calculate_remaining_need(patient_ids[0], medicine_id) == 5
+
+        # Расхождение обнаруживается сверкой и устраняется перестройкой
+        execute_update("UPDATE medicine_balances SET dispensed_total = 0 WHERE patient_id = ?", (patient_ids[0],))
+        mismatches = verify_balances(db)
+        print(f"Найдено расхождений: {len(mismatches)}")
+        assert [(m['patient_id'], m['medicine_id']) for m in mismatches] == [(patient_ids[0], medicine_id)]
+        assert app.test_cli_runner().invoke(args=["balances", "verify"]).exit_code != 0
+
+        rebuild_balances(db)
+        db.commit()
+        assert verify_balances(db) == []
+        result = app.test_cli_runner().invoke(args=["balances", "verify"])
+        assert result.exit_code == 0, result.output
+
+def test_patient_summary():
+    """Тест сводки пациента одним запросом и её кэширования"""
+    print("\n=== Тестирование сводки пациента ===")
+
+    with app.app_context():
+        init_db()
+        patient_ids, medicine_id = create_test_data("сводка")
+        execute_update("INSERT INTO prescriptions (patient_id, medicine_id, prescription_date, quantity_packs) "
+                       "VALUES (?, ?, '2024-05-01', 1.5)", (patient_ids[0], medicine_id))
+
+        summary = BusinessLogic.get_patient_medicine_summary(patient_ids[0])
+        print(f"Препаратов в сводке: {len(summary)}")
+        assert len(summary) == 1
+        item = summary[0]
+        assert item['remaining_need'] == 4.5
+        assert item['remaining_cost'] == 450.0
+        assert (item['last_prescription_date'], item['last_prescription_quantity']) == ('2024-05-01', 1.5)
+        assert (item['last_dispensing_date'], item['last_dispensing_quantity']) == ('2024-03-02', 2)
+
+        # Пациент только с выдачами не имеет строк сводки
+        assert BusinessLogic.get_patient_medicine_summary(patient_ids[2]) == []
+
+        # Повторный запрос обслуживается из кэша, изменение результата не портит кэш
+        hits = patient_summary_cache.stats()['hits']
+        cached = BusinessLogic.get_patient_medicine_summary(patient_ids[0])
+        assert patient_summary_cache.stats()['hits'] == hits + 1
+        assert cached == summary
+        cached[0]['remaining_need'] = 0
+        assert BusinessLogic.get_patient_medicine_summary(patient_ids[0])[0]['remaining_need'] == 4.5
+
+        # Выдача через модель сбрасывает сводку пациента
+        Dispensing(patient_id=patient_ids[0], medicine_id=medicine_id,
+                   dispensing_date='2024-05-02', quantity_packs=0.5).save()
+        item = BusinessLogic.get_patient_medicine_summary(patient_ids[0])[0]
+        assert (item['remaining_need'], item['last_dispensing_date']) == (4.0, '2024-05-02')
+
+def test_batch_ingestion():
+    """Тест пакетной загрузки выдач и назначений"""
+    print("\n=== Тестирование пакетной загрузки ===")
+
+    with app.app_context():
+        init_db()
+        patient_ids, medicine_id = create_test_data("загрузка")
+        record = lambda patient_id, quantity: {"patient_id": patient_id, "medicine_id": medicine_id,
+                                               "dispensing_date": "2024-06-01", "quantity_packs": quantity}
+        batch = [
+            record(patient_ids[0], 2),
+            record(patient_ids[0], 2),   # остаток после первой записи - 1
+            record(patient_ids[0], 1),
+            record(patient_ids[1], 1),   # назначения уже выданы
+            record(-1, 1),
+            {"patient_id": patient_ids[0], "medicine_id": medicine_id, "quantity_packs": 1},
+            record(patient_ids[0], 0),
+        ]
+
+        # В режиме atomic при ошибках ничего не вставляется
+        result = BusinessLogic.ingest_dispensings(batch, atomic=True)
+        assert (result['inserted'], result['rejected']) == (0, 5)
+        assert BusinessLogic.calculate_remaining_need(patient_ids[0], medicine_id) == 3
+
+        client = app.test_client()
+        response = client.post("/api/dispensings/batch", json={"items": batch})
+        assert response.status_code == 200
+        result = response.get_json()
+        print(f"Вставлено: {result['inserted']}, отклонено: {result['rejected']}")
+        assert [row['valid'] for row in result['results']] == [True, False, True, False, False, False, False]
+        assert "остаточную потребность (1.0)" in result['results'][1]['error']
+        assert result['results'][4]['error'] == "Пациент не найден"
+        assert result['results'][5]['error'] == "Не заполнено поле dispensing_date"
+        assert BusinessLogic.calculate_remaining_need(patient_ids[0], medicine_id) == 0
+        assert verify_balances(get_db()) == []
+
+        response = client.post("/api/prescriptions/batch", json=[
+            {"patient_id": patient_ids[1], "medicine_id": medicine_id, "prescription_date": "2024-06-02",
+             "quantity_packs": 4, "daily_dose": "1.5", "treatment_days": ""},
+            {"patient_id": patient_ids[1], "medicine_id": medicine_id, "prescription_date": "02.06.2024",
+             "quantity_packs": 1},
+        ])
+        assert response.get_json()['inserted'] == 1
+        row = fetch_one("SELECT daily_dose, treatment_days FROM prescriptions WHERE patient_id = ? "
+                        "AND prescription_date = '2024-06-02'", (patient_ids[1],))
+        assert (row['daily_dose'], row['treatment_days']) == (1.5, None)
+        assert BusinessLogic.calculate_remaining_need(patient_ids[1], medicine_id) == 2
+
+        assert client.post("/api/dispensings/batch", json={"items": "нет"}).status_code == 400
+
+        # NaN и бесконечность отклоняются построчно, а не ошибкой сервера
+        item = '{"patient_id": %s, "medicine_id": %s, "prescription_date": "2024-06-03", "quantity_packs": %s%s}'
+        raw = "[" + ", ".join([
+            item % (patient_ids[1], medicine_id, "NaN", ""),
+            item % (patient_ids[1], medicine_id, "Infinity", ""),
+            item % (patient_ids[1], medicine_id, '"-inf"', ""),
+            item % ("Infinity", medicine_id, 1, ""),
+            item % (patient_ids[1], medicine_id, 1, ', "daily_dose": NaN'),
+        ]) + "]"
+        response = client.post("/api/prescriptions/batch", data=raw, content_type="application/json")
+        assert response.status_code == 200
+        result = response.get_json()
+        assert result['inserted'] == 0
+        assert {row['error'] for row in result['results']} == {"Некорректные данные записи"}
+        assert BusinessLogic.validate_prescription(patient_ids[1], medicine_id, float("nan"))[0] is False
+
+def main():
+    """Основная функция тестирования"""
+    print("Запуск тестов расчётной логики")
+    print("=" * 50)
+
+    test_remaining_needs_batch()
+    test_reports_use_batch_needs()
+    test_balance_table()
+    test_patient_summary()
+    test_batch_ingestion()
+
+    print("\n✅ Все тесты выполнены успешно!")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Тест пула соединений с базой данных
+"""
+
+import sys
+import os
+import sqlite3
+import tempfile
+import threading
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from connection_pool import ConnectionPool
+from database_updated import get_storage_profile, create_connection, get_pool_stats
+import database
+import routes
+from flask import Flask
+import config
+
+def _make_pool(**kwargs):
+    """Создание пула над временной базой данных"""
+    path = os.path.join(tempfile.mkdtemp(), 'pool_test.db')
+    return ConnectionPool(lambda: sqlite3.connect(path, check_same_thread=False), **kwargs)
+
+def test_connection_reuse():
+    """Соединение возвращается в пул и переиспользуется"""
+    pool = _make_pool(size=2)
+
+    conn = pool.acquire()
+    pool.release(conn)
+    assert pool.acquire() is conn
+
+    stats = pool.stats()
+    print(f"Статистика пула: {stats}")
+    assert stats['created'] == 1
+    assert stats['reused'] == 1
+    assert stats['in_use'] == 1
+
+def test_max_age_recycling():
+    """Соединение старше max_age пересоздаётся"""
+    pool = _make_pool(size=1, max_age=0.01)
+
+    conn = pool.acquire()
+    pool.release(conn)
+    threading.Event().wait(0.05)
+    pool.release(pool.acquire())
+
+    stats = pool.stats()
+    assert stats['recycled'] == 1
+    assert stats['created'] == 2
+
+def test_health_check_discards_broken_connection():
+    """Закрытое соединение не выдаётся повторно"""
+    pool = _make_pool(size=1)
+
+    conn = pool.acquire()
+    pool.release(conn)
+    conn.close()
+
+    fresh = pool.acquire()
+    assert fresh is not conn
+    assert pool.stats()['discarded'] == 1
+
+def test_pool_size_limit():
+    """При исчерпании пула запрос ждёт освобождения соединения"""
+    pool = _make_pool(size=1, timeout=0.05)
+
+    conn = pool.acquire()
+    try:
+        pool.acquire()
+        assert False, "Ожидалась ошибка таймаута"
+    except RuntimeError:
+        pass
+
+    threading.Timer(0.01, pool.release, args=(conn,)).start()
+    pool.timeout = 1
+    assert pool.acquire() is conn
+    assert pool.stats()['timeouts'] == 1
+
+def test_rollback_on_release():
+    """Незавершённая транзакция откатывается при возврате в пул"""
+    pool = _make_pool(size=1)
+
+    conn = pool.acquire()
+    conn.execute('CREATE TABLE IF NOT EXISTS items (value INTEGER)')
+    conn.commit()
+    conn.execute('INSERT INTO items VALUES (1)')
+    pool.release(conn)
+
+    conn = pool.acquire()
+    assert conn.execute('SELECT COUNT(*) FROM items').fetchone()[0] == 0
+
+def test_storage_profile_applied():
+    """PRAGMA профиля хранения применяются к новым соединениям"""
+    profile = get_storage_profile(vars(config))
+    path = os.path.join(tempfile.mkdtemp(), 'profile_test.db')
+    pool = ConnectionPool(lambda: create_connection(path, profile), size=1)
+
+    conn = pool.acquire()
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    assert conn.execute('PRAGMA synchronous').fetchone()[0] == 1
+    assert conn.execute('PRAGMA busy_timeout').fetchone()[0] == config.SQLITE_BUSY_TIMEOUT
+
+def test_storage_profile_rejects_unknown_values():
+    """Недопустимые значения настроек отклоняются"""
+    try:
+        get_storage_profile({'SQLITE_JOURNAL_MODE': 'WAL; DROP TABLE patients'})
+        assert False, "Ожидалась ошибка валидации"
+    except ValueError:
+        pass
+
+def test_legacy_app_releases_pooled_connections():
+    """Запросы старого приложения возвращают соединения пула, взятые бизнес-логикой"""
+    app = Flask(__name__)
+    app.config.from_object(config)
+    app.config["DATABASE_PATH"] = os.path.join(tempfile.mkdtemp(), 'legacy_test.db')
+    app.config["DB_POOL_TIMEOUT"] = 1
+    app.teardown_appcontext(database.close_db)
+    routes.init_routes(app)
+
+    with app.app_context():
+        database.init_db()
+        database.insert_sample_data()
+        patient_id = database.fetch_one("SELECT MIN(patient_id) FROM patients")[0]
+        medicine_id = database.fetch_one("SELECT MIN(medicine_id) FROM medicines")[0]
+
+    client = app.test_client()
+    for _ in range(config.DB_POOL_SIZE + 3):
+        response = client.post("/prescriptions/add", data={
+            "patient_id": patient_id, "medicine_id": medicine_id,
+            "prescription_date": "2024-06-01", "quantity_packs": 1
+        })
+        assert response.status_code == 302
+
+    with app.app_context():
+        stats = get_pool_stats()
+        print(f"Статистика пула старого приложения: {stats}")
+        assert stats['in_use'] == 0
+
+def main():
+    """Основная функция тестирования"""
+    print("Запуск тестов пула соединений")
+    print("=" * 50)
+
+    test_connection_reuse()
+    test_max_age_recycling()
+    test_health_check_discards_broken_connection()
+    test_pool_size_limit()
+    test_rollback_on_release()
+    test_storage_profile_applied()
+    test_storage_profile_rejects_unknown_values()
+    test_legacy_app_releases_pooled_connections()
+
+    print("\n✅ Все тесты выполнены успешно!")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+"""
+Тест потоковой выгрузки данных и отчётов в CSV
+"""
+
+import sys
+import os
+import csv
+import io
+import sqlite3
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database_updated import init_db, close_db, get_db, execute_update, run_sections, transaction, fetch_one, fetch_all, fetch_iter, fetch_chunks, insert_sample_data
+from models_updated import Patient
+from business_logic import BusinessLogic
+from reports_generator import ReportsGenerator
+from routes_updated import init_routes
+from csv_export import iter_csv
+from cache import report_cache
+from rollups import verify_rollups, rebuild_rollups, init_rollup_commands
+from flask import Flask
+import config
+
+# Создание тестового приложения Flask
+app = Flask(__name__)
+app.config.from_object(config)
+app.config["REPORTS_EXPORT_CHUNK_SIZE"] = 2
+app.teardown_appcontext(close_db)
+init_routes(app)
+init_rollup_commands(app)
+
+def prepare_data():
+    """Создание таблиц и примерных данных"""
+    with app.app_context():
+        init_db()
+        insert_sample_data()
+
+def test_iter_csv_blocks():
+    """Тест разбиения CSV на блоки"""
+    rows = [["id", "name"]] + [[i, f"Строка {i}"] for i in range(100)]
+    chunks = list(iter_csv(rows, buffer_size=256))
+    print(f"Блоков CSV: {len(chunks)}")
+    assert chunks[0] == "id,name\r\n"
+    assert len(chunks) > 2
+    assert list(csv.reader(io.StringIO(''.join(chunks)))) == [[str(value) for value in row] for row in rows]
+
+def test_export_data_streamed():
+    """Тест потоковой выгрузки таблицы"""
+    print("\n=== Тестирование потоковой выгрузки таблицы ===")
+    prepare_data()
+
+    client = app.test_client()
+    response = client.get("/export_data/patients")
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert response.headers["Content-Disposition"] == "attachment; filename=patients.csv"
+
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+    assert rows[0][:2] == ["patient_id", "fio"]
+    with app.app_context():
+        total = fetch_one("SELECT COUNT(*) as total FROM patients")["total"]
+    print(f"Выгружено строк: {len(rows) - 1} из {total}")
+    assert len(rows) - 1 == total
+
+    assert client.get("/export_data/unknown").status_code == 302
+
+def test_report_csv_streams():
+    """Тест совпадения потоковых отчётов с построенными целиком"""
+    print("\n=== Тестирование потоковой выгрузки отчётов ===")
+    prepare_data()
+
+    with app.app_context():
+        for report_type, report in (
+            ('patient', ReportsGenerator.generate_patient_report()),
+            ('dispensing', ReportsGenerator.generate_dispensing_report()),
+            ('financial', ReportsGenerator.generate_financial_report()),
+        ):
+            streamed = ''.join(ReportsGenerator.stream_report_csv(report_type, chunk_size=2))
+            assert streamed == ReportsGenerator.export_report_to_csv(report, report_type), report_type
+
+        report = BusinessLogic.generate_medicine_report()
+        rows = list(csv.reader(io.StringIO(BusinessLogic.export_medicine_report_to_csv()), delimiter=';'))
+        print(f"Строк в отчёте по препаратам: {len(report['data'])}")
+        assert rows[0] == BusinessLogic.MEDICINE_REPORT_HEADERS
+        assert [int(row[0]) for row in rows[1:1 + len(report['data'])]] == [item['medicine_id'] for item in report['data']]
+        total_row = rows[len(report['data']) + 2]
+        assert total_row[0] == 'ИТОГО:'
+        assert total_row[10] == str(report['summary']['total_patients'])
+        assert total_row[12] == f"{report['summary']['total_cost']:.2f}"
+
+def test_fetch_iter():
+    """Тест потокового чтения строк из курсора"""
+    print("\n=== Тестирование потокового чтения ===")
+    prepare_data()
+
+    with app.app_context():
+        query = "SELECT patient_id, fio FROM patients ORDER BY patient_id"
+        expected = [tuple(row) for row in fetch_all(query)]
+
+        chunks = list(fetch_chunks(query, chunk_size=2))
+        print(f"Пакетов по 2 строки: {len(chunks)}")
+        assert all(len(chunk) <= 2 for chunk in chunks)
+        assert [tuple(row) for chunk in chunks for row in chunk] == expected
+
+        rows = list(fetch_iter(query, arraysize=2, as_tuples=True))
+        assert rows == expected and all(type(row) is tuple for row in rows)
+        assert next(fetch_iter(query))["fio"] == expected[0][1]
+
+        assert [p.patient_id for p in Patient.iter_all()] == [p.patient_id for p in Patient.get_all()]
+
+        # Ленивые отчёты дают те же строки и итоги, что и построенные целиком
+        for generate, key in ((ReportsGenerator.generate_patient_report, 'patients'),
+                              (ReportsGenerator.generate_dispensing_report, 'dispensings')):
+            eager = generate()
+            lazy = generate(lazy=True)
+            assert [dict(row) for row in lazy[key]] == [dict(row) for row in eager[key]]
+            assert lazy['summary'] == eager['summary']
+
+def test_report_cache():
+    """Тест кэша отчётов с версией данных"""
+    print("\n=== Тестирование кэша отчётов ===")
+    prepare_data()
+
+    with app.app_context():
+        report_cache.clear()
+        first = ReportsGenerator.generate_financial_report('2024-01-01', '2024-12-31')
+        stats = report_cache.stats()
+        second = ReportsGenerator.generate_financial_report(start_date='2024-01-01', end_date='2024-12-31')
+        assert report_cache.stats()['hits'] == stats['hits'] + 1
+        assert second == first
+
+        # Изменение результата не портит кэш, другие параметры - другой ключ
+        second['summary']['total_revenue'] = -1
+        assert ReportsGenerator.generate_financial_report('2024-01-01', '2024-12-31')['summary'] == first['summary']
+        ReportsGenerator.generate_financial_report('2024-01-01', '2024-06-30')
+        assert report_cache.stats()['size'] == 2
+
+        # Запись из другого соединения (другого процесса) меняет версию данных
+        other = sqlite3.connect(app.config['DATABASE_PATH'])
+        other.execute("UPDATE medicines SET price = price * 2")
+        other.commit()
+        other.close()
+        misses = report_cache.stats()['misses']
+        third = ReportsGenerator.generate_financial_report('2024-01-01', '2024-12-31')
+        assert report_cache.stats()['misses'] == misses + 1
+        if first['summary']['total_revenue']:
+            assert third['summary']['total_revenue'] == 2 * first['summary']['total_revenue']
+        execute_update("UPDATE medicines SET price = price / 2")
+
+        # Ленивые отчёты и use_cache=False строятся без кэша
+        size = report_cache.stats()['size']
+        ReportsGenerator.generate_patient_report(lazy=True)
+        BusinessLogic.generate_medicine_report(use_cache=False)
+        assert report_cache.stats()['size'] == size
+
+    stats = app.test_client().get("/api/cache/stats").get_json()
+    print(f"Статистика кэша отчётов: {stats['reports']}")
+    assert stats['reports']['hits'] >= 2
+
+def test_rollup_tables():
+    """Тест дневных агрегатов выдач и финансового отчёта по ним"""
+    print("\n=== Тестирование дневных агрегатов выдач ===")
+    prepare_data()
+
+    with app.app_context():
+        db = get_db()
+        patient = fetch_one("SELECT patient_id, attending_doctor FROM patients ORDER BY patient_id LIMIT 1")
+        medicine_id = fetch_one("SELECT medicine_id FROM medicines ORDER BY medicine_id LIMIT 1")[0]
+        insert = "INSERT INTO dispensings (patient_id, medicine_id, dispensing_date, quantity_packs) VALUES (?, ?, ?, ?)"
+        execute_update(insert, (patient['patient_id'], medicine_id, '2024-05-01', 3))
+        execute_update(insert, (patient['patient_id'], medicine_id, '2024-05-01', 2))
+        execute_update(insert, (patient['patient_id'], medicine_id, '2024-05-02', 1))
+
+        rollup = fetch_one("SELECT * FROM dispensing_daily_medicines WHERE dispensing_date = '2024-05-01' "
+                           "AND medicine_id = ?", (medicine_id,))
+        assert (rollup['dispensings_count'], rollup['total_packs']) >= (2, 5)
+
+        # Изменение, удаление выдач и смена лечащего врача пересчитывают агрегаты
+        execute_update("UPDATE dispensings SET quantity_packs = 4, dispensing_date = '2024-05-03' "
+                       "WHERE patient_id = ? AND dispensing_date = '2024-05-02'", (patient['patient_id'],))
+        execute_update("DELETE FROM dispensings WHERE patient_id = ? AND dispensing_date = '2024-05-01' "
+                       "AND quantity_packs = 2", (patient['patient_id'],))
+        execute_update("UPDATE patients SET attending_doctor = 'Агрегатов А.А.' WHERE patient_id = ?",
+                       (patient['patient_id'],))
+        assert verify_rollups(db) == []
+
+        # Отчёт по агрегатам совпадает с расчётом по исходным выдачам
+        report = ReportsGenerator.generate_financial_report('2024-01-01', '2024-12-31', use_cache=False)
+        expected = fetch_all("""
+            SELECT p.attending_doctor, COUNT(*) as dispensings_count, COUNT(DISTINCT d.patient_id) as patients_count,
+                   SUM(d.quantity_packs * m.price) as total_revenue
+            FROM dispensings d
+            JOIN patients p ON d.patient_id = p.patient_id
+            JOIN medicines m ON d.medicine_id = m.medicine_id
+            WHERE d.dispensing_date BETWEEN '2024-01-01' AND '2024-12-31'
+            GROUP BY p.attending_doctor
+        """)
+        doctors = {row['attending_doctor']: row for row in report['doctors_statistics']}
+        assert 'Агрегатов А.А.' in doctors and len(doctors) == len(expected)
+        for row in expected:
+            got = doctors[row['attending_doctor']]
+            assert (got['dispensings_count'], got['patients_count']) == (row['dispensings_count'], row['patients_count'])
+            assert abs(got['total_revenue'] - row['total_revenue']) < 1e-6
+        expected_total = fetch_one("""
+            SELECT COUNT(*), SUM(d.quantity_packs * m.price) FROM dispensings d
+            JOIN medicines m ON d.medicine_id = m.medicine_id
+            WHERE d.dispensing_date BETWEEN '2024-01-01' AND '2024-12-31'
+        """)
+        assert report['summary']['total_dispensings'] == expected_total[0]
+        assert abs(report['summary']['total_revenue'] - expected_total[1]) < 1e-6
+        top = {row['medicine_id']: row for row in report['top_medicines']}
+        assert top[medicine_id]['unique_patients'] == fetch_one(
+            "SELECT COUNT(DISTINCT patient_id) FROM dispensings WHERE medicine_id = ? "
+            "AND dispensing_date BETWEEN '2024-01-01' AND '2024-12-31'", (medicine_id,))[0]
+
+        # Расхождение обнаруживается сверкой и устраняется перестройкой
+        execute_update("DELETE FROM dispensing_daily_doctors")
+        assert app.test_cli_runner().invoke(args=["rollups", "verify"]).exit_code != 0
+        result = app.test_cli_runner().invoke(args=["rollups", "rebuild"])
+        assert result.exit_code == 0, result.output
+        assert verify_rollups(db) == []
+
+        execute_update("DELETE FROM dispensing_daily_medicines")
+        assert verify_rollups(db) != []
+        counts = rebuild_rollups(db)
+        db.commit()
+        assert counts['dispensing_daily_medicines'] > 0
+        assert verify_rollups(db) == []
+
+        execute_update("DELETE FROM dispensings WHERE dispensing_date BETWEEN '2024-05-01' AND '2024-05-03'")
+        execute_update("UPDATE patients SET attending_doctor = ? WHERE patient_id = ?",
+                       (patient['attending_doctor'], patient['patient_id']))
+        assert verify_rollups(db) == []
+
+def test_patient_report_totals():
+    """Тест итогов отчёта по пациентам без перемножения назначений и выдач"""
+    print("\n=== Тестирование итогов отчёта по пациентам ===")
+    prepare_data()
+
+    with app.app_context():
+        execute_update("INSERT INTO patients (fio, birth_year, diagnosis, attending_doctor) "
+                       "VALUES ('Отчёт Итогов', 1970, 'Диагноз', 'Врач')")
+        patient_id = fetch_one("SELECT MAX(patient_id) FROM patients")[0]
+        medicine = fetch_one("SELECT medicine_id, price FROM medicines WHERE price IS NOT NULL LIMIT 1")
+        for date, quantity in (('2023-12-15', 4), ('2024-02-01', 1)):
+            execute_update("INSERT INTO prescriptions (patient_id, medicine_id, prescription_date, quantity_packs) "
+                           "VALUES (?, ?, ?, ?)", (patient_id, medicine['medicine_id'], date, quantity))
+        for date, quantity in (('2024-02-02', 1), ('2024-02-03', 2), ('2024-06-01', 3)):
+            execute_update("INSERT INTO dispensings (patient_id, medicine_id, dispensing_date, quantity_packs) "
+                           "VALUES (?, ?, ?, ?)", (patient_id, medicine['medicine_id'], date, quantity))
+
+        row = ReportsGenerator.generate_patient_report(patient_id=patient_id, use_cache=False)['patients'][0]
+        print(f"Итоги пациента: {dict(row)}")
+        assert (row['total_prescriptions'], row['total_dispensings']) == (2, 3)
+        assert (row['total_prescribed_packs'], row['total_dispensed_packs']) == (5, 6)
+        assert abs(row['total_cost'] - 6 * medicine['price']) < 1e-6
+
+        # Фильтр по датам применяется к назначениям и выдачам отдельно
+        report = ReportsGenerator.generate_patient_report('2024-01-01', '2024-03-31', use_cache=False)
+        row = next(row for row in report['patients'] if row['patient_id'] == patient_id)
+        assert (row['total_prescriptions'], row['total_dispensings']) == (1, 2)
+        assert (row['total_prescribed_packs'], row['total_dispensed_packs']) == (1, 3)
+        assert patient_id not in [row['patient_id'] for row in ReportsGenerator.generate_patient_report(
+            '2025-01-01', '2025-12-31', use_cache=False)['patients']]
+
+        # Итоги ленивого отчёта совпадают с полным
+        lazy = ReportsGenerator.generate_patient_report('2024-01-01', '2024-03-31', lazy=True)
+        assert lazy['summary']['total_dispensings'] == report['summary']['total_dispensings']
+        assert len(list(lazy['patients'])) == report['summary']['total_patients']
+
+        execute_update("DELETE FROM prescriptions WHERE patient_id = ?", (patient_id,))
+        execute_update("DELETE FROM dispensings WHERE patient_id = ?", (patient_id,))
+        execute_update("DELETE FROM patients WHERE patient_id = ?", (patient_id,))
+
+def test_dispensing_report_pages():
+    """Тест отчёта по выдачам: одна строка на выдачу, страницы и итоги по всему периоду"""
+    print("\n=== Тестирование страниц отчёта по выдачам ===")
+    prepare_data()
+
+    with app.app_context():
+        execute_update("INSERT INTO patients (fio, birth_year, diagnosis, attending_doctor) "
+                       "VALUES ('Отчёт Выдач', 1970, 'Диагноз', 'Врач')")
+        patient_id = fetch_one("SELECT MAX(patient_id) FROM patients")[0]
+        medicine_id = fetch_one("SELECT medicine_id FROM medicines ORDER BY medicine_id LIMIT 1")[0]
+        for date, dose in (('2024-07-01', 1), ('2024-07-10', 2), ('2024-08-01', 3)):
+            execute_update("INSERT INTO prescriptions (patient_id, medicine_id, prescription_date, quantity_packs, "
+                           "daily_dose) VALUES (?, ?, ?, 1, ?)", (patient_id, medicine_id, date, dose))
+        for date in ('2024-07-05', '2024-07-20', '2024-06-01'):
+            execute_update("INSERT INTO dispensings (patient_id, medicine_id, dispensing_date, quantity_packs) "
+                           "VALUES (?, ?, ?, 1)", (patient_id, medicine_id, date))
+
+        # Каждой выдаче - одно назначение: последнее на дату выдачи, иначе ближайшее после
+        report = ReportsGenerator.generate_dispensing_report('2024-06-01', '2024-07-31', medicine_id, use_cache=False)
+        doses = {row['dispensing_date']: row['daily_dose'] for row in report['dispensings']
+                 if row['patient_name'] == 'Отчёт Выдач'}
+        assert doses == {'2024-07-05': 1, '2024-07-20': 2, '2024-06-01': 1}
+        ids = [row['dispensing_id'] for row in report['dispensings']]
+        assert len(ids) == len(set(ids)) == report['summary']['total_dispensings']
+
+        # Страницы в сумме дают все строки, итоги не зависят от страницы
+        expected = fetch_one("SELECT COUNT(*), SUM(quantity_packs) FROM dispensings "
+                             "WHERE dispensing_date BETWEEN '2024-01-01' AND '2024-12-31'")
+        full = ReportsGenerator.generate_dispensing_report('2024-01-01', '2024-12-31', use_cache=False)
+        paged_ids, cursor = [], None
+        while True:
+            page = ReportsGenerator.generate_dispensing_report('2024-01-01', '2024-12-31', per_page=2, cursor=cursor)
+            assert page['summary']['total_dispensings'] == expected[0]
+            assert page['summary']['total_packs'] == expected[1]
+            paged_ids += [row['dispensing_id'] for row in page['dispensings']]
+            if not page['pagination']['has_next']:
+                break
+            cursor = page['pagination']['next_cursor']
+        print(f"Строк отчёта по страницам: {len(paged_ids)}")
+        assert paged_ids == [row['dispensing_id'] for row in full['dispensings']]
+        assert len(paged_ids) == expected[0]
+
+        try:
+            ReportsGenerator.generate_dispensing_report(per_page=2, cursor="повреждён")
+            assert False, "ожидалась ошибка"
+        except ValueError:
+            pass
+
+    # Страница отчёта с навигацией по курсору
+    import routes
+    report_app = Flask(__name__)
+    report_app.config.from_object(config)
+    report_app.config["REPORTS_PAGE_SIZE"] = 2
+    report_app.teardown_appcontext(close_db)
+    routes.init_routes(report_app)
+    client = report_app.test_client()
+    response = client.post("/reports/dispensing", data={"start_date": "2024-01-01", "end_date": "2024-12-31"})
+    assert response.status_code == 200
+    html = response.get_data(as_text=True)
+    assert "cursor=" in html
+    next_url = html[html.index('href="', html.index("cursor=") - 200) + 6:].split('"')[0].replace("&amp;", "&")
+    assert client.get(next_url).status_code == 200
+    assert client.get("/reports/dispensing?cursor=WyJuZXh0IixbMV0sMV0").status_code == 200
+
+    with app.app_context():
+        execute_update("DELETE FROM prescriptions WHERE patient_id = ?", (patient_id,))
+        execute_update("DELETE FROM dispensings WHERE patient_id = ?", (patient_id,))
+        execute_update("DELETE FROM patients WHERE patient_id = ?", (patient_id,))
+
+def test_parallel_sections():
+    """Тест параллельного выполнения разделов отчётов"""
+    print("\n=== Тестирование параллельных разделов отчётов ===")
+    prepare_data()
+
+    with app.app_context():
+        request_db = get_db()
+
+        def section(name):
+            time.sleep(0.2)
+            return name, get_db() is not request_db
+
+        started = time.time()
+        results = run_sections({name: (lambda name=name: section(name)) for name in ('a', 'b', 'c')})
+        elapsed = time.time() - started
+        print(f"Три раздела по 0.2 с выполнены за {elapsed:.2f} с")
+        assert results == {'a': ('a', True), 'b': ('b', True), 'c': ('c', True)}
+        assert elapsed < 0.5
+
+        # Соединения разделов только для чтения, ошибка раздела передаётся вызывающему
+        try:
+            run_sections({
+                'write': lambda: get_db().execute("DELETE FROM patients"),
+                'read': lambda: fetch_one("SELECT COUNT(*) FROM patients")[0],
+            })
+            assert False, "ожидалась ошибка"
+        except sqlite3.OperationalError:
+            pass
+
+        # Вложенные разделы и разделы внутри транзакции выполняются на соединении вызывающего
+        nested = run_sections({
+            'outer': lambda: run_sections({'x': lambda: get_db(), 'y': lambda: get_db()}),
+            'other': lambda: None,
+        })['outer']
+        assert nested['x'] is nested['y']
+        with transaction():
+            execute_update("INSERT INTO patients (fio, birth_year, diagnosis, attending_doctor) "
+                           "VALUES ('Раздел Транзакции', 1990, 'Диагноз', 'Врач')")
+            counts = run_sections({
+                name: lambda: fetch_one("SELECT COUNT(*) FROM patients WHERE fio = 'Раздел Транзакции'")[0]
+                for name in ('a', 'b')
+            })
+            assert counts == {'a': 1, 'b': 1}
+        execute_update("DELETE FROM patients WHERE fio = 'Раздел Транзакции'")
+
+        # Параллельные и последовательные отчёты совпадают
+        parallel = ReportsGenerator.generate_financial_report('2024-01-01', '2024-12-31', use_cache=False)
+        usage = BusinessLogic.get_medicine_usage_statistics(use_cache=False)
+        app.config["REPORT_PARALLEL_WORKERS"] = 0
+        try:
+            serial = ReportsGenerator.generate_financial_report('2024-01-01', '2024-12-31', use_cache=False)
+            assert BusinessLogic.get_medicine_usage_statistics(use_cache=False) == usage
+        finally:
+            app.config["REPORT_PARALLEL_WORKERS"] = config.REPORT_PARALLEL_WORKERS
+        for key in ('daily_revenue', 'top_medicines', 'doctors_statistics'):
+            assert [dict(row) for row in parallel[key]] == [dict(row) for row in serial[key]]
+        assert parallel['summary'] == serial['summary']
+
+def main():
+    """Основная функция тестирования"""
+    print("Запуск тестов выгрузки в CSV")
+    print("=" * 50)
+
+    test_iter_csv_blocks()
+    test_export_data_streamed()
+    test_report_csv_streams()
+    test_fetch_iter()
+    test_report_cache()
+    test_rollup_tables()
+    test_patient_report_totals()
+    test_dispensing_report_pages()
+    test_parallel_sections()
+
+    print("\n✅ Все тесты выполнены успешно!")
+
+if __name__ == "__main__":
+    main()
@@ -5,16 +5,21 @@
 
 import sys
 import os
+import base64
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from database_updated import init_db, fetch_paginated, search_with_pagination, bulk_insert
+from database_updated import init_db, close_db, fetch_paginated, search_with_pagination, bulk_insert, fetch_one, fetch_all, project_columns
 from models_updated import Patient, Medicine, Prescription, Dispensing
+from routes_updated import init_routes
+from identity_map import get_identity_map
+from business_logic import BusinessLogic
 from flask import Flask
 import config
 
 # Создание тестового приложения Flask
 app = Flask(__name__)
 app.config.from_object(config)
+app.teardown_appcontext(close_db)
 
 def test_pagination():
     """Тест функций пагинации"""
@@ -104,6 +109,217 @@ def test_search_functionality():
         trade_name_results = Medicine.search_paginated("Тестовый препарат", page=1, per_page=10)
         print(f"Найдено препаратов: {len(trade_name_results['items'])}")
 
+def test_keyset_pagination():
+    """Тест курсорной пагинации"""
+    print("\n=== Тестирование курсорной пагинации ===")
+    
+    with app.app_context():
+        init_db()
+        
+        # Полный обход пациентов по курсорам должен совпадать с постраничным обходом
+        expected = [p.patient_id for p in Patient.get_paginated(page=1, per_page=1000)['items']]
+        
+        seen = []
+        pages = []
+        cursor = ""
+        while True:
+            result = Patient.get_paginated(per_page=2, cursor=cursor)
+            pages.append(result)
+            seen.extend(p.patient_id for p in result['items'])
+            if not result['has_next']:
+                break
+            cursor = result['next_cursor']
+        
+        print(f"Страниц пройдено по курсору: {len(pages)}")
+        assert seen == expected
+        assert pages[0]['has_prev'] is False
+        
+        # Возврат на предыдущую страницу
+        if len(pages) > 1:
+            previous = Patient.get_paginated(per_page=2, cursor=pages[1]['prev_cursor'])
+            assert [p.patient_id for p in previous['items']] == [p.patient_id for p in pages[0]['items']]
+        
+        # Сортировка по убыванию для выдач
+        dispensings = Dispensing.get_paginated(per_page=2, cursor="")
+        dates = [d.dispensing_date for d in dispensings['items']]
+        assert dates == sorted(dates, reverse=True)
+        
+        # Повреждённый курсор отклоняется
+        try:
+            Patient.get_paginated(per_page=2, cursor="not-a-cursor")
+            assert False, "Ожидалась ошибка разбора курсора"
+        except ValueError:
+            pass
+        
+        # Курсор с нескалярными значениями ключа тоже отклоняется (а не падает при выполнении запроса)
+        malformed = base64.urlsafe_b64encode(b'["next",[1],1]').decode('ascii').rstrip('=')
+        for model in (Patient, Prescription, Dispensing):
+            try:
+                model.get_paginated(per_page=2, cursor=malformed)
+                assert False, "Ожидалась ошибка разбора курсора"
+            except ValueError:
+                pass
+
+def test_count_strategies():
+    """Тест стратегий подсчёта общего количества записей"""
+    print("\n=== Тестирование стратегий подсчёта ===")
+    
+    with app.app_context():
+        init_db()
+        exact_total = fetch_one("SELECT COUNT(*) FROM patients")[0]
+        
+        # Кэшированный подсчёт совпадает с точным и сбрасывается после записи
+        cached = Patient.get_paginated(page=1, per_page=2, count="cached")
+        assert cached['total'] == exact_total
+        Patient.bulk_create([("Пациент Стратегии Подсчёта", 1975, "Диагноз", "Врач")])
+        cached = Patient.get_paginated(page=1, per_page=2, count="cached")
+        assert cached['total'] == exact_total + 1
+        print(f"Кэшированный подсчёт: {cached['total']}")
+        
+        # Режим без подсчёта определяет наличие следующей страницы по LIMIT n+1
+        uncounted = Patient.get_paginated(page=1, per_page=2, count="none")
+        assert uncounted['total'] is None
+        assert len(uncounted['items']) == 2
+        assert uncounted['has_next'] is True
+        last_page = (exact_total + 1 + 1) // 2
+        uncounted = Patient.get_paginated(page=last_page, per_page=2, count="none")
+        assert uncounted['has_next'] is False
+        
+        # Оценка для всей таблицы не требует сканирования
+        estimated = Patient.get_paginated(page=1, per_page=2, count="estimate")
+        assert estimated['total_is_estimate'] is True
+        assert estimated['total'] >= 1
+        
+        # Для запроса с условием оценка заменяется точным подсчётом
+        searched = Patient.search_paginated("Стратегии", page=1, per_page=2, count="estimate")
+        assert searched['total_is_estimate'] is False
+        assert searched['total'] >= 1
+
+def test_row_models():
+    """Тест моделей на слотах и их построения из строк"""
+    print("\n=== Тестирование моделей на слотах ===")
+
+    with app.app_context():
+        init_db()
+        Patient(fio="Слотов Семён", birth_year=1970, diagnosis="Диагноз", attending_doctor="Врач").save()
+        row = fetch_one("SELECT * FROM patients WHERE fio = ?", ("Слотов Семён",))
+        patient = Patient.get_by_id(row["patient_id"])
+
+        assert not hasattr(patient, "__dict__")
+        assert patient.to_dict() == {name: row[name] for name in Patient.__slots__}
+        assert patient.created_at == row["created_at"] and patient.updated_at is not None
+
+        page = Prescription.get_paginated(page=1, per_page=5)
+        for prescription in page["items"]:
+            assert prescription.to_dict() == Prescription.get_by_id(prescription.prescription_id).to_dict()
+
+        # Выдача хранит отметки времени так же, как остальные модели
+        dispensing = Dispensing(created_at="2024-01-01 10:00:00", updated_at="2024-01-02 10:00:00")
+        assert (dispensing.created_at, dispensing.updated_at) == ("2024-01-01 10:00:00", "2024-01-02 10:00:00")
+        row = fetch_one("SELECT * FROM dispensings LIMIT 1")
+        dispensing = Dispensing.from_row(row)
+        assert dispensing.to_dict() == {name: row[name] for name in Dispensing.__slots__}
+        assert dispensing.created_at == row["created_at"] and dispensing.updated_at is not None
+        assert Dispensing(**dispensing.to_dict()).to_dict() == dispensing.to_dict()
+
+        # JSON API отдаёт даты в том виде, как они хранятся в базе
+        api = Flask(__name__)
+        api.config.from_object(config)
+        api.teardown_appcontext(close_db)
+        init_routes(api)
+        client = api.test_client()
+        for endpoint in ("patients", "medicines", "prescriptions", "dispensings"):
+            response = client.get(f"/api/{endpoint}?per_page=3")
+            assert response.status_code == 200, endpoint
+            items = response.get_json()["items"]
+            print(f"/api/{endpoint}: {len(items)} записей")
+            assert all(isinstance(item["created_at"], str) for item in items)
+            response = client.get(f"/api/{endpoint}?cursor=WyJuZXh0IixbMV0sMV0")
+            assert response.status_code == 400, endpoint
+
+def test_column_projection():
+    """Тест выборки части столбцов и покрывающих индексов"""
+    print("\n=== Тестирование проекции столбцов ===")
+
+    with app.app_context():
+        init_db()
+        full = Patient.get_paginated(page=1, per_page=5)["items"]
+        choices = Patient.get_paginated(page=1, per_page=5, columns=Patient.CHOICE_FIELDS)["items"]
+        assert [p.to_dict() for p in choices] == [
+            {name: getattr(p, name) for name in Patient.CHOICE_FIELDS} for p in full
+        ]
+        assert not hasattr(choices[0], "birth_year")
+
+        # Курсорная пагинация сохраняет столбцы ключа в проекции
+        first = Medicine.get_paginated(per_page=2, cursor="", columns=("medicine_id",))
+        second = Medicine.get_paginated(per_page=2, cursor=first["next_cursor"], columns=("medicine_id",))
+        ids = [m.medicine_id for m in first["items"] + second["items"]]
+        assert ids == [m.medicine_id for m in Medicine.get_paginated(page=1, per_page=4)["items"]]
+
+        found = Medicine.search_paginated("амок", columns=Medicine.CHOICE_FIELDS)["items"]
+        assert all(set(m.to_dict()) == set(Medicine.CHOICE_FIELDS) for m in found)
+        assert [p.patient_id for p in Patient.iter_all(columns=("patient_id",))] == [p.patient_id for p in Patient.iter_all()]
+
+        # Выпадающие списки читаются из покрывающих индексов
+        for model, table, order_by in ((Patient, "patients", "fio"), (Medicine, "medicines", "trade_name_vk")):
+            query = project_columns(f"SELECT * FROM {table} ORDER BY {order_by}", model.CHOICE_FIELDS)
+            plan = " ".join(row[3] for row in fetch_all(f"EXPLAIN QUERY PLAN {query} LIMIT 100"))
+            print(f"{table}: {plan}")
+            assert "COVERING INDEX" in plan
+
+        try:
+            project_columns("SELECT * FROM patients", ["fio; DROP TABLE patients"])
+            assert False, "ожидалась ошибка"
+        except ValueError:
+            pass
+
+    # Форма назначения показывает дозировку и фасовку препаратов из выпадающего списка
+    forms = Flask(__name__)
+    forms.config.from_object(config)
+    forms.teardown_appcontext(close_db)
+    init_routes(forms)
+    html = forms.test_client().get("/prescriptions/add").get_data(as_text=True)
+    assert 'data-dosage="' in html
+    assert 'data-dosage=""' not in html and 'data-packaging=""' not in html
+
+def test_identity_map():
+    """Тест карты идентичности и пакетной загрузки get_many"""
+    print("\n=== Тестирование карты идентичности ===")
+
+    with app.app_context():
+        init_db()
+        ids = [p.patient_id for p in Patient.get_paginated(page=1, per_page=3)["items"]]
+        identity_map = get_identity_map()
+        identity_map.forget()
+
+        patients = Patient.get_many(ids + [ids[0], None, -1])
+        assert list(patients) == ids
+        stats = identity_map.stats()
+        print(f"Карта идентичности после get_many: {stats}")
+        assert stats["size"] == len(ids) + 1  # отсутствующий ID тоже запоминается
+
+        # Повторные обращения обслуживаются из карты и возвращают те же объекты
+        assert Patient.get_by_id(ids[0]) is patients[ids[0]]
+        assert Patient.get_by_id(-1) is None
+        assert identity_map.stats()["hits"] == stats["hits"] + 2
+
+        # Изменение таблицы сбрасывает её объекты в карте
+        patient = patients[ids[0]]
+        patient.diagnosis = "Изменённый диагноз"
+        patient.save()
+        reloaded = Patient.get_by_id(ids[0])
+        assert reloaded is not patient and reloaded.diagnosis == "Изменённый диагноз"
+
+        medicine_id = Medicine.get_paginated(page=1, per_page=1)["items"][0].medicine_id
+        misses = identity_map.stats()["misses"]
+        for _ in range(3):
+            assert BusinessLogic.validate_prescription(ids[1], medicine_id, 1) == (True, "")
+        assert identity_map.stats()["misses"] == misses + 2  # пациент и препарат загружены по одному разу
+
+    # Новый контекст приложения начинается с пустой карты
+    with app.app_context():
+        assert get_identity_map().stats()["size"] == 0
+
 def main():
     """Основная функция тестирования"""
     print("Запуск тестов обновленной медицинской системы")
@@ -113,6 +329,11 @@ def main():
         test_pagination()
         test_bulk_operations()
         test_search_functionality()
+        test_keyset_pagination()
+        test_count_strategies()
+        test_row_models()
+        test_column_projection()
+        test_identity_map()
         
         print("\n" + "=" * 50)
         print("✅ Все тесты выполнены успешно!")
@@ -121,6 +342,7 @@ def main():
         print("- ✅ Поиск с пагинацией функционирует")
         print("- ✅ Массовые операции выполняются")
         print("- ✅ Фильтрация по параметрам работает")
+        print("- ✅ Курсорная пагинация работает")
         print("- ✅ База данных обновлена до новой структуры")
         
     except Exception as e:
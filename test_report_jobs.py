@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Тест фонового построения отчётов в пуле процессов
+"""
+
+import sys
+import os
+import json
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database_updated import init_db, close_db, insert_sample_data
+from reports_generator import ReportsGenerator
+from routes_updated import init_routes
+from report_jobs import get_report_jobs
+from flask import Flask
+import config
+
+# Создание тестового приложения Flask с отдельным каталогом результатов
+app = Flask(__name__)
+app.config.from_object(config)
+app.config["REPORT_JOBS_DIR"] = tempfile.mkdtemp()
+app.config["REPORT_JOBS_WORKERS"] = 1
+app.teardown_appcontext(close_db)
+init_routes(app)
+
+def wait_for_job(client, job_id, timeout=60):
+    """Ожидание завершения задания через эндпоинт состояния"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = client.get(f"/api/reports/jobs/{job_id}").get_json()
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.1)
+    raise AssertionError(f"Задание {job_id} не завершилось за {timeout} с")
+
+def test_report_jobs():
+    """Тест постановки, состояния и загрузки фоновых отчётов"""
+    print("\n=== Тестирование фоновых отчётов ===")
+
+    with app.app_context():
+        init_db()
+        insert_sample_data()
+        expected_csv = "".join(ReportsGenerator.stream_report_csv("financial", "2024-01-01", "2024-12-31"))
+        expected_summary = ReportsGenerator.generate_patient_report(use_cache=False)["summary"]
+
+    client = app.test_client()
+    try:
+        response = client.post("/api/reports/jobs", json={
+            "type": "financial", "format": "csv", "params": {"start_date": "2024-01-01", "end_date": "2024-12-31"}
+        })
+        assert response.status_code == 202
+        csv_job = response.get_json()
+        assert csv_job["status"] == "queued" and csv_job["result_url"] is None
+
+        json_job = client.post("/api/reports/jobs", json={"type": "patient", "format": "json"}).get_json()
+
+        csv_job = wait_for_job(client, csv_job["job_id"])
+        print(f"Задание CSV: {csv_job}")
+        assert csv_job["status"] == "done", csv_job["error"]
+        response = client.get(csv_job["result_url"])
+        assert response.status_code == 200
+        assert response.get_data(as_text=True) == expected_csv
+        response.close()
+
+        json_job = wait_for_job(client, json_job["job_id"])
+        assert json_job["status"] == "done", json_job["error"]
+        response = client.get(json_job["result_url"])
+        report = json.loads(response.get_data(as_text=True))
+        response.close()
+        assert report["summary"]["total_patients"] == expected_summary["total_patients"]
+        assert len(report["patients"]) == expected_summary["total_patients"]
+
+        # Ошибки запроса
+        assert client.post("/api/reports/jobs", json={"type": "unknown"}).status_code == 400
+        assert client.post("/api/reports/jobs", json={"type": []}).status_code == 400
+        assert client.post("/api/reports/jobs", json={"type": "financial", "format": {}}).status_code == 400
+        assert client.post("/api/reports/jobs", json={
+            "type": "financial", "params": {"medicine_id": 1}
+        }).status_code == 400
+        for params in ({"patient_id": "abc"}, {"patient_id": [1]}, {"patient_id": True},
+                       {"start_date": "01.01.2024"}, {"end_date": "2024-02-30"}, {"start_date": 20240101}):
+            response = client.post("/api/reports/jobs", json={"type": "patient", "params": params})
+            assert response.status_code == 400, params
+        assert client.post("/api/reports/jobs", json={
+            "type": "dispensing", "params": {"medicine_id": "x1"}
+        }).status_code == 400
+        with app.app_context():
+            assert get_report_jobs().submit("patient", params={"patient_id": "1"})["params"] == {"patient_id": 1}
+        assert client.get("/api/reports/jobs/" + "0" * 32).status_code == 404
+        assert client.get("/api/reports/jobs/../config/result").status_code == 404
+
+        # Ошибка построения записывается в состояние задания
+        with app.app_context():
+            runner = get_report_jobs()
+            job = runner.submit("medicine", "csv", job_config={"DATABASE_PATH": "/несуществующий/каталог/db.sqlite"})
+            assert client.get(f"/api/reports/jobs/{job['job_id']}/result").status_code in (404, 409)
+        job = wait_for_job(client, job["job_id"])
+        print(f"Задание с ошибкой: {job['error']}")
+        assert job["status"] == "failed" and job["error"]
+        assert client.get(f"/api/reports/jobs/{job['job_id']}/result").status_code == 409
+    finally:
+        with app.app_context():
+            get_report_jobs().shutdown()
+
+def main():
+    """Основная функция тестирования"""
+    print("Запуск тестов фоновых отчётов")
+    print("=" * 50)
+
+    test_report_jobs()
+
+    print("\n✅ Все тесты выполнены успешно!")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Тест поисковых индексов пациентов и препаратов
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database_updated import (init_db, close_db, search_index_available, build_fulltext_query,
+                              execute_update, fetch_one, normalize_search_key, refresh_search_keys)
+from models_updated import Patient, Medicine
+from autocomplete import patient_index
+from flask import Flask
+import config
+
+# Создание тестового приложения Flask
+app = Flask(__name__)
+app.config.from_object(config)
+app.teardown_appcontext(close_db)
+
+def test_fulltext_patient_search():
+    """Тест полнотекстового поиска пациентов"""
+    print("\n=== Тестирование полнотекстового поиска пациентов ===")
+    
+    with app.app_context():
+        init_db()
+        assert search_index_available('patients')
+        
+        patient = Patient(fio="Полнотекстов Иван Сергеевич", birth_year=1970,
+                          diagnosis="I10-Эссенциальная гипертензия", attending_doctor="Врач Поиска")
+        patient.save()
+        
+        # Поиск по префиксу слова без учёта регистра
+        result = Patient.search_paginated("полнотекст", page=1, per_page=10)
+        found = [p for p in result['items'] if p.fio == patient.fio]
+        print(f"Найдено по префиксу: {len(found)}")
+        assert found
+        
+        # Несколько слов из разных полей
+        result = Patient.search_paginated("Полнотекстов гипертензия", page=1, per_page=10)
+        assert any(p.fio == patient.fio for p in result['items'])
+        
+        # Индекс обновляется при изменении и удалении записи
+        saved = next(p for p in result['items'] if p.fio == patient.fio)
+        saved.fio = "Переименованный Иван Сергеевич"
+        saved.save()
+        assert not any(p.patient_id == saved.patient_id
+                       for p in Patient.search_paginated("Полнотекстов", 1, 10)['items'])
+        assert any(p.patient_id == saved.patient_id
+                   for p in Patient.search_paginated("Переименованный", 1, 10)['items'])
+        
+        saved.delete()
+        assert Patient.search_paginated("Переименованный", 1, 10)['total'] == 0
+
+def test_trigram_medicine_search():
+    """Тест поиска препаратов по подстроке через триграммный индекс"""
+    print("\n=== Тестирование триграммного поиска препаратов ===")
+    
+    with app.app_context():
+        init_db()
+        assert search_index_available('medicines')
+        
+        Medicine.bulk_create([
+            ("TRGM-001", "Триграммы", "КСИЛОМЕТАЗОЛИН", "Галазолин", "капли", "0.1%", None, "1", 50.0),
+        ])
+        
+        # Подстрока из середины слова без учёта регистра
+        result = Medicine.search_paginated("лометаз", page=1, per_page=10)
+        print(f"Найдено по подстроке: {len(result['items'])}")
+        assert any(m.standardized_mnn == "КСИЛОМЕТАЗОЛИН" for m in result['items'])
+        
+        result = Medicine.search_paginated("играмм", page=1, per_page=10)
+        assert any(m.section == "Триграммы" for m in result['items'])
+        
+        # Короткий запрос выполняется через LIKE
+        result = Medicine.search_paginated("ла", page=1, per_page=100)
+        assert any(m.trade_name_vk == "Галазолин" for m in result['items'])
+
+def test_search_keys():
+    """Тест нормализованных ключей поиска"""
+    print("\n=== Тестирование нормализованных ключей поиска ===")
+    
+    assert normalize_search_key("  ЁЛКИНА\tАлёна  ") == "елкина алена"
+    assert normalize_search_key(None) is None
+    
+    with app.app_context():
+        init_db()
+        
+        patient = Patient(fio="Ёлкина  Алёна Петровна", birth_year=1980,
+                          diagnosis="E11-Сахарный диабет", attending_doctor="Врач Ключей")
+        patient.save()
+        row = fetch_one("SELECT * FROM patients WHERE fio = ?", (patient.fio,))
+        assert row['fio_key'] == "елкина алена петровна"
+        
+        # Кириллица без учёта регистра и различия е/ё
+        result = Patient.search_paginated("ЕЛКИНА алена", page=1, per_page=10)
+        print(f"Найдено по ключам: {len(result['items'])}")
+        assert any(p.patient_id == row['patient_id'] for p in result['items'])
+        
+        # Строки, добавленные в обход моделей, получают ключи при обновлении
+        execute_update(
+            "INSERT INTO medicines (smmn_node_code, section, standardized_mnn, trade_name_vk, "
+            "standardized_dosage_form, standardized_dosage, packaging) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            ("KEYS-001", "Ключи", "ЁЖЕВИКА", "Ёжевит", "сироп", "100 мл", "1")
+        )
+        assert Medicine.search_paginated("ежевит", 1, 10)['total'] == 0
+        assert refresh_search_keys() >= 1
+        result = Medicine.search_paginated("ежевит", 1, 10)
+        assert [m.trade_name_vk for m in result['items']] == ["Ёжевит"]
+        
+        execute_update("DELETE FROM patients WHERE patient_id = ?", (row['patient_id'],))
+        execute_update("DELETE FROM medicines WHERE smmn_node_code = 'KEYS-001'")
+
+def test_autocomplete_index():
+    """Тест индекса автозаполнения"""
+    print("\n=== Тестирование индекса автозаполнения ===")
+    
+    with app.app_context():
+        init_db()
+        
+        Patient(fio="Автодополнов Пётр Ильич", birth_year=1955,
+                diagnosis="J45-Астма", attending_doctor="Врач").save()
+        
+        # Поиск по началу слов без учёта регистра и различия е/ё
+        results = patient_index.search("автодоп петр", limit=10)
+        print(f"Найдено подсказок: {len(results)}")
+        assert [r['fio'] for r in results] == ["Автодополнов Пётр Ильич"]
+        
+        # Изменение и удаление записи отражаются в индексе
+        patient = Patient.get_by_id(results[0]['patient_id'])
+        patient.diagnosis = "J44-Хроническая обструктивная болезнь"
+        patient.save()
+        assert patient_index.search("автодоп обструкт")[0]['patient_id'] == patient.patient_id
+        
+        patient.delete()
+        assert patient_index.search("автодоп") == []
+        
+        # Ограничение количества результатов
+        Patient.bulk_create([(f"Лимитов Пациент {i}", 1990, "Диагноз", "Врач") for i in range(5)])
+        assert len(patient_index.search("лимитов", limit=3)) == 3
+
+def test_fulltext_query_builder():
+    """Тест построения выражения MATCH"""
+    assert build_fulltext_query('Абаева "Т') == '"Абаева"* "Т"*'
+    assert build_fulltext_query('фио', ['fio']) == '{fio} : ("фио"*)'
+    assert build_fulltext_query('  -- ') is None
+    assert build_fulltext_query('мг "25', mode='substring') == '"мг ""25"'
+    assert build_fulltext_query('мг', mode='substring') is None
+
+def main():
+    """Основная функция тестирования"""
+    print("Запуск тестов поисковых индексов")
+    print("=" * 50)
+    
+    test_fulltext_patient_search()
+    test_trigram_medicine_search()
+    test_search_keys()
+    test_autocomplete_index()
+    test_fulltext_query_builder()
+    
+    print("\n✅ Все тесты выполнены успешно!")
+
+if __name__ == "__main__":
+    main()
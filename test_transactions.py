@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Тест явных транзакций, точек сохранения и очереди записи
+"""
+
+import sys
+import os
+import sqlite3
+import tempfile
+import threading
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database_updated import init_db, close_db, get_db, fetch_one, execute_update, transaction, in_transaction, after_commit, get_write_queue
+from models_updated import Patient
+from write_queue import WriteQueue
+from flask import Flask
+import config
+
+# Создание тестового приложения Flask
+app = Flask(__name__)
+app.config.from_object(config)
+app.teardown_appcontext(close_db)
+
+def count_patients(fio):
+    """Количество пациентов с заданным ФИО"""
+    return fetch_one("SELECT COUNT(*) FROM patients WHERE fio = ?", (fio,))[0]
+
+def test_transaction_commit_and_rollback():
+    """Тест фиксации и отката транзакции"""
+    print("\n=== Тестирование транзакций ===")
+
+    with app.app_context():
+        init_db()
+        fio = "Транзакция Тест"
+        execute_update("DELETE FROM patients WHERE fio LIKE 'Транзакция%'")
+
+        with transaction():
+            assert in_transaction()
+            Patient(fio=fio, birth_year=1990, diagnosis="Диагноз", attending_doctor="Врач").save()
+            Patient(fio=fio, birth_year=1991, diagnosis="Диагноз", attending_doctor="Врач").save()
+            assert get_db().in_transaction  # save() не фиксирует внутри транзакции
+        assert not in_transaction()
+        assert not get_db().in_transaction
+        assert count_patients(fio) == 2
+
+        try:
+            with transaction():
+                execute_update("DELETE FROM patients WHERE fio = ?", (fio,))
+                raise RuntimeError("откат")
+        except RuntimeError:
+            pass
+        assert count_patients(fio) == 2
+
+        # Откат сбрасывает карту объектов: изменения откатанной транзакции не видны
+        patient_id = fetch_one("SELECT patient_id FROM patients WHERE fio = ? AND birth_year = 1990", (fio,))[0]
+        try:
+            with transaction():
+                patient = Patient.get_by_id(patient_id)
+                patient.birth_year = 1900
+                patient.save()
+                assert Patient.get_by_id(patient_id).birth_year == 1900  # загружен в карту
+                raise RuntimeError("откат")
+        except RuntimeError:
+            pass
+        assert Patient.get_by_id(patient_id).birth_year == 1990
+
+        # То же при откате точки сохранения
+        with transaction():
+            try:
+                with transaction():
+                    patient = Patient.get_by_id(patient_id)
+                    patient.birth_year = 1901
+                    patient.save()
+                    assert Patient.get_by_id(patient_id).birth_year == 1901  # загружен в карту
+                    raise RuntimeError("откат вложенной")
+            except RuntimeError:
+                pass
+            assert Patient.get_by_id(patient_id).birth_year == 1990
+
+def test_savepoints_and_callbacks():
+    """Тест вложенных точек сохранения и отложенных действий"""
+    print("\n=== Тестирование точек сохранения ===")
+
+    with app.app_context():
+        init_db()
+        fio = "Транзакция Вложенная"
+        calls = []
+        insert = "INSERT INTO patients (fio, birth_year, diagnosis, attending_doctor) VALUES (?, ?, 'Диагноз', 'Врач')"
+
+        with transaction(immediate=True):
+            execute_update(insert, (fio, 2000))
+            after_commit(calls.append, "внешняя")
+            try:
+                with transaction():
+                    execute_update(insert, (fio, 2001))
+                    raise ValueError("откат вложенной")
+            except ValueError:
+                pass
+            with transaction():
+                execute_update(insert, (fio, 2002))
+            assert calls == []  # до фиксации отложенные действия не выполняются
+
+        years = [row[0] for row in get_db().execute(
+            "SELECT birth_year FROM patients WHERE fio = ? ORDER BY birth_year", (fio,))]
+        print(f"Зафиксированы записи: {years}")
+        assert years == [2000, 2002]
+        assert calls == ["внешняя"]
+
+        # Вне транзакции действие выполняется сразу
+        after_commit(calls.append, "сразу")
+        assert calls == ["внешняя", "сразу"]
+
+        try:
+            with transaction():
+                after_commit(calls.append, "отменённая")
+                raise ValueError
+        except ValueError:
+            pass
+        assert calls == ["внешняя", "сразу"]
+
+def test_write_queue_batches():
+    """Тест очереди записи: общая фиксация и изоляция ошибок заданий"""
+    print("\n=== Тестирование очереди записи ===")
+
+    path = os.path.join(tempfile.mkdtemp(), 'write_queue_test.db')
+    setup = sqlite3.connect(path)
+    setup.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, value INTEGER NOT NULL)")
+    setup.commit()
+
+    writer = WriteQueue(lambda: sqlite3.connect(path, check_same_thread=False), batch_size=50, batch_delay=0.01)
+    insert = lambda conn, value: conn.execute("INSERT INTO items (value) VALUES (?)", (value,)).rowcount
+
+    futures = []
+    threads = [threading.Thread(target=lambda i=i: futures.append(writer.submit(insert, i))) for i in range(40)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    failing = writer.submit(insert, None)  # NOT NULL: ошибка только этого задания
+
+    assert [future.result(timeout=10) for future in futures] == [1] * 40
+    try:
+        failing.result(timeout=10)
+        assert False, "ожидалась ошибка"
+    except sqlite3.IntegrityError:
+        pass
+
+    stats = writer.stats()
+    print(f"Статистика очереди: {stats}")
+    assert stats['submitted'] == 41 and stats['completed'] == 40 and stats['failed'] == 1
+    assert stats['batches'] < stats['submitted']
+    assert setup.execute("SELECT COUNT(*) FROM items").fetchone()[0] == 40
+
+def test_model_writes_use_queue():
+    """Тест записи моделей через очередь из нескольких потоков"""
+    with app.app_context():
+        init_db()
+        writer = get_write_queue()
+        submitted = writer.stats()['submitted']
+        fio = "Транзакция Поток"
+
+        def save_patients(count):
+            with app.app_context():
+                for i in range(count):
+                    Patient(fio=fio, birth_year=1950 + i, diagnosis="Диагноз", attending_doctor="Врач").save()
+
+        threads = [threading.Thread(target=save_patients, args=(5,)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert count_patients(fio) == 20
+        assert writer.stats()['submitted'] == submitted + 20
+
+        # Внутри явной транзакции запись идёт через соединение запроса
+        with transaction():
+            execute_update("DELETE FROM patients WHERE fio = ?", (fio,))
+        assert writer.stats()['submitted'] == submitted + 20
+        assert count_patients(fio) == 0
+
+def main():
+    """Основная функция тестирования"""
+    print("Запуск тестов транзакций")
+    print("=" * 50)
+
+    test_transaction_commit_and_rollback()
+    test_savepoints_and_callbacks()
+    test_write_queue_batches()
+    test_model_writes_use_queue()
+
+    print("\n✅ Все тесты выполнены успешно!")
+
+if __name__ == "__main__":
+    main()
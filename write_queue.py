@@ -0,0 +1,169 @@
+"""
+Модуль очереди записи в базу данных SQLite через один поток-писатель.
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+
+
+class WriteQueue:
+    """
+    Ограниченная очередь изменений, которые выполняет один поток-писатель.
+
+    В SQLite в каждый момент пишет только одно соединение, поэтому запросы,
+    пишущие через собственные соединения, конкурируют за блокировку и при
+    нагрузке получают "database is locked". Очередь превращает их в
+    последовательность заданий для одного соединения: задания, поступившие
+    почти одновременно, выполняются в одной транзакции (group commit), каждое -
+    в своей точке сохранения, так что ошибка одного не откатывает остальные.
+
+    Очередь создаётся отдельно в каждом процессе (воркере): после fork поток
+    родительского процесса не наследуется и запускается заново.
+    """
+
+    def __init__(self, factory, max_size=1000, batch_size=100, batch_delay=0.002, timeout=30.0):
+        """
+        Args:
+            factory (callable): Функция без аргументов, создающая соединение писателя
+            max_size (int): Максимальное количество ожидающих заданий
+            batch_size (int): Максимальное количество заданий в одной транзакции
+            batch_delay (float): Ожидание следующих заданий для пакета в секундах
+            timeout (float): Ожидание места в заполненной очереди в секундах
+        """
+        self._factory = factory
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        self._reset_state()
+
+    def _reset_state(self):
+        """Сброс внутреннего состояния очереди (при создании и после fork)."""
+        self._pid = os.getpid()
+        self._queue = queue.Queue(self.max_size)
+        self._thread = None
+        self._stats = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'batches': 0,
+            'max_batch': 0,
+            'rejected': 0,
+        }
+
+    def _ensure_running(self):
+        """Запуск потока-писателя при первом задании (и после fork)."""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset_state()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, func, *args):
+        """
+        Постановка задания в очередь.
+
+        Args:
+            func (callable): Функция func(conn, *args), выполняющая запись через conn;
+                фиксацию выполняет писатель
+            *args: Аргументы функции
+
+        Returns:
+            Future: Результат функции после фиксации транзакции или её исключение
+
+        Raises:
+            RuntimeError: Если очередь не освободилась за timeout секунд
+        """
+        self._ensure_running()
+        future = Future()
+        try:
+            self._queue.put((future, func, args), timeout=self.timeout)
+        except queue.Full:
+            with self._lock:
+                self._stats['rejected'] += 1
+            raise RuntimeError('Превышено время ожидания места в очереди записи в базу данных')
+        with self._lock:
+            self._stats['submitted'] += 1
+        return future
+
+    def execute(self, func, *args):
+        """Выполнение задания через очередь с ожиданием результата (см. submit)."""
+        return self.submit(func, *args).result()
+
+    def _next_batch(self):
+        """Ожидание первого задания и добор пакета из поступивших вслед за ним."""
+        batch = [self._queue.get()]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get(timeout=self.batch_delay) if self.batch_delay
+                             else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        """Цикл потока-писателя."""
+        conn = None
+        while True:
+            batch = self._next_batch()
+            try:
+                if conn is None:
+                    conn = self._factory()
+                self._execute_batch(conn, batch)
+            except Exception as e:
+                # Соединение не удалось создать или зафиксировать транзакцию
+                for future, _, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                if conn is not None:
+                    try:
+                        conn.rollback()
+                    except sqlite3.Error:
+                        conn.close()
+                        conn = None
+            failed = sum(1 for future, _, _ in batch if not future.cancelled() and future.exception() is not None)
+            with self._lock:
+                self._stats['batches'] += 1
+                self._stats['max_batch'] = max(self._stats['max_batch'], len(batch))
+                self._stats['completed'] += len(batch) - failed
+                self._stats['failed'] += failed
+
+    def _execute_batch(self, conn, batch):
+        """Выполнение пакета заданий в одной транзакции."""
+        conn.execute('BEGIN IMMEDIATE')
+        results = []
+        for future, func, args in batch:
+            if not future.set_running_or_notify_cancel():
+                continue
+            conn.execute('SAVEPOINT write_job')
+            try:
+                result = func(conn, *args)
+            except Exception as e:
+                conn.execute('ROLLBACK TO write_job')
+                conn.execute('RELEASE write_job')
+                future.set_exception(e)
+                continue
+            conn.execute('RELEASE write_job')
+            results.append((future, result))
+        conn.commit()
+        for future, result in results:
+            future.set_result(result)
+
+    def stats(self):
+        """
+        Статистика работы очереди.
+
+        Returns:
+            dict: Счётчики заданий и пакетов, текущая длина очереди
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        stats['queued'] = self._queue.qsize()
+        stats['max_size'] = self.max_size
+        return stats